@@ -1,15 +1,48 @@
-from .openai_wrapper import OpenAIWrapper
-from .anthropic_wrapper import AnthropicWrapper
-from .gemini_wrapper import GeminiWrapper
-from .types import LLMResponse, APILensError, RateLimitError, AuthError, BadRequestError
+"""
+API Lens: unified, logged access to OpenAI, Anthropic and Gemini.
+
+Wrappers are imported on first attribute access, so ``import apilens``
+does not load any provider SDK, psycopg2 or pytz.
+"""
+
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+from .types import LLMResponse, BatchResult, APILensError, RateLimitError, AuthError, BadRequestError
+
+if TYPE_CHECKING:
+    from .openai_wrapper import OpenAIWrapper
+    from .anthropic_wrapper import AnthropicWrapper
+    from .gemini_wrapper import GeminiWrapper
+
+# Public name -> submodule that defines it
+_LAZY_ATTRS = {
+    'OpenAIWrapper': '.openai_wrapper',
+    'AnthropicWrapper': '.anthropic_wrapper',
+    'GeminiWrapper': '.gemini_wrapper',
+}
 
 __all__ = [
     'OpenAIWrapper',
     'AnthropicWrapper',
     'GeminiWrapper',
     'LLMResponse',
+    'BatchResult',
     'APILensError',
     'RateLimitError',
     'AuthError',
     'BadRequestError'
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        value = getattr(import_module(_LAZY_ATTRS[name], __name__), name)
+        # Cache on the package so later lookups skip __getattr__
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -2,22 +2,29 @@ import os
 import anthropic
 from .config import ANTHROPIC_API_KEY, PRICING
 from .base_wrapper import BaseAIWrapper
+from .prompt_cache import add_cache_breakpoints, anthropic_usage
 from .types import LLMResponse, RateLimitError, AuthError, BadRequestError
 
 class AnthropicWrapper(BaseAIWrapper):
     """
     Wraps Anthropic API calls, logs usage, and calculates cost.
+
+    With ``prompt_caching`` (the default), long stable prompt prefixes get
+    ``cache_control`` breakpoints; see ``apilens.prompt_cache``.
     """
-    def __init__(self, model="claude-3-opus-20240229", db_path=None, user_id=None, tenant_id=None, **kwargs):
+    def __init__(self, model="claude-3-opus-20240229", db_path=None, user_id=None, tenant_id=None,
+                 prompt_caching=True, **kwargs):
         if model not in PRICING:
             raise ValueError(f"Unsupported model: {model}. Supported models: {list(PRICING.keys())}")
         if not ANTHROPIC_API_KEY:
             raise ValueError("ANTHROPIC_API_KEY not set in environment")
         super().__init__(provider_name="anthropic", model=model, db_path=db_path, user_id=user_id, tenant_id=tenant_id, **kwargs)
         self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        self.async_client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+        self.prompt_caching = prompt_caching
 
-    def _make_api_call(self, messages: list, **kwargs):
-        """Make the actual API call to Anthropic."""
+    def _build_params(self, messages: list, **kwargs) -> dict:
+        """Build Messages API parameters, moving any system message to ``system``."""
         # Extract system message if present
         system_message = None
         filtered_messages = []
@@ -28,6 +35,9 @@ class AnthropicWrapper(BaseAIWrapper):
             else:
                 filtered_messages.append(msg)
         
+        if self.prompt_caching:
+            system_message, filtered_messages = add_cache_breakpoints(system_message, filtered_messages, self.model)
+
         # Prepare API parameters
         api_params = {
             "model": self.model,
@@ -38,38 +48,46 @@ class AnthropicWrapper(BaseAIWrapper):
         
         if system_message:
             api_params["system"] = system_message
-            
-        return self.client.messages.create(**api_params)
+        return api_params
+
+    def _make_api_call(self, messages: list, **kwargs):
+        """Make the actual API call to Anthropic."""
+        try:
+            return self.client.messages.create(**self._build_params(messages, **kwargs))
+        except anthropic.AnthropicError as e:
+            self._handle_error(e)
 
     async def _make_async_api_call(self, messages: list, **kwargs):
         """Make an async API call to Anthropic."""
-        # Extract system message if present
-        system_message = None
-        filtered_messages = []
-        
-        for msg in messages:
-            if msg.get("role") == "system":
-                system_message = msg.get("content")
-            else:
-                filtered_messages.append(msg)
-        
-        # Prepare API parameters
-        api_params = {
-            "model": self.model,
-            "messages": filtered_messages,
-            "max_tokens": kwargs.get("max_tokens", 4096),
-            "temperature": kwargs.get("temperature", 1.0)
-        }
-        
-        if system_message:
-            api_params["system"] = system_message
-            
-        return await self.client.messages.create(**api_params)
+        try:
+            return await self.async_client.messages.create(**self._build_params(messages, **kwargs))
+        except anthropic.AnthropicError as e:
+            self._handle_error(e)
+
+    def _make_stream_call(self, messages: list, **kwargs):
+        """Open a streaming call to Anthropic; returns its server-sent events."""
+        try:
+            return self.client.messages.create(stream=True, **self._build_params(messages, **kwargs))
+        except anthropic.AnthropicError as e:
+            self._handle_error(e)
+
+    def _stream_delta(self, event):
+        if event.type == "content_block_delta" and event.delta.type == "text_delta":
+            return event.delta.text
+        return None
+
+    def _stream_usage(self, event) -> dict:
+        # Input tokens arrive with message_start, the output total with the final message_delta
+        if event.type == "message_start":
+            return anthropic_usage(event.message.usage)
+        if event.type == "message_delta":
+            return {"completion_tokens": event.usage.output_tokens}
+        return {}
 
     def _extract_usage(self, response) -> dict:
-        """Extract token usage from Anthropic's response."""
+        """Extract token usage, including prompt cache reads and writes, from Anthropic's response."""
         return {
-            "prompt_tokens": response.usage.input_tokens,
+            **anthropic_usage(response.usage),
             "completion_tokens": response.usage.output_tokens
         }
 
@@ -86,7 +104,7 @@ class AnthropicWrapper(BaseAIWrapper):
     def _handle_error(self, error: Exception) -> None:
         """Handle Anthropic-specific errors."""
         error_str = str(error).lower()
-        if "rate limit" in error_str:
+        if isinstance(error, anthropic.RateLimitError) or "rate limit" in error_str:
             raise RateLimitError("Anthropic rate limit exceeded")
         elif "authentication" in error_str or "invalid api key" in error_str:
             raise AuthError("Anthropic authentication failed")
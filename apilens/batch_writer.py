@@ -0,0 +1,263 @@
+"""
+Background batched writer: buffers log records in a bounded in-memory queue and
+hands them to a sink in batches from a single flusher thread.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .metrics import REGISTRY, Family
+
+logger = logging.getLogger(__name__)
+
+FLUSH_DURATION = REGISTRY.histogram(
+    "apilens_logger_flush_duration_seconds", "Time for the sink to write one batch of logs.", ("writer",)
+)
+
+OVERFLOW_POLICIES = ("block", "drop", "spill")
+
+_STOP = object()
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class BatchWriter:
+    """
+    Drains records from a bounded queue into ``sink`` in batches.
+
+    A batch is written when ``batch_size`` records are buffered or when
+    ``flush_interval`` seconds have passed since its first record, whichever
+    comes first. ``sink`` receives a list of records and should write them in
+    one round trip (e.g. a multi-row INSERT).
+
+    When the queue is full, ``overflow`` decides what happens to a new record:
+      - "block": wait up to ``block_timeout`` seconds for room, then drop it
+      - "drop":  discard it immediately
+      - "spill": append it to ``spill_path`` (JSON lines); spilled records are
+                 replayed once the queue has drained and on ``flush()``
+    """
+    def __init__(
+        self,
+        sink: Callable[[List[Any]], None],
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+        overflow: str = "block",
+        block_timeout: Optional[float] = None,
+        spill_path: Optional[str] = None,
+        name: str = "apilens-batch-writer",
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported overflow policy: {overflow}. Supported policies: {list(OVERFLOW_POLICIES)}")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self._sink = sink
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.spill_path = spill_path or os.path.join(
+            tempfile.gettempdir(), f"apilens-spill-{os.getpid()}-{id(self):x}.jsonl"
+        )
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+        self.batches = 0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        _live_writers.add(self)
+
+    def put(self, record: Any) -> bool:
+        """Enqueue a record without waiting on the sink. Returns False if it was dropped."""
+        if self._closed:
+            logger.warning("BatchWriter is closed; dropping record")
+            self._count("dropped")
+            return False
+        try:
+            if self.overflow == "block":
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == "spill":
+                self._spill([record])
+                return True
+            self._count("dropped")
+            return False
+        self._count("queued")
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything queued (and spilled) so far. Returns False on timeout."""
+        if self._closed or not self._thread.is_alive():
+            return False
+        request = _FlushRequest()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        return request.done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Flush pending records and stop the flusher thread."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error("BatchWriter queue still full on close; pending records may be lost")
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for queued/flushed/dropped/spilled/failed rows."""
+        with self._stats_lock:
+            return {
+                "queued": self.queued,
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "failed": self.failed,
+                "batches": self.batches,
+                "queue_depth": self._queue.qsize(),
+            }
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, flush_request, stopping = self._collect()
+            if batch:
+                self._write(batch)
+            if flush_request is not None or stopping or self._queue.empty():
+                self._replay_spill()
+            if flush_request is not None:
+                flush_request.done.set()
+
+    def _collect(self):
+        """Block until a batch is full, its interval expires, or a flush/stop arrives."""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = self.flush_interval if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Drain whatever was queued before the stop marker.
+                batch.extend(self._drain())
+                return batch, None, True
+            if isinstance(item, _FlushRequest):
+                return batch, item, False
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch, None, False
+
+    def _drain(self) -> List[Any]:
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+            elif item is not _STOP:
+                items.append(item)
+
+    def _write(self, batch: List[Any]) -> None:
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            started = time.perf_counter()
+            try:
+                self._sink(chunk)
+            except Exception as e:
+                logger.error(f"Failed to write batch of {len(chunk)} records: {e}")
+                if self.overflow == "spill":
+                    self._spill(chunk)
+                else:
+                    self._count("failed", len(chunk))
+                continue
+            finally:
+                FLUSH_DURATION.labels(self.name).observe(time.perf_counter() - started)
+            self._count("flushed", len(chunk))
+            self._count("batches")
+
+    def _spill(self, records: Sequence[Any]) -> None:
+        with self._spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, default=str))
+                    f.write("\n")
+        self._count("spilled", len(records))
+
+    def _replay_spill(self) -> None:
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return
+            replay_path = self.spill_path + ".replay"
+            os.replace(self.spill_path, replay_path)
+        with open(replay_path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        os.remove(replay_path)
+        if records:
+            logger.info(f"Replaying {len(records)} spilled records")
+            self._write(records)
+
+
+_live_writers = weakref.WeakSet()
+
+
+def _collect_metrics():
+    """Queue depth and row outcomes of every live writer, summed per writer name."""
+    depth: Dict[str, int] = {}
+    outcomes: Dict[tuple, int] = {}
+    for writer in list(_live_writers):
+        stats = writer.stats()
+        depth[writer.name] = depth.get(writer.name, 0) + stats["queue_depth"]
+        for outcome in ("queued", "flushed", "dropped", "spilled", "failed"):
+            key = (writer.name, outcome)
+            outcomes[key] = outcomes.get(key, 0) + stats[outcome]
+    return [
+        Family("apilens_logger_queue_depth", "gauge", "Log records waiting in a batch writer queue.",
+               [({"writer": name}, value) for name, value in sorted(depth.items())]),
+        Family("apilens_logger_records_total", "counter", "Log records handled by batch writers, by outcome.",
+               [({"writer": name, "outcome": outcome}, value) for (name, outcome), value in sorted(outcomes.items())]),
+    ]
+
+
+REGISTRY.register_collector(_collect_metrics)
+
+
+@atexit.register
+def _close_live_writers() -> None:
+    for writer in list(_live_writers):
+        writer.close(timeout=5.0)
@@ -0,0 +1,345 @@
+"""
+Response caches for chat completions.
+
+``ResponseCache`` is an in-process LRU. ``DiskResponseCache`` keeps entries in
+a SQLite file shared by every process on the host. Entries are stored
+JSON-encoded in both, which gives an exact byte size for the bounds and
+hands every hit its own copy of the response.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from .types import LLMResponse
+
+
+def make_cache_key(provider: str, model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+    """Stable SHA-256 over provider, model, messages and generation params."""
+    payload = json.dumps(
+        [provider, model, messages, params],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache bounded by entry count and total bytes, with a TTL
+    per entry.
+
+    With ``deterministic_only=True`` (the default) only requests sent with
+    ``temperature=0`` are cached, since anything else is expected to vary.
+    """
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: Optional[float] = 3600.0,
+        deterministic_only: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_entries <= 0 or max_bytes <= 0:
+            raise ValueError("max_entries and max_bytes must be positive")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.deterministic_only = deterministic_only
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (encoded response, expires_at or None)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def is_cacheable(self, params: Dict[str, Any]) -> bool:
+        if params.get("stream"):
+            return False
+        return not self.deterministic_only or params.get("temperature") == 0
+
+    def get(self, key: str) -> Optional[LLMResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            data, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(data)
+
+    def set(self, key: str, response: LLMResponse, ttl: Optional[float] = None) -> bool:
+        """Store ``response``; returns False if it is larger than the whole cache."""
+        data = json.dumps(response, separators=(",", ":"), default=str).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return False
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = self._clock() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (data, expires_at)
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def _remove(self, key: str) -> None:
+        data, _ = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+_DISK_CACHE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS response_cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        expires_at REAL,
+        accessed_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_response_cache_accessed ON response_cache (accessed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache (expires_at)",
+    # Running totals kept by triggers, so bounds checks do not scan the table
+    "CREATE TABLE IF NOT EXISTS response_cache_totals (id INTEGER PRIMARY KEY CHECK (id = 1), entries INTEGER NOT NULL, bytes INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO response_cache_totals VALUES (1, 0, 0)",
+    """
+    CREATE TRIGGER IF NOT EXISTS response_cache_insert AFTER INSERT ON response_cache BEGIN
+        UPDATE response_cache_totals SET entries = entries + 1, bytes = bytes + new.size WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS response_cache_update AFTER UPDATE OF size ON response_cache BEGIN
+        UPDATE response_cache_totals SET bytes = bytes + new.size - old.size WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS response_cache_delete AFTER DELETE ON response_cache BEGIN
+        UPDATE response_cache_totals SET entries = entries - 1, bytes = bytes - old.size WHERE id = 1;
+    END
+    """,
+]
+
+
+class DiskResponseCache:
+    """
+    Response cache in a SQLite file that many processes can share, so workers
+    on one host keep a single warm cache across restarts.
+
+    The database runs in WAL mode, so readers never block the single writer.
+    Writes take the lock up front with ``BEGIN IMMEDIATE`` and wait up to
+    ``busy_timeout`` seconds for other processes. Keys are content hashes from
+    ``make_cache_key``. Entries expire after their TTL, and the least recently
+    used entries are evicted once ``max_entries`` or ``max_bytes`` is exceeded.
+    Each thread (and each forked process) opens its own connection.
+
+    ``hits``/``misses``/``evictions``/``expirations`` count this process's
+    activity; ``entries``/``bytes`` in ``stats()`` describe the shared file.
+    """
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100000,
+        max_bytes: int = 512 * 1024 * 1024,
+        ttl: Optional[float] = 24 * 3600.0,
+        deterministic_only: bool = True,
+        busy_timeout: float = 30.0,
+        touch_interval: float = 60.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        if max_entries <= 0 or max_bytes <= 0:
+            raise ValueError("max_entries and max_bytes must be positive")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.deterministic_only = deterministic_only
+        self.busy_timeout = busy_timeout
+        # Hits refresh accessed_at at most this often, so hot keys do not turn every read into a write
+        self.touch_interval = touch_interval
+        self._clock = clock
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._db()
+
+    is_cacheable = ResponseCache.is_cacheable
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            from .db import DB
+            db = DB(self.path, timeout=self.busy_timeout)
+            db.query("PRAGMA journal_mode=WAL")
+            db.query("PRAGMA synchronous=NORMAL")
+            db.query("BEGIN IMMEDIATE")
+            try:
+                for statement in _DISK_CACHE_SCHEMA:
+                    db.query(statement)
+                db.query("COMMIT")
+            except Exception:
+                db.query("ROLLBACK")
+                raise
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _count(self, **increments) -> None:
+        with self._counter_lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def get(self, key: str) -> Optional[LLMResponse]:
+        db = self._db()
+        now = self._clock()
+        rows = db.query("SELECT value, expires_at, accessed_at FROM response_cache WHERE key = ?", (key,))
+        if not rows:
+            self._count(misses=1)
+            return None
+        value, expires_at, accessed_at = rows[0]
+        if expires_at is not None and expires_at <= now:
+            db.query("DELETE FROM response_cache WHERE key = ? AND expires_at <= ?", (key, now))
+            self._count(misses=1, expirations=1)
+            return None
+        if now - accessed_at >= self.touch_interval:
+            db.query("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(hits=1)
+        return json.loads(value)
+
+    def set(self, key: str, response: LLMResponse, ttl: Optional[float] = None) -> bool:
+        """Store ``response``; returns False if it is larger than the whole cache."""
+        data = json.dumps(response, separators=(",", ":"), default=str).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return False
+        now = self._clock()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        db = self._db()
+        db.query("BEGIN IMMEDIATE")
+        try:
+            db.query(
+                """
+                INSERT INTO response_cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    value = excluded.value, size = excluded.size,
+                    expires_at = excluded.expires_at, accessed_at = excluded.accessed_at
+                """,
+                (key, data, len(data), expires_at, now)
+            )
+            self._enforce_bounds(db, now)
+            db.query("COMMIT")
+        except Exception:
+            db.query("ROLLBACK")
+            raise
+        return True
+
+    def _totals(self, db):
+        return db.query("SELECT entries, bytes FROM response_cache_totals")[0]
+
+    def _enforce_bounds(self, db, now: float) -> None:
+        entries, total = self._totals(db)
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return
+        db.query("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+        remaining, total = self._totals(db)
+        self._count(expirations=entries - remaining)
+        entries = remaining
+        while entries > self.max_entries or total > self.max_bytes:
+            # Evict a chunk of least recently used entries per round trip, sized from the average entry
+            excess = entries - self.max_entries
+            if total > self.max_bytes:
+                excess = max(excess, -(-(total - self.max_bytes) * entries // total))
+            db.query(
+                "DELETE FROM response_cache WHERE key IN "
+                "(SELECT key FROM response_cache ORDER BY accessed_at LIMIT ?)",
+                (max(1, min(excess, 1000)),)
+            )
+            remaining, total = self._totals(db)
+            self._count(evictions=entries - remaining)
+            entries = remaining
+
+    def clear(self) -> None:
+        self._db().query("DELETE FROM response_cache")
+
+    def __len__(self) -> int:
+        return self._db().query("SELECT entries FROM response_cache_totals")[0][0]
+
+    def stats(self) -> Dict[str, int]:
+        entries, total = self._totals(self._db())
+        with self._counter_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": entries,
+                "bytes": total,
+            }
+
+    def close(self) -> None:
+        """Close this thread's connection."""
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+_default_caches: Dict[str, DiskResponseCache] = {}
+_default_caches_lock = threading.Lock()
+
+
+def default_cache() -> Optional[DiskResponseCache]:
+    """
+    Process-wide disk cache at ``$APILENS_CACHE_DB``, used by wrappers that
+    are not given a cache explicitly. None when the variable is unset.
+    """
+    path = os.getenv("APILENS_CACHE_DB")
+    if not path:
+        return None
+    with _default_caches_lock:
+        if path not in _default_caches:
+            _default_caches[path] = DiskResponseCache(
+                path,
+                max_bytes=int(os.getenv("APILENS_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+                ttl=float(os.getenv("APILENS_CACHE_TTL", str(24 * 3600))),
+            )
+        return _default_caches[path]
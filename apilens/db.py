@@ -2,9 +2,10 @@ import sqlite3
 from .config import DB_PATH
 
 class DB:
-    def __init__(self, db_path=DB_PATH):
+    def __init__(self, db_path=DB_PATH, timeout=5.0):
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path, isolation_level=None)
+        # timeout: seconds to wait for another connection's write lock
+        self.conn = sqlite3.connect(db_path, isolation_level=None, timeout=timeout)
 
     def query(self, sql, params=None):
         cur = self.conn.cursor()
@@ -1,10 +1,14 @@
 import os
-import psycopg2
 from psycopg2 import sql
+from .pool import get_pool
+from .migrations import ensure_schema
+from .prompt_cache import CACHE_TOKEN_FIELDS
+from .telemetry import TELEMETRY_FIELDS
 
 class _APILogger:
     """
     Logs API calls into a Postgres database.
+    Connections come from the process-wide pool, so one instance can be shared across threads.
     """
     def __init__(self, db_url: str = None):
         # Read and validate the database URL
@@ -12,35 +16,14 @@ class _APILogger:
         if not self.db_url:
             raise RuntimeError("POSTGRES_DB_URL environment variable is required")
 
-        # Establish connection
-        self.conn = psycopg2.connect(self.db_url)
-        self._ensure_table()
+        self._pool = get_pool(self.db_url)
 
     def _format_cost(self, cost: float) -> str:
         return f"${cost:.6f}" if cost is not None else None
 
     def _ensure_table(self):
-        # Create table with proper timestamp type and indexes
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS api_logs (
-                    id SERIAL PRIMARY KEY,
-                    timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
-                    provider TEXT,
-                    model TEXT,
-                    prompt_tokens INTEGER,
-                    completion_tokens INTEGER,
-                    cost REAL,
-                    formatted_cost TEXT,
-                    status TEXT,
-                    error_message TEXT,
-                    user_id TEXT,
-                    tenant_id TEXT
-                );
-                CREATE INDEX IF NOT EXISTS idx_api_logs_tenant ON api_logs (tenant_id);
-                CREATE INDEX IF NOT EXISTS idx_api_logs_time ON api_logs (timestamp);
-            """)
-            self.conn.commit()
+        # Checked once per process on the first write, not on construction
+        ensure_schema(self.db_url, pool=self._pool)
 
     def log_call(
         self,
@@ -54,57 +37,68 @@ class _APILogger:
         error_message: str = None,
         user_id: str = None,
         tenant_id: str = None,
+        **telemetry,
     ) -> int:
+        """
+        Insert a new row, or update ``call_id``. ``telemetry`` holds optional
+        TELEMETRY_FIELDS and CACHE_TOKEN_FIELDS columns.
+        """
+        self._ensure_table()
         formatted = self._format_cost(cost)
-        try:
-            with self.conn.cursor() as cur:
+        # On failure the pool rolls back and the error propagates.
+        # In production, you might retry or buffer locally
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
                 if call_id is None:
+                    self._pool.prepare(
+                        conn,
+                        "apilens_logger_insert",
+                        """
+                        INSERT INTO api_logs
+                          (provider, model, prompt_tokens, completion_tokens, cost, formatted_cost, status, error_message, user_id, tenant_id,
+                           latency_ms, provider_latency_ms, ttft_ms, retry_count, backoff_ms, request_bytes, response_bytes, request_id,
+                           cache_read_tokens, cache_write_tokens)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17, $18, $19, $20)
+                        RETURNING id
+                        """
+                    )
                     cur.execute(
-                        sql.SQL(
-                            """
-                            INSERT INTO api_logs 
-                              (provider, model, prompt_tokens, completion_tokens, cost, formatted_cost, status, error_message, user_id, tenant_id)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            RETURNING id
-                            """
-                        ),
-                        (provider, model, prompt_tokens, completion_tokens, cost, formatted, status, error_message, user_id, tenant_id)
+                        sql.SQL("EXECUTE apilens_logger_insert (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"),
+                        (provider, model, prompt_tokens, completion_tokens, cost, formatted, status, error_message, user_id, tenant_id,
+                         *(telemetry.get(field) for field in TELEMETRY_FIELDS + CACHE_TOKEN_FIELDS))
                     )
                     new_id = cur.fetchone()[0]
-                    self.conn.commit()
+                    conn.commit()
                     return new_id
                 else:
+                    self._pool.prepare(
+                        conn,
+                        "apilens_logger_update",
+                        """
+                        UPDATE api_logs
+                        SET prompt_tokens      = $1,
+                            completion_tokens  = $2,
+                            cost               = $3,
+                            formatted_cost     = $4,
+                            status             = $5,
+                            error_message      = $6,
+                            user_id            = $7,
+                            tenant_id          = $8
+                        WHERE id = $9
+                        RETURNING id
+                        """
+                    )
                     cur.execute(
-                        sql.SQL(
-                            """
-                            UPDATE api_logs
-                            SET prompt_tokens      = %s,
-                                completion_tokens  = %s,
-                                cost               = %s,
-                                formatted_cost     = %s,
-                                status             = %s,
-                                error_message      = %s,
-                                user_id            = %s,
-                                tenant_id          = %s
-                            WHERE id = %s
-                            RETURNING id
-                            """
-                        ),
+                        sql.SQL("EXECUTE apilens_logger_update (%s, %s, %s, %s, %s, %s, %s, %s, %s)"),
                         (prompt_tokens, completion_tokens, cost, formatted, status, error_message, user_id, tenant_id, call_id)
                     )
                     updated_id = cur.fetchone()[0]
-                    self.conn.commit()
+                    conn.commit()
                     return updated_id
-        except Exception:
-            # In production, you might retry or buffer locally
-            self.conn.rollback()
-            raise
 
     def close(self):
-        """Explicitly close the DB connection"""
-        if hasattr(self, 'conn') and self.conn:
-            self.conn.close()
-            self.conn = None
+        """Connections belong to the shared pool; use pool.close_all_pools() to close them"""
+        self._pool = None
 
     def __enter__(self):
         return self
@@ -2,6 +2,7 @@ import os
 import openai
 from .config import OPENAI_API_KEY, PRICING
 from .base_wrapper import BaseAIWrapper
+from .prompt_cache import openai_cache_usage
 from .types import LLMResponse, RateLimitError, AuthError, BadRequestError
 
 class OpenAIWrapper(BaseAIWrapper):
@@ -15,24 +16,42 @@ class OpenAIWrapper(BaseAIWrapper):
             raise ValueError("OPENAI_API_KEY not set in environment")
         super().__init__(provider_name="openai", model=model, db_path=db_path, user_id=user_id, tenant_id=tenant_id, **kwargs)
         self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
-
-    def _calculate_cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
-        pricing = PRICING.get(model, {"input": 0.03, "output": 0.06})
-        return (prompt_tokens / 1000 * pricing["input"]) + (completion_tokens / 1000 * pricing["output"])
+        self.async_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
 
     def _make_api_call(self, messages: list, **kwargs):
         """Make the actual API call to OpenAI."""
-        return self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+        try:
+            return self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+        except openai.OpenAIError as e:
+            self._handle_error(e)
 
     async def _make_async_api_call(self, messages: list, **kwargs):
         """Make an async API call to OpenAI."""
-        return await self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+        try:
+            return await self.async_client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+        except openai.OpenAIError as e:
+            self._handle_error(e)
+
+    def _make_stream_call(self, messages: list, **kwargs):
+        """Open a streaming call; usage arrives in the last chunk."""
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        return self._make_api_call(messages, stream=True, **kwargs)
+
+    def _stream_delta(self, chunk):
+        return chunk.choices[0].delta.content if chunk.choices else None
+
+    def _stream_usage(self, chunk) -> dict:
+        if getattr(chunk, "usage", None) is None:
+            return {}
+        return {"prompt_tokens": chunk.usage.prompt_tokens, "completion_tokens": chunk.usage.completion_tokens,
+                **openai_cache_usage(chunk.usage)}
 
     def _extract_usage(self, response) -> dict:
-        """Extract token usage from OpenAI's response."""
+        """Extract token usage, including automatically cached prompt tokens, from OpenAI's response."""
         return {
             "prompt_tokens": response.usage.prompt_tokens,
-            "completion_tokens": response.usage.completion_tokens
+            "completion_tokens": response.usage.completion_tokens,
+            **openai_cache_usage(response.usage)
         }
 
     def _format_response(self, response) -> LLMResponse:
@@ -48,7 +67,7 @@ class OpenAIWrapper(BaseAIWrapper):
     def _handle_error(self, error: Exception) -> None:
         """Handle OpenAI-specific errors."""
         error_str = str(error).lower()
-        if "rate limit" in error_str:
+        if isinstance(error, openai.RateLimitError) or "rate limit" in error_str:
             raise RateLimitError("OpenAI rate limit exceeded")
         elif "authentication" in error_str or "invalid api key" in error_str:
             raise AuthError("OpenAI authentication failed")
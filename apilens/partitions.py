@@ -0,0 +1,173 @@
+"""
+Range partition management for api_logs.
+
+api_logs is partitioned by day or month on ``timestamp``. Partitions are
+created ahead of time, rows outside every partition land in
+``api_logs_default``, and retention drops whole partitions instead of
+running DELETE. When a partition is created for a period that already has
+rows in the default partition, those rows are moved into it.
+"""
+
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = ("day", "month")
+
+PARTITION_INTERVAL = os.getenv("APILENS_PARTITION_INTERVAL", "month")
+PARTITIONS_AHEAD = int(os.getenv("APILENS_PARTITIONS_AHEAD", "3"))
+# Days of logs to keep; unset keeps everything
+LOG_RETENTION_DAYS = os.getenv("APILENS_LOG_RETENTION_DAYS")
+
+DEFAULT_PARTITION = "api_logs_default"
+
+_BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def period_start(timestamp: datetime, interval: str) -> datetime:
+    """Start of the UTC day or month that ``timestamp`` falls in."""
+    if interval not in INTERVALS:
+        raise ValueError(f"Unsupported partition interval: {interval}. Supported intervals: {list(INTERVALS)}")
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    start = timestamp.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "month":
+        start = start.replace(day=1)
+    return start
+
+
+def next_period(start: datetime, interval: str) -> datetime:
+    if interval == "day":
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(start: datetime, interval: str) -> str:
+    return "api_logs_p" + start.strftime("%Y%m%d" if interval == "day" else "%Y%m")
+
+
+def is_partitioned(cur) -> bool:
+    cur.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('api_logs')")
+    return cur.fetchone() is not None
+
+
+def list_partitions(cur) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """(name, start, end) for every api_logs partition; the default partition has no bounds."""
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'api_logs'::regclass
+        ORDER BY c.relname
+    """)
+    partitions = []
+    for name, bound in cur.fetchall():
+        match = _BOUND_PATTERN.search(bound or "")
+        if match:
+            start, end = (datetime.fromisoformat(value).astimezone(timezone.utc) for value in match.groups())
+            partitions.append((name, start, end))
+        else:
+            partitions.append((name, None, None))
+    return partitions
+
+
+def ensure_partitions(
+    cur,
+    interval: str = None,
+    ahead: int = None,
+    now: Optional[datetime] = None,
+) -> List[str]:
+    """
+    Create the default partition and partitions from the current period
+    through ``ahead`` periods into the future. Periods already covered by an
+    existing partition are skipped, so changing the interval later is safe.
+    Does nothing if api_logs is not partitioned. Returns the created names.
+    """
+    interval = interval or PARTITION_INTERVAL
+    ahead = PARTITIONS_AHEAD if ahead is None else ahead
+    if not is_partitioned(cur):
+        return []
+
+    existing = list_partitions(cur)
+    created = []
+    # A default partition that was just created is empty, so its rows only need checking if it already existed
+    had_default = any(start is None for _, start, _ in existing)
+    if not had_default:
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF api_logs DEFAULT")
+        created.append(DEFAULT_PARTITION)
+
+    start = period_start(now or datetime.now(timezone.utc), interval)
+    for _ in range(ahead + 1):
+        end = next_period(start, interval)
+        overlaps = any(s is not None and s < end and start < e for _, s, e in existing)
+        if not overlaps:
+            name = partition_name(start, interval)
+            _create_partition(cur, name, start, end, had_default)
+            created.append(name)
+            existing.append((name, start, end))
+        start = end
+    if created:
+        logger.info(f"Created api_logs partitions: {created}")
+    return created
+
+
+def _create_partition(cur, name: str, start: datetime, end: datetime, check_default: bool = True) -> None:
+    """
+    Create the partition for [start, end). Postgres refuses to add one while
+    the default partition holds rows in its range, so in that case the
+    partition is built as a plain table, the rows are moved into it and it is
+    attached, all in the caller's transaction.
+    """
+    bounds = (start.isoformat(), end.isoformat())
+    if check_default:
+        cur.execute(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s LIMIT 1", bounds)
+    if not check_default or cur.fetchone() is None:
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF api_logs FOR VALUES FROM (%s) TO (%s)", bounds)
+        return
+    cur.execute(f"CREATE TABLE {name} (LIKE api_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, bounds)
+    moved = cur.rowcount
+    cur.execute(f"ALTER TABLE api_logs ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+    logger.info(f"Moved {moved} rows from {DEFAULT_PARTITION} into the new partition {name}")
+
+
+def drop_partitions_before(cur, cutoff: datetime) -> List[str]:
+    """
+    Drop every partition whose whole range is older than ``cutoff``.
+    Rows in the default partition are never dropped.
+    """
+    if not is_partitioned(cur):
+        return []
+    if cutoff.tzinfo is None:
+        cutoff = cutoff.replace(tzinfo=timezone.utc)
+    dropped = []
+    for name, _, end in list_partitions(cur):
+        if end is not None and end <= cutoff:
+            cur.execute(f"DROP TABLE IF EXISTS {name}")
+            dropped.append(name)
+    if dropped:
+        logger.info(f"Dropped api_logs partitions older than {cutoff.isoformat()}: {dropped}")
+    return dropped
+
+
+def maintain_partitions(cur, retention_days: Optional[int] = None, now: Optional[datetime] = None) -> dict:
+    """Create upcoming partitions and apply retention. Meant to run periodically."""
+    now = now or datetime.now(timezone.utc)
+    if retention_days is None and LOG_RETENTION_DAYS:
+        retention_days = int(LOG_RETENTION_DAYS)
+    created = ensure_partitions(cur, now=now)
+    dropped = []
+    if retention_days is not None:
+        dropped = drop_partitions_before(cur, now - timedelta(days=retention_days))
+    return {"created": created, "dropped": dropped}
@@ -1,9 +1,41 @@
+import logging
 import requests
 import os
+from .batch_writer import BatchWriter
+
+logger = logging.getLogger(__name__)
 
 class APILoggerREST:
-    def __init__(self, api_url=None):
+    """
+    Sends API call logs to the log server.
+
+    With ``non_blocking=True`` logs are queued and shipped in batches to the
+    server's ``/logs/batch`` endpoint by a background thread instead of one
+    POST per call.
+    """
+    def __init__(
+        self,
+        api_url=None,
+        non_blocking=False,
+        batch_url=None,
+        batch_size=500,
+        flush_interval=1.0,
+        max_queue_size=10000,
+        overflow="block",
+        spill_path=None,
+    ):
         self.api_url = api_url or os.getenv("LOG_API_URL", "http://localhost:8000/log")
+        self.batch_url = batch_url or self.api_url.rstrip("/").rsplit("/", 1)[0] + "/logs/batch"
+        self._writer = None
+        if non_blocking:
+            self._writer = BatchWriter(
+                self._post_batch,
+                batch_size=batch_size,
+                flush_interval=flush_interval,
+                max_queue_size=max_queue_size,
+                overflow=overflow,
+                spill_path=spill_path,
+            )
 
     def log_call(self, **log_data):
         # Ensure user_id and tenant_id are strings, not None
@@ -11,9 +43,57 @@ class APILoggerREST:
             log_data["user_id"] = ""
         if log_data.get("tenant_id") is None:
             log_data["tenant_id"] = ""
+        if self._writer is not None:
+            self._writer.put(log_data)
+            return
         print(f"[REST Logger] Sending log to {self.api_url} with data: {log_data}")
         try:
             response = requests.post(self.api_url, json=log_data, timeout=3)
             print(f"[REST Logger] Response status: {response.status_code}, body: {response.text}")
         except Exception as e:
-            print(f"[REST Logger] Failed to log: {e}") 
\ No newline at end of file
+            print(f"[REST Logger] Failed to log: {e}")
+
+    def log_calls(self, records):
+        """Send many logs in one request to the batch endpoint (or queue them in non-blocking mode)."""
+        for log_data in records:
+            if log_data.get("user_id") is None:
+                log_data["user_id"] = ""
+            if log_data.get("tenant_id") is None:
+                log_data["tenant_id"] = ""
+        if self._writer is not None:
+            for log_data in records:
+                self._writer.put(log_data)
+            return
+        try:
+            self._post_batch(records)
+        except Exception as e:
+            logger.error(f"Failed to send a batch of {len(records)} logs: {e}")
+
+    def _post_batch(self, records):
+        response = requests.post(self.batch_url, json=records, timeout=10)
+        response.raise_for_status()
+        result = response.json()
+        if result.get("rejected"):
+            logger.error(f"Server rejected {result['rejected']} of {len(records)} logs: {result.get('errors')}")
+
+    @property
+    def non_blocking(self):
+        """True when log_call only enqueues, so it is safe to call from an event loop."""
+        return self._writer is not None
+
+    def flush(self, timeout=None):
+        """Block until all queued logs are sent (non-blocking mode only)."""
+        if self._writer is None:
+            return True
+        return self._writer.flush(timeout)
+
+    def close(self, timeout=10.0):
+        """Send queued logs and stop the background sender."""
+        if self._writer is not None:
+            self._writer.close(timeout)
+
+    def stats(self):
+        """Queued/flushed/dropped counters for the background sender."""
+        if self._writer is None:
+            return {}
+        return self._writer.stats()
@@ -0,0 +1,156 @@
+"""
+Incrementally maintained usage/cost rollups of api_logs.
+
+Every write path adds its rows to per-minute, per-hour and per-day buckets in
+the same transaction as the raw insert, so aggregate queries read a few
+rollup rows instead of scanning api_logs.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+GRANULARITIES = ("minute", "hour", "day")
+
+# Rollup key columns, in primary key order after the bucket
+DIMENSIONS = ("tenant_id", "user_id", "provider", "model", "status")
+
+ROLLUP_TABLES = {granularity: f"api_logs_rollup_{granularity}" for granularity in GRANULARITIES}
+
+# (timestamp, tenant_id, user_id, provider, model, status, prompt_tokens, completion_tokens, cost)
+RollupRecord = Tuple[datetime, Optional[str], Optional[str], Optional[str], Optional[str], Optional[str],
+                     Optional[int], Optional[int], Optional[float]]
+
+
+def rollup_ddl() -> List[str]:
+    statements = []
+    for table in ROLLUP_TABLES.values():
+        statements.append(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TIMESTAMPTZ NOT NULL,
+                tenant_id TEXT NOT NULL DEFAULT '',
+                user_id TEXT NOT NULL DEFAULT '',
+                provider TEXT NOT NULL DEFAULT '',
+                model TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL DEFAULT '',
+                calls BIGINT NOT NULL DEFAULT 0,
+                prompt_tokens BIGINT NOT NULL DEFAULT 0,
+                completion_tokens BIGINT NOT NULL DEFAULT 0,
+                cost DOUBLE PRECISION NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, tenant_id, user_id, provider, model, status)
+            )
+        """)
+        statements.append(f"CREATE INDEX IF NOT EXISTS idx_{table}_tenant ON {table} (tenant_id, bucket)")
+    return statements
+
+
+def ensure_rollup_tables(cur) -> None:
+    """Create the rollup tables if they are missing."""
+    for statement in rollup_ddl():
+        cur.execute(statement)
+
+
+def truncate(timestamp: datetime, granularity: str) -> datetime:
+    """Start of the UTC bucket that ``timestamp`` falls in."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    timestamp = timestamp.astimezone(timezone.utc)
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unsupported granularity: {granularity}. Supported granularities: {list(GRANULARITIES)}")
+
+
+def aggregate(records: Iterable[RollupRecord]) -> Dict[str, Dict[tuple, List[float]]]:
+    """
+    Sum records into {granularity: {(bucket, *dimensions): [calls, prompt_tokens, completion_tokens, cost]}}.
+    """
+    totals = {granularity: defaultdict(lambda: [0, 0, 0, 0.0]) for granularity in GRANULARITIES}
+    tables = [(granularity, totals[granularity]) for granularity in GRANULARITIES]
+    # Batches usually share one timestamp, so each bucket start is computed once
+    bucket_starts = {}
+    for timestamp, *dimensions, prompt_tokens, completion_tokens, cost in records:
+        starts = bucket_starts.get(timestamp)
+        if starts is None:
+            parsed = datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp
+            starts = bucket_starts[timestamp] = [truncate(parsed, granularity) for granularity in GRANULARITIES]
+        key = tuple(value or "" for value in dimensions)
+        for start, (granularity, table) in zip(starts, tables):
+            total = table[(start,) + key]
+            total[0] += 1
+            total[1] += prompt_tokens or 0
+            total[2] += completion_tokens or 0
+            total[3] += float(cost or 0)
+    return totals
+
+
+def apply_rollups(cur, records: Iterable[RollupRecord]) -> None:
+    """
+    Add ``records`` to every rollup table with one upsert per granularity.
+    Must run in the same transaction as the raw insert.
+    """
+    for granularity, totals in aggregate(records).items():
+        if not totals:
+            continue
+        # Upsert in key order so concurrent batches lock rollup rows in the same order
+        keys = sorted(totals)
+        columns = list(zip(*(key + tuple(totals[key]) for key in keys)))
+        table = ROLLUP_TABLES[granularity]
+        cur.execute(
+            f"""
+            INSERT INTO {table} AS r
+                (bucket, {", ".join(DIMENSIONS)}, calls, prompt_tokens, completion_tokens, cost)
+            SELECT * FROM unnest(
+                %s::timestamptz[], %s::text[], %s::text[], %s::text[], %s::text[], %s::text[],
+                %s::bigint[], %s::bigint[], %s::bigint[], %s::float8[]
+            )
+            ON CONFLICT (bucket, {", ".join(DIMENSIONS)}) DO UPDATE SET
+                calls = r.calls + EXCLUDED.calls,
+                prompt_tokens = r.prompt_tokens + EXCLUDED.prompt_tokens,
+                completion_tokens = r.completion_tokens + EXCLUDED.completion_tokens,
+                cost = r.cost + EXCLUDED.cost
+            """,
+            [list(column) for column in columns]
+        )
+
+
+def build_stats_query(
+    granularity: str,
+    group_by: Sequence[str],
+    filters: Dict[str, Optional[str]],
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    limit: int = 1000,
+) -> Tuple[str, list]:
+    """
+    SQL and params for grouped aggregates from the ``granularity`` rollup.
+    Time bounds apply to bucket starts.
+    """
+    if granularity not in ROLLUP_TABLES:
+        raise ValueError(f"Unsupported granularity: {granularity}. Supported granularities: {list(GRANULARITIES)}")
+    unknown = [column for column in list(group_by) + list(filters) if column not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unsupported dimensions: {unknown}. Supported dimensions: {list(DIMENSIONS)}")
+
+    columns = ["bucket"] + list(group_by)
+    query = (
+        f"SELECT {', '.join(columns)}, SUM(calls), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost) "
+        f"FROM {ROLLUP_TABLES[granularity]} WHERE 1=1"
+    )
+    params = []
+    for column, value in filters.items():
+        if value is not None:
+            query += f" AND {column} = %s"
+            params.append(value)
+    if start_time:
+        query += " AND bucket >= %s"
+        params.append(start_time)
+    if end_time:
+        query += " AND bucket <= %s"
+        params.append(end_time)
+    query += f" GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)} LIMIT %s"
+    params.append(limit)
+    return query, params
@@ -0,0 +1,100 @@
+"""
+Single-flight coalescing: concurrent calls with the same key share one execution.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers that arrive while a call
+    for their key is in flight wait for it and get its result, or its
+    exception, instead of starting their own.
+
+    ``do`` is for threads and ``do_async`` for coroutines. The two are keyed
+    separately, and async calls are grouped per event loop.
+    ``leaders`` counts calls that actually ran. ``coalesced`` counts callers
+    that waited for another caller's call instead.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return ``(result, shared)``; ``shared`` is True for callers that waited on another call."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Async counterpart of ``do``; ``fn`` returns the awaitable to run."""
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        future = self._async_calls.get(flight_key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: one waiter being cancelled must not cancel the shared call
+            return await asyncio.shield(future), True
+
+        future = self._async_calls[flight_key] = loop.create_future()
+        self.leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved so a flight without waiters does not warn
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._async_calls[flight_key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls) + len(self._async_calls),
+        }
+
+
+# Process-wide group used by wrappers created with coalesce=True
+default_group = SingleFlight()
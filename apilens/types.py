@@ -6,6 +6,11 @@ class LLMResponse(TypedDict):
     usage: Optional[Dict[str, int]]
     cost: float
 
+class BatchResult(TypedDict):
+    """One item of a batch completion: the response, or the error that item raised."""
+    response: Optional[LLMResponse]
+    error: Optional[Exception]
+
 class APILensError(Exception):
     """Base exception for all API Lens errors."""
     pass
@@ -22,6 +27,14 @@ class BadRequestError(APILensError):
     """Invalid request."""
     pass
 
+class PoolTimeoutError(APILensError):
+    """Timed out waiting for a pooled database connection."""
+    pass
+
+class SchemaVersionError(APILensError):
+    """Database schema is older than this release expects."""
+    pass
+
 class ProviderError(APILensError):
     """Provider-specific error."""
     def __init__(self, provider: str, message: str):
@@ -1,16 +1,106 @@
-from fastapi import FastAPI, Request, HTTPException, Query
-import psycopg2
+from fastapi import FastAPI, Request, HTTPException, Query, Response
+import asyncio
+import contextlib
+import base64
+import functools
+import io
+import json
+import logging
+import operator
 import os
-from pydantic import BaseModel
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, ValidationError
 from psycopg2 import DatabaseError
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
 import pytz
+from apilens.metrics import CONTENT_TYPE, REGISTRY, observe_call, observe_calls
+from apilens.partitions import maintain_partitions
+from apilens.pool import get_pool
+from apilens.prompt_cache import CACHE_TOKEN_FIELDS
+from apilens.recompute import DEFAULT_CHUNK, create_job, get_job, run_job
+from apilens.migrations import ensure_schema
+from apilens.rollups import apply_rollups, build_stats_query
+from apilens.telemetry import TELEMETRY_FIELDS
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
 DB_URL = os.getenv("POSTGRES_DB_URL")
 
+LOG_COLUMNS = ("timestamp", "provider", "model", "prompt_tokens", "completion_tokens", "cost", "formatted_cost",
+               "status", "error_message", "user_id", "tenant_id") + TELEMETRY_FIELDS + CACHE_TOKEN_FIELDS
+
+INSERT_LOG_STATEMENT = f"""
+    INSERT INTO api_logs ({", ".join(LOG_COLUMNS)})
+    VALUES ({", ".join(f"${i}" for i in range(1, len(LOG_COLUMNS) + 1))})
+"""
+
+# Columns GET /logs can sort by besides the default keyset order (timestamp, id)
+SORTABLE_LOG_COLUMNS = ("timestamp", "latency_ms", "provider_latency_ms", "ttft_ms", "retry_count", "backoff_ms",
+                        "request_bytes", "response_bytes", "cost", "prompt_tokens", "completion_tokens",
+                        "cache_read_tokens", "cache_write_tokens")
+
+COPY_LOGS_STATEMENT = f"COPY api_logs ({', '.join(LOG_COLUMNS)}) FROM STDIN"
+
+# Largest batch accepted by POST /logs/batch, and how many per-entry errors it reports back
+MAX_BATCH_SIZE = int(os.getenv("LOG_SERVER_MAX_BATCH_SIZE", "50000"))
+MAX_REPORTED_ERRORS = 100
+
+# Database work runs on bounded executors so it never blocks the event loop.
+# Reads and writes get separate executors so long /logs queries cannot starve ingestion.
+DB_WRITE_WORKERS = int(os.getenv("LOG_SERVER_DB_WRITE_WORKERS", "8"))
+DB_READ_WORKERS = int(os.getenv("LOG_SERVER_DB_READ_WORKERS", "4"))
+
+# How often upcoming api_logs partitions are created and expired ones dropped
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("LOG_SERVER_PARTITION_MAINTENANCE_INTERVAL", "3600"))
+
+INGESTED = REGISTRY.counter("apilens_server_logs_total", "Log entries received by the log server, by outcome.",
+                            ("endpoint", "outcome"))
+WRITE_DURATION = REGISTRY.histogram("apilens_server_write_duration_seconds",
+                                    "Time to store one request's log entries.", ("endpoint",))
+
+write_executor = ThreadPoolExecutor(max_workers=DB_WRITE_WORKERS, thread_name_prefix="log-server-db-write")
+read_executor = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="log-server-db-read")
+# Cost recompute jobs run one at a time, off the request executors, on one extra connection
+recompute_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-server-recompute")
+
+def db_pool():
+    return get_pool(DB_URL, max_size=DB_WRITE_WORKERS + DB_READ_WORKERS + 1)
+
+async def run_db(executor, fn, *args):
+    """Run a blocking database function on ``executor`` and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args))
+
+def _maintain_partitions():
+    with db_pool().connection() as conn:
+        cur = conn.cursor()
+        result = maintain_partitions(cur)
+        conn.commit()
+        cur.close()
+    return result
+
+async def _partition_maintenance_loop():
+    while True:
+        try:
+            await run_db(write_executor, _maintain_partitions)
+        except Exception as e:
+            logger.error(f"api_logs partition maintenance failed: {e}")
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    try:
+        await run_db(write_executor, functools.partial(ensure_schema, DB_URL, pool=db_pool()))
+    except Exception as e:
+        logger.error(f"Could not check the database schema: {e}")
+    maintenance = asyncio.create_task(_partition_maintenance_loop())
+    yield
+    maintenance.cancel()
+
+app = FastAPI(lifespan=lifespan)
+
 class LogEntry(BaseModel):
     provider: str
     model: str
@@ -18,25 +108,41 @@ class LogEntry(BaseModel):
     completion_tokens: int
     cost: float
     status: str
+    error_message: Optional[str] = None
     user_id: str = None
     tenant_id: str = None
+    latency_ms: Optional[float] = None
+    provider_latency_ms: Optional[float] = None
+    ttft_ms: Optional[float] = None
+    retry_count: Optional[int] = None
+    backoff_ms: Optional[float] = None
+    request_bytes: Optional[int] = None
+    response_bytes: Optional[int] = None
+    request_id: Optional[str] = None
+    cache_read_tokens: Optional[int] = None
+    cache_write_tokens: Optional[int] = None
 
-@app.post("/log")
-async def log_api_call(entry: LogEntry):
+def _rollup_record(entry: LogEntry, timestamp: datetime):
+    return (timestamp, entry.tenant_id, entry.user_id, entry.provider, entry.model, entry.status,
+            entry.prompt_tokens, entry.completion_tokens, entry.cost)
+
+def _insert_log(entry: LogEntry):
     cost = entry.cost
     if cost is not None:
         formatted_cost = f"{float(cost):.6f}"
     else:
         formatted_cost = None
-    try:
-        conn = psycopg2.connect(DB_URL)
+    # Stamp the row here so the raw log and its rollup buckets agree
+    timestamp = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    pool = db_pool()
+    with pool.connection() as conn:
+        pool.prepare(conn, "apilens_server_insert", INSERT_LOG_STATEMENT)
         cur = conn.cursor()
         cur.execute(
-            """
-            INSERT INTO api_logs (provider, model, prompt_tokens, completion_tokens, cost, formatted_cost, status, error_message, user_id, tenant_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
+            f"EXECUTE apilens_server_insert ({', '.join(['%s'] * len(LOG_COLUMNS))})",
             (
+                timestamp,
                 entry.provider,
                 entry.model,
                 entry.prompt_tokens,
@@ -44,34 +150,204 @@ async def log_api_call(entry: LogEntry):
                 float(cost) if cost is not None else None,
                 formatted_cost,
                 entry.status,
-                None,
+                entry.error_message,
                 entry.user_id,
-                entry.tenant_id
+                entry.tenant_id,
+                *(getattr(entry, field) for field in TELEMETRY_FIELDS + CACHE_TOKEN_FIELDS)
             )
         )
+        apply_rollups(cur, [_rollup_record(entry, timestamp)])
         conn.commit()
         cur.close()
-        conn.close()
+    WRITE_DURATION.labels("/log").observe(time.perf_counter() - started)
+    INGESTED.labels("/log", "accepted").inc()
+    observe_call(vars(entry))
+
+@app.post("/log")
+async def log_api_call(entry: LogEntry):
+    try:
+        await run_db(write_executor, _insert_log, entry)
         return {"status": "logged"}
     except DatabaseError as e:
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error: " + str(e))
 
+def _parse_batch(body: bytes, content_type: str):
+    """
+    Split a batch request body into raw entries. Accepts a JSON array or
+    newline-delimited JSON; returns (entries, errors) where undecodable NDJSON
+    lines are reported as errors instead of failing the whole batch.
+    """
+    if "ndjson" in content_type or "jsonl" in content_type:
+        entries, errors = [], []
+        for index, line in enumerate(body.splitlines()):
+            if not line.strip():
+                continue
+            try:
+                entries.append((index, json.loads(line)))
+            except ValueError as e:
+                errors.append({"index": index, "error": f"Invalid JSON: {e}"})
+        return entries, errors
+    try:
+        payload = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of log entries")
+    return list(enumerate(payload)), []
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+_telemetry_values = operator.attrgetter(*TELEMETRY_FIELDS + CACHE_TOKEN_FIELDS)
+
+def _copy_row(entry: LogEntry, timestamp: str) -> str:
+    """One COPY line for ``entry``; ``timestamp`` is already ISO formatted, as it is shared by the batch."""
+    cost = entry.cost
+    values = (
+        timestamp,
+        entry.provider,
+        entry.model,
+        entry.prompt_tokens,
+        entry.completion_tokens,
+        float(cost) if cost is not None else None,
+        f"{float(cost):.6f}" if cost is not None else None,
+        entry.status,
+        entry.error_message,
+        entry.user_id,
+        entry.tenant_id,
+        *_telemetry_values(entry),
+    )
+    # COPY text format: NULL as \N, backslashes, tabs and newlines escaped in strings.
+    # Written inline because it runs once per column of every row in a batch.
+    return "\t".join([
+        "\\N" if v is None else v.translate(_COPY_ESCAPES) if type(v) is str else str(v) for v in values
+    ])
+
+def _ingest_batch(body: bytes, content_type: str):
+    entries, errors = _parse_batch(body, content_type)
+    if len(entries) + len(errors) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_SIZE} entries")
+
+    timestamp = datetime.now(timezone.utc)
+    stamp = timestamp.isoformat()
+    lines, accepted = [], []
+    for index, raw in entries:
+        try:
+            entry = LogEntry.model_validate(raw)
+        except ValidationError as e:
+            errors.append({
+                "index": index,
+                "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            })
+            continue
+        lines.append(_copy_row(entry, stamp))
+        accepted.append(entry)
+
+    if lines:
+        started = time.perf_counter()
+        try:
+            with db_pool().connection() as conn:
+                cur = conn.cursor()
+                cur.copy_expert(COPY_LOGS_STATEMENT, io.StringIO("\n".join(lines) + "\n"))
+                # Same transaction as the COPY, so rollups never drift from the raw rows
+                apply_rollups(cur, [_rollup_record(entry, timestamp) for entry in accepted])
+                conn.commit()
+                cur.close()
+        except DatabaseError as e:
+            raise HTTPException(status_code=500, detail="Database error: " + str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail="Internal server error: " + str(e))
+        WRITE_DURATION.labels("/logs/batch").observe(time.perf_counter() - started)
+        observe_calls(vars(entry) for entry in accepted)
+
+    INGESTED.labels("/logs/batch", "accepted").inc(len(lines))
+    if errors:
+        INGESTED.labels("/logs/batch", "rejected").inc(len(errors))
+    errors.sort(key=lambda err: err["index"])
+    return {
+        "accepted": len(lines),
+        "rejected": len(errors),
+        "errors": errors[:MAX_REPORTED_ERRORS],
+    }
+
+@app.post("/logs/batch")
+async def log_api_calls_batch(request: Request):
+    """
+    Bulk-load many log entries with a single COPY. The body is a JSON array or
+    NDJSON (Content-Type: application/x-ndjson). Invalid entries are rejected
+    individually; the valid ones are still loaded.
+    """
+    body = await request.body()
+    # Parsing and validating thousands of entries is CPU work, so it runs off the loop too
+    return await run_db(write_executor, _ingest_batch, body, request.headers.get("content-type", ""))
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: ingestion, pool usage and per-model call metrics of ingested logs."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+def _query_logs(query: str, params: tuple):
+    with db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        rows = cur.fetchall()
+        columns = [desc[0] for desc in cur.description]
+        cur.close()
+    return rows, columns
+
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    """Opaque keyset cursor for the row a page ended on."""
+    raw = json.dumps([timestamp.isoformat(), log_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, log_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/logs")
 async def get_logs(
-    limit: int = 10,
-    offset: int = 0,
+    limit: int = Query(10, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     provider: Optional[str] = None,
     model: Optional[str] = None,
     status: Optional[str] = None,
     user_id: Optional[str] = None,
+    tenant_id: Optional[str] = None,
+    request_id: Optional[str] = None,
     start_time: Optional[datetime] = None,
-    end_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None,
+    min_latency_ms: Optional[float] = None,
+    max_latency_ms: Optional[float] = None,
+    min_ttft_ms: Optional[float] = None,
+    min_retry_count: Optional[int] = None,
+    sort_by: str = "timestamp",
+    order: str = "desc"
 ):
+    """
+    List logs newest first. Pass the returned ``next_cursor`` as ``cursor`` to
+    get the next page; every page then costs one index range scan. ``offset``
+    is still honoured when no cursor is given, but deep offsets scan every
+    skipped row.
+
+    ``sort_by`` orders by another column instead (e.g. ``latency_ms`` to find
+    the slowest calls), with ``order`` ``asc`` or ``desc``. Those listings
+    page with ``offset``; cursors only work with the default order.
+    """
+    if sort_by not in SORTABLE_LOG_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {', '.join(SORTABLE_LOG_COLUMNS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    keyset = sort_by == "timestamp" and order == "desc"
+    if cursor and not keyset:
+        raise HTTPException(status_code=400, detail="cursor only works with the default sort; use offset")
+    after = decode_cursor(cursor) if cursor else None
     try:
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
         query = "SELECT * FROM api_logs WHERE 1=1"
         params = []
         if provider:
@@ -86,17 +362,49 @@ async def get_logs(
         if user_id:
             query += " AND user_id = %s"
             params.append(user_id)
+        if tenant_id:
+            query += " AND tenant_id = %s"
+            params.append(tenant_id)
+        if request_id:
+            query += " AND request_id = %s"
+            params.append(request_id)
+        if min_latency_ms is not None:
+            query += " AND latency_ms >= %s"
+            params.append(min_latency_ms)
+        if max_latency_ms is not None:
+            query += " AND latency_ms <= %s"
+            params.append(max_latency_ms)
+        if min_ttft_ms is not None:
+            query += " AND ttft_ms >= %s"
+            params.append(min_ttft_ms)
+        if min_retry_count is not None:
+            query += " AND retry_count >= %s"
+            params.append(min_retry_count)
         if start_time:
             query += " AND timestamp >= %s"
             params.append(start_time)
         if end_time:
             query += " AND timestamp <= %s"
             params.append(end_time)
-        query += " ORDER BY id DESC LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
-        cur.execute(query, tuple(params))
-        rows = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
+        if after:
+            # The plain timestamp bound lets the planner prune partitions newer than the cursor
+            query += " AND timestamp <= %s AND (timestamp, id) < (%s, %s)"
+            params.append(after[0])
+            params.extend(after)
+        # Fetch one extra row to know whether there is a next page
+        if keyset:
+            query += " ORDER BY timestamp DESC, id DESC LIMIT %s"
+        else:
+            direction = order.upper()
+            # sort_by is checked against SORTABLE_LOG_COLUMNS above
+            query += f" ORDER BY {sort_by} {direction} NULLS LAST, id {direction} LIMIT %s"
+        params.append(limit + 1)
+        if offset and not after:
+            query += " OFFSET %s"
+            params.append(offset)
+        rows, columns = await run_db(read_executor, _query_logs, query, tuple(params))
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         logs = []
         india_tz = pytz.timezone("Asia/Kolkata")
         us_cst_tz = pytz.timezone("America/Chicago")
@@ -112,8 +420,122 @@ async def get_logs(
                 log["local_timestamp_india"] = None
                 log["local_timestamp_us_cst"] = None
             logs.append(log)
+        next_cursor = None
+        if has_more and logs and keyset:
+            next_cursor = encode_cursor(logs[-1]["timestamp"], logs[-1]["id"])
+        return {"logs": logs, "next_cursor": next_cursor}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/stats")
+async def get_stats(
+    granularity: str = "hour",
+    group_by: str = "provider,model",
+    tenant_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    status: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    limit: int = 1000
+):
+    """
+    Call counts, token sums and cost sums per ``granularity`` bucket (minute,
+    hour or day), grouped by the comma-separated ``group_by`` dimensions.
+    Served from the rollup tables, so the cost does not grow with api_logs.
+    Time bounds select buckets by their start.
+    """
+    dimensions = [d.strip() for d in group_by.split(",") if d.strip()]
+    filters = {"tenant_id": tenant_id, "user_id": user_id, "provider": provider, "model": model, "status": status}
+    try:
+        query, params = build_stats_query(granularity, dimensions, filters, start_time, end_time, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        rows, _ = await run_db(read_executor, _query_logs, query, tuple(params))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    stats = []
+    for row in rows:
+        stat = dict(zip(["bucket"] + dimensions, row))
+        stat.update(zip(("calls", "prompt_tokens", "completion_tokens"), map(int, row[-4:-1])))
+        stat["cost"] = float(row[-1])
+        stats.append(stat)
+    return {"granularity": granularity, "group_by": dimensions, "stats": stats}
+
+class CostRecomputeRequest(BaseModel):
+    start_time: datetime
+    end_time: datetime
+    models: Optional[List[str]] = None
+    chunk_minutes: int = int(DEFAULT_CHUNK.total_seconds() // 60)
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def _create_recompute_job(start_time: datetime, end_time: datetime, models: Optional[List[str]]) -> int:
+    with db_pool().connection() as conn:
+        cur = conn.cursor()
+        job_id = create_job(cur, start_time, end_time, models)
+        conn.commit()
+        cur.close()
+    return job_id
+
+def _get_recompute_job(job_id: int):
+    with db_pool().connection() as conn:
+        cur = conn.cursor()
+        job = get_job(cur, job_id)
         cur.close()
-        conn.close()
-        return {"logs": logs}
+    return job
+
+def _run_recompute_job(job_id: int, chunk_minutes: int):
+    try:
+        run_job(job_id, pool=db_pool(), chunk=timedelta(minutes=chunk_minutes))
+    except Exception:
+        # run_job has logged the error and recorded it on the job
+        pass
+
+@app.post("/costs/recompute")
+async def start_cost_recompute(request: CostRecomputeRequest):
+    """
+    Start a job that recomputes the stored cost of every log between
+    ``start_time`` and ``end_time`` (optionally only for ``models``) with the
+    current prices, and updates the rollups to match. Poll
+    ``GET /costs/recompute/{job_id}`` for progress.
+    """
+    start_time, end_time = _utc(request.start_time), _utc(request.end_time)
+    if start_time >= end_time:
+        raise HTTPException(status_code=400, detail="start_time must be before end_time")
+    if request.chunk_minutes < 1:
+        raise HTTPException(status_code=400, detail="chunk_minutes must be at least 1")
+    try:
+        job_id = await run_db(write_executor, _create_recompute_job, start_time, end_time, request.models)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    recompute_executor.submit(_run_recompute_job, job_id, request.chunk_minutes)
+    return {"job_id": job_id, "status": "pending"}
+
+@app.post("/costs/recompute/{job_id}/resume")
+async def resume_cost_recompute(job_id: int, chunk_minutes: int = int(DEFAULT_CHUNK.total_seconds() // 60)):
+    """Continue a failed or interrupted job from its last checkpoint."""
+    if chunk_minutes < 1:
+        raise HTTPException(status_code=400, detail="chunk_minutes must be at least 1")
+    try:
+        job = await run_db(read_executor, _get_recompute_job, job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No cost recompute job {job_id}")
+    if job["status"] != "done":
+        recompute_executor.submit(_run_recompute_job, job_id, chunk_minutes)
+    return {"job_id": job_id, "status": job["status"]}
+
+@app.get("/costs/recompute/{job_id}")
+async def get_cost_recompute(job_id: int):
+    try:
+        job = await run_db(read_executor, _get_recompute_job, job_id)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No cost recompute job {job_id}")
+    return job
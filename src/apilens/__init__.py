@@ -1,8 +1,28 @@
-from .rest_logger import APILoggerREST
-from .anthropic_wrapper import ClaudeWrapper
-from .openai_wrapper import OpenAIWrapper
-from .gemini_wrapper import GeminiWrapper
-from .types import LLMResponse, APILensError, RateLimitError, AuthError, BadRequestError
+"""
+API Lens: unified, logged access to OpenAI, Anthropic and Gemini.
+
+Wrappers and the logger are imported on first attribute access, so
+``import apilens`` does not load any provider SDK, psycopg2 or pytz.
+"""
+
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+from .types import LLMResponse, BatchResult, APILensError, RateLimitError, AuthError, BadRequestError
+
+if TYPE_CHECKING:
+    from .rest_logger import APILoggerREST
+    from .anthropic_wrapper import ClaudeWrapper
+    from .openai_wrapper import OpenAIWrapper
+    from .gemini_wrapper import GeminiWrapper
+
+# Public name -> submodule that defines it
+_LAZY_ATTRS = {
+    'APILoggerREST': '.rest_logger',
+    'ClaudeWrapper': '.anthropic_wrapper',
+    'OpenAIWrapper': '.openai_wrapper',
+    'GeminiWrapper': '.gemini_wrapper',
+}
 
 __all__ = [
     'APILoggerREST',
@@ -10,8 +30,22 @@ __all__ = [
     'OpenAIWrapper',
     'GeminiWrapper',
     'LLMResponse',
+    'BatchResult',
     'APILensError',
     'RateLimitError',
     'AuthError',
     'BadRequestError'
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        value = getattr(import_module(_LAZY_ATTRS[name], __name__), name)
+        # Cache on the package so later lookups skip __getattr__
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
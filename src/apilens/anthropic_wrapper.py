@@ -1,87 +1,94 @@
-import os
 import logging
 import anthropic
+from . import config
 from .rest_logger import APILoggerREST
+from .metrics import observe_call
+from .pricing import calculate_cost
+from .prompt_cache import add_cache_breakpoints, anthropic_usage, cache_tokens
+from .streaming import StreamAccumulator, delta_chunk, estimate_prompt_tokens, final_chunk, open_stream
+from .telemetry import CallTelemetry, payload_bytes
 
 logger = logging.getLogger(__name__)
 
 class ClaudeWrapper:
-    def __init__(self, model="claude-3-opus-20240229", logger=None):
+    def __init__(self, model="claude-3-opus-20240229", logger=None, max_retries=3, backoff_base=2.0,
+                 prompt_caching=True):
         self.model_name = model
+        # Mark long stable prompt prefixes with cache_control breakpoints (see prompt_cache.py)
+        self.prompt_caching = prompt_caching
         self.logger = logger or APILoggerREST()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
         
         # Initialize Anthropic client
-        api_key = os.getenv("ANTHROPIC_API_KEY")
+        api_key = config.ANTHROPIC_API_KEY
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
         
         self.client = anthropic.Anthropic(api_key=api_key)
 
+    def _log_call(self, **record):
+        observe_call(record)
+        if self.logger:
+            self.logger.log_call(**record)
+
+    def _build_args(self, messages, **kwargs):
+        # Convert messages to Claude format
+        # Claude uses a different format than OpenAI
+        system_message = None
+        claude_messages = []
+
+        for msg in messages:
+            role = msg.get("role", "")
+            content = msg.get("content", "")
+
+            if role == "system":
+                system_message = content
+            elif role == "user":
+                claude_messages.append({"role": "user", "content": content})
+            elif role == "assistant":
+                claude_messages.append({"role": "assistant", "content": content})
+
+        if self.prompt_caching:
+            system_message, claude_messages = add_cache_breakpoints(system_message, claude_messages, self.model_name)
+
+        api_args = {
+            "model": self.model_name,
+            "messages": claude_messages,
+            "max_tokens": kwargs.get("max_tokens", 4096),
+            "temperature": kwargs.get("temperature", 0.7)
+        }
+        if system_message is not None:
+            api_args["system"] = system_message
+        return api_args
+
+    def _calculate_cost(self, prompt_tokens, completion_tokens, cache_read_tokens=None, cache_write_tokens=None):
+        return calculate_cost(self.model_name, prompt_tokens, completion_tokens,
+                              cached_tokens=cache_read_tokens or 0, cache_write_tokens=cache_write_tokens or 0)
+
+    def _start_telemetry(self, api_args):
+        telemetry = CallTelemetry()
+        telemetry.request_bytes = payload_bytes(api_args)
+        return telemetry
+
     def chat_completion(self, messages, **kwargs):
+        api_args = self._build_args(messages, **kwargs)
+        telemetry = self._start_telemetry(api_args)
         try:
-            # Convert messages to Claude format
-            # Claude uses a different format than OpenAI
-            system_message = None
-            claude_messages = []
-            
-            for msg in messages:
-                role = msg.get("role", "")
-                content = msg.get("content", "")
-                
-                if role == "system":
-                    system_message = content
-                elif role == "user":
-                    claude_messages.append({"role": "user", "content": content})
-                elif role == "assistant":
-                    claude_messages.append({"role": "assistant", "content": content})
-            
             # Make the API call
-            api_args = {
-                "model": self.model_name,
-                "messages": claude_messages,
-                "max_tokens": kwargs.get("max_tokens", 4096),
-                "temperature": kwargs.get("temperature", 0.7)
-            }
-            if system_message is not None:
-                api_args["system"] = system_message
-
+            telemetry.start_provider()
             response = self.client.messages.create(**api_args)
+            telemetry.end_provider()
+            telemetry.record_request_id(getattr(response, "_request_id", None))
             
-            # Get token usage from response
-            prompt_tokens = response.usage.input_tokens
+            # Get token usage from response; prompt_tokens includes cache reads and writes
+            usage = anthropic_usage(response.usage)
+            prompt_tokens = usage["prompt_tokens"]
             completion_tokens = response.usage.output_tokens
-            
-            # Calculate cost based on Claude's pricing (as of 2024)
-            # Claude 3 Opus: $15/million input tokens, $75/million output tokens
-            # Claude 3 Sonnet: $3/million input tokens, $15/million output tokens
-            # Claude 3 Haiku: $0.25/million input tokens, $1.25/million output tokens
-            pricing = {
-                "claude-3-opus-20240229": {"input": 15, "output": 75},
-                "claude-3-sonnet-20240229": {"input": 3, "output": 15},
-                "claude-3-haiku-20240307": {"input": 0.25, "output": 1.25}
-            }
-            
-            model_pricing = pricing.get(self.model_name, pricing["claude-3-sonnet-20240229"])
-            input_cost = (prompt_tokens / 1_000_000) * model_pricing["input"]
-            output_cost = (completion_tokens / 1_000_000) * model_pricing["output"]
-            total_cost = input_cost + output_cost
-            
-            # Log the API call
-            if self.logger:
-                self.logger.log_call(
-                    provider="anthropic",
-                    model=self.model_name,
-                    prompt_tokens=prompt_tokens,
-                    completion_tokens=completion_tokens,
-                    cost=total_cost,
-                    status="success",
-                    error_message=None,
-                    user_id=kwargs.get("user_id"),
-                    tenant_id=kwargs.get("tenant_id")
-                )
+            total_cost = self._calculate_cost(prompt_tokens, completion_tokens, **cache_tokens(usage))
             
             # Return in a format similar to OpenAI's response
-            return {
+            result = {
                 "choices": [{
                     "message": {
                         "content": response.content[0].text,
@@ -89,28 +96,113 @@ class ClaudeWrapper:
                     }
                 }],
                 "usage": {
-                    "prompt_tokens": prompt_tokens,
+                    **usage,
                     "completion_tokens": completion_tokens,
                     "total_tokens": prompt_tokens + completion_tokens
                 },
                 "cost": total_cost
             }
+            telemetry.response_bytes = payload_bytes(result)
+            telemetry.finish()
+            
+            # Log the API call
+            self._log_call(
+                provider="anthropic",
+                model=self.model_name,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cost=total_cost,
+                status="success",
+                error_message=None,
+                user_id=kwargs.get("user_id"),
+                tenant_id=kwargs.get("tenant_id"),
+                **cache_tokens(usage),
+                **telemetry.as_log_fields()
+            )
+            
+            return result
             
         except Exception as e:
             logger.error(f"Error in Claude API call: {str(e)}")
+            telemetry.end_provider()
+            telemetry.finish()
             
             # Log the error
-            if self.logger:
-                self.logger.log_call(
-                    provider="anthropic",
-                    model=self.model_name,
-                    prompt_tokens=0,
-                    completion_tokens=0,
-                    cost=0,
-                    status="error",
-                    error_message=str(e),
-                    user_id=kwargs.get("user_id"),
-                    tenant_id=kwargs.get("tenant_id")
-                )
+            self._log_call(
+                provider="anthropic",
+                model=self.model_name,
+                prompt_tokens=0,
+                completion_tokens=0,
+                cost=0,
+                status="error",
+                error_message=str(e),
+                user_id=kwargs.get("user_id"),
+                tenant_id=kwargs.get("tenant_id"),
+                **telemetry.as_log_fields()
+            )
             
-            raise 
\ No newline at end of file
+            raise 
+
+    def chat_completion_stream(self, messages, **kwargs):
+        """
+        Stream a chat completion. Yields ``{"choices": [{"delta": {"content": ...}}]}``
+        chunks, then a final chunk with the full message, usage, cost and
+        stream timings. Opening the stream is retried on rate limits. One row
+        is logged when the stream ends, with partial usage if it is cancelled.
+        """
+        api_args = self._build_args(messages, **kwargs)
+        telemetry = self._start_telemetry(api_args)
+        accumulator = StreamAccumulator(started=telemetry.started)
+        stream = None
+        status, error = "cancelled", None
+        try:
+            telemetry.start_provider()
+            stream = open_stream(
+                lambda: self.client.messages.create(stream=True, **api_args),
+                retry_on=(anthropic.RateLimitError,),
+                max_retries=self.max_retries,
+                backoff_base=self.backoff_base,
+                telemetry=telemetry
+            )
+            telemetry.record_request_id(getattr(stream, "_request_id", None))
+            for event in stream:
+                # Input tokens arrive with message_start, the output total with the final message_delta
+                if event.type == "message_start":
+                    accumulator.update_usage(**anthropic_usage(event.message.usage))
+                elif event.type == "message_delta":
+                    accumulator.update_usage(completion_tokens=event.usage.output_tokens)
+                elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                    accumulator.add(event.delta.text)
+                    yield delta_chunk(event.delta.text)
+            status = "success"
+        except Exception as e:
+            logger.error(f"Error in Claude stream: {str(e)}")
+            status, error = "error", str(e)
+            raise
+        finally:
+            accumulator.finish()
+            if stream is not None and status != "success":
+                stream.close()
+            if status == "error" and accumulator.first_token_at is None:
+                usage = {"prompt_tokens": 0, "completion_tokens": 0}
+            else:
+                usage = accumulator.usage(estimate_prompt_tokens(messages, self.model_name), self.model_name)
+            total_cost = self._calculate_cost(usage["prompt_tokens"], usage["completion_tokens"], **cache_tokens(usage))
+            telemetry.end_provider()
+            telemetry.ttft = accumulator.metrics(usage["completion_tokens"])["ttft"]
+            telemetry.response_bytes = len(accumulator.text.encode("utf-8"))
+            telemetry.finish()
+            self._log_call(
+                provider="anthropic",
+                model=self.model_name,
+                prompt_tokens=usage["prompt_tokens"],
+                completion_tokens=usage["completion_tokens"],
+                cost=total_cost,
+                status=status,
+                error_message=error,
+                user_id=kwargs.get("user_id"),
+                tenant_id=kwargs.get("tenant_id"),
+                **cache_tokens(usage),
+                **telemetry.as_log_fields()
+            )
+        yield final_chunk(accumulator, usage, total_cost)
@@ -1,10 +1,21 @@
 from abc import ABC, abstractmethod
 import time
 import asyncio
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Optional, Dict, Any, Iterator, AsyncIterator, List, Callable, TypeVar, Union
-from .logger import _APILogger
-from .types import LLMResponse, APILensError, RateLimitError, AuthError, BadRequestError
-from .config import PRICING
+from .types import BatchResult, LLMResponse, APILensError, RateLimitError, AuthError, BadRequestError
+from .pricing import calculate_cost
+from .prompt_cache import cache_tokens
+from .cache import DiskResponseCache, ResponseCache, default_cache, make_cache_key
+from .singleflight import default_group
+from .rate_limiter import estimate_tokens, get_limiter
+from .streaming import StreamAccumulator, delta_chunk, estimate_prompt_tokens, final_chunk
+from .metrics import observe_call, observe_calls
+from .telemetry import CallTelemetry, payload_bytes
+from .tokens import get_counter
+from .tracing import span
 import logging
 from apilens.rest_logger import APILoggerREST
 import os
@@ -14,6 +25,10 @@ logger = logging.getLogger(__name__)
 
 T = TypeVar('T')
 
+# Log submissions from async code run here when the logger itself would block
+LOG_SUBMIT_WORKERS = int(os.getenv("APILENS_LOG_SUBMIT_WORKERS", "4"))
+_log_executor = ThreadPoolExecutor(max_workers=LOG_SUBMIT_WORKERS, thread_name_prefix="apilens-log-submit")
+
 class BaseAIWrapper(ABC):
     """
     Base class for all AI provider wrappers.
@@ -29,8 +44,12 @@ class BaseAIWrapper(ABC):
         backoff_base: float = 2.0,
         timeout: int = 30,
         logger: Optional[object] = None,
+        cache: Optional[Union[ResponseCache, DiskResponseCache]] = None,
+        coalesce: bool = False,
         **kwargs
     ):
+        if max_retries < 1:
+            raise ValueError("max_retries must be at least 1")
         self.provider_name = provider_name
         self.model = model
         self.user_id = user_id
@@ -39,16 +58,24 @@ class BaseAIWrapper(ABC):
         self.backoff_base = backoff_base
         self.timeout = timeout
         self.provider_config = kwargs
+        # Opt-in response cache, shared freely between wrappers. Without one,
+        # the shared disk cache at $APILENS_CACHE_DB is used if configured.
+        self._cache = cache if cache is not None else default_cache()
+        # With coalesce=True, identical concurrent requests share one upstream call
+        self._single_flight = default_group if coalesce else None
+        self._pending_logs = set()
+        self._pending_logs_lock = threading.Lock()
         
         # Initialize logger with default configuration
         self._logger = logger or APILoggerREST(
             api_url="https://api.apilens.ai/log"  # Default centralized logging endpoint
         )
 
-    def _calculate_cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
-        """Calculate cost based on token usage."""
-        pricing = PRICING.get(model, {"input": 0.03, "output": 0.06})
-        return (prompt_tokens / 1000 * pricing["input"]) + (completion_tokens / 1000 * pricing["output"])
+    def _calculate_cost(self, model: str, prompt_tokens: int, completion_tokens: int,
+                        cache_read_tokens: Optional[int] = None, cache_write_tokens: Optional[int] = None) -> float:
+        """Calculate cost based on token usage; cache reads and writes are part of ``prompt_tokens``."""
+        return calculate_cost(model, prompt_tokens, completion_tokens,
+                              cached_tokens=cache_read_tokens or 0, cache_write_tokens=cache_write_tokens or 0)
 
     @abstractmethod
     def _make_api_call(self, messages: List[Dict[str, str]], **kwargs) -> Any:
@@ -70,33 +97,127 @@ class BaseAIWrapper(ABC):
         """Format the provider's response into a standard format."""
         pass
 
-    def _retry_with_backoff(self, func: Callable[..., T], *args, **kwargs) -> T:
+    def _retry_with_backoff(self, func: Callable[..., T], *args, telemetry: Optional[CallTelemetry] = None, **kwargs) -> T:
         """Retry a function with exponential backoff."""
         last_exception = None
-        for attempt in range(self.max_retries):
-            try:
-                return func(*args, **kwargs)
-            except RateLimitError as e:
-                last_exception = e
-                if attempt < self.max_retries - 1:
-                    sleep_time = self.backoff_base ** attempt
-                    logger.warning(f"Rate limit hit, retrying in {sleep_time} seconds...")
-                    time.sleep(sleep_time)
-                else:
-                    logger.error("Max retries exceeded")
+        with span("retry", self) as retry_span:
+            for attempt in range(self.max_retries):
+                retry_span.set(attempts=attempt + 1)
+                try:
+                    with span("provider_call", self, attempt=attempt + 1):
+                        return func(*args, **kwargs)
+                except RateLimitError as e:
+                    last_exception = e
+                    if attempt < self.max_retries - 1:
+                        sleep_time = self.backoff_base ** attempt
+                        logger.warning(f"Rate limit hit, retrying in {sleep_time} seconds...")
+                        if telemetry is not None:
+                            telemetry.record_backoff(sleep_time)
+                        with span("backoff", self, attempt=attempt + 1, seconds=sleep_time):
+                            time.sleep(sleep_time)
+                    else:
+                        logger.error("Max retries exceeded")
+                        raise
+                except Exception as e:
+                    last_exception = e
                     raise
-            except Exception as e:
-                last_exception = e
-                raise
-        raise last_exception
+            raise last_exception
 
-    def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> LLMResponse:
+    async def _async_retry_with_backoff(self, func: Callable[..., Any], *args, telemetry: Optional[CallTelemetry] = None, **kwargs) -> Any:
+        """Async counterpart of ``_retry_with_backoff``; waits without blocking the event loop."""
+        with span("retry", self) as retry_span:
+            for attempt in range(self.max_retries):
+                retry_span.set(attempts=attempt + 1)
+                try:
+                    with span("provider_call", self, attempt=attempt + 1):
+                        return await func(*args, **kwargs)
+                except RateLimitError:
+                    if attempt < self.max_retries - 1:
+                        sleep_time = self.backoff_base ** attempt
+                        logger.warning(f"Rate limit hit, retrying in {sleep_time} seconds...")
+                        if telemetry is not None:
+                            telemetry.record_backoff(sleep_time)
+                        with span("backoff", self, attempt=attempt + 1, seconds=sleep_time):
+                            await asyncio.sleep(sleep_time)
+                    else:
+                        logger.error("Max retries exceeded")
+                        raise
+
+    def _cache_key(self, messages: List[Dict[str, str]], kwargs: Dict[str, Any]) -> Optional[str]:
+        """Cache key for this request, or None if it should not be cached."""
+        if self._cache is None or not self._cache.is_cacheable(kwargs):
+            return None
+        return make_cache_key(self.provider_name, self.model, messages, kwargs)
+
+    def _cached_response(self, cached: LLMResponse, log: Optional[Callable[..., Any]] = None) -> LLMResponse:
+        """Log a cache hit and return it. Nothing was billed, so the cost is zero."""
+        usage = cached.get("usage") or {}
+        cached["cost"] = 0.0
+        (log or self.log_call)(
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            cost=0.0,
+            status="cached",
+            error_message=None
+        )
+        return cached
+
+    def _flight_key(self, messages: List[Dict[str, str]], kwargs: Dict[str, Any], cache_key: Optional[str]) -> Optional[str]:
+        """Single-flight key for this request, or None if it should run on its own."""
+        if self._single_flight is None or kwargs.get("stream"):
+            return None
+        return cache_key or make_cache_key(self.provider_name, self.model, messages, kwargs)
+
+    def _coalesced_response(self, shared: LLMResponse, log: Optional[Callable[..., Any]] = None) -> LLMResponse:
         """
-        Make a chat completion request with retries and logging.
-        This method now handles all business logic, including calling _make_api_call,
-        _extract_usage, and _format_response.
+        Log a caller that waited on another caller's identical request. Usage
+        was logged once with the real call, so this row has no tokens or cost.
+        """
+        response = copy.deepcopy(shared)
+        response["cost"] = 0.0
+        (log or self.log_call)(
+            prompt_tokens=0,
+            completion_tokens=0,
+            cost=0.0,
+            status="coalesced",
+            error_message=None
+        )
+        return response
+
+    def _estimate_tokens(self, messages: List[Dict[str, str]], kwargs: Dict[str, Any]) -> int:
+        """Tokens to reserve against the rate limiter before a call."""
+        return estimate_tokens(messages, kwargs.get("max_tokens"), self.model)
+
+    def _complete_usage(self, messages: List[Dict[str, str]], usage: Dict[str, Optional[int]]) -> Dict[str, int]:
         """
-        # Input validation
+        Count whatever the provider did not report (``None``) for ``messages``,
+        and calibrate this model's estimator with the prompt count it did report.
+        """
+        counter = get_counter(self.model)
+        if usage.get("prompt_tokens") is None:
+            usage["prompt_tokens"] = counter.count_messages(messages)
+        else:
+            counter.calibrate(messages, usage["prompt_tokens"])
+        if usage.get("completion_tokens") is None:
+            usage["completion_tokens"] = 0
+        return usage
+
+    def _request_id(self, response: Any) -> Optional[str]:
+        """The provider's request id for ``response``, if its SDK exposes one."""
+        return getattr(response, "_request_id", None)
+
+    def _start_telemetry(self, messages: List[Dict[str, str]], kwargs: Dict[str, Any]) -> CallTelemetry:
+        telemetry = CallTelemetry()
+        telemetry.request_bytes = payload_bytes({"model": self.model, "messages": messages, **kwargs})
+        return telemetry
+
+    def _reconcile_rate_limit(self, reservation, usage: Optional[Dict[str, int]]) -> None:
+        """Correct the reserved token estimate with real usage (none if the call failed)."""
+        if reservation is not None:
+            actual = usage["prompt_tokens"] + usage["completion_tokens"] if usage else 0
+            reservation.limiter.reconcile(reservation, actual)
+
+    def _validate_messages(self, messages: List[Dict[str, str]]) -> None:
         for i, msg in enumerate(messages):
             if not isinstance(msg, dict):
                 raise ValueError(f"Message #{i} must be a dict, got {type(msg)}")
@@ -104,60 +225,347 @@ class BaseAIWrapper(ABC):
                 raise ValueError(f"Message #{i} missing 'role'")
             if "content" not in msg or not msg["content"]:
                 raise ValueError(f"Message #{i} missing or empty 'content'")
+
+    def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> LLMResponse:
+        """
+        Make a chat completion request with retries and logging.
+        This method now handles all business logic, including calling _make_api_call,
+        _extract_usage, and _format_response.
+        """
+        with span("chat_completion", self):
+            return self._chat_completion(messages, self.log_call, **kwargs)
+
+    def _chat_completion(self, messages: List[Dict[str, str]], log: Callable[..., Any], **kwargs) -> LLMResponse:
+        """``chat_completion`` with log rows sent to ``log``."""
+        with span("validation", self, messages=len(messages)):
+            self._validate_messages(messages)
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return self._cached_response(cached, log=log)
+        flight_key = self._flight_key(messages, kwargs, cache_key)
+        if flight_key is None:
+            return self._complete(messages, cache_key, log, **kwargs)
+        response, shared = self._single_flight.do(
+            flight_key, lambda: self._complete(messages, cache_key, log, **kwargs)
+        )
+        # Waiters read the shared response, so the leader gets its own copy as well
+        return self._coalesced_response(response, log=log) if shared else copy.deepcopy(response)
+
+    def _complete(self, messages: List[Dict[str, str]], cache_key: Optional[str], log: Callable[..., Any], **kwargs) -> LLMResponse:
+        """Make one upstream call with retries, then cache and log the result."""
+        telemetry = self._start_telemetry(messages, kwargs)
+        reservation = None
         try:
-            response = self._retry_with_backoff(self._make_api_call, messages, **kwargs)
-            usage = self._extract_usage(response)
-            cost = self._calculate_cost(self.model, usage["prompt_tokens"], usage["completion_tokens"])
-            formatted = self._format_response(response)
+            # Wait for this provider/model's RPM and TPM budgets, if it has any
+            limiter = get_limiter(self.provider_name, self.model)
+            if limiter is not None:
+                with span("rate_limit", self):
+                    reservation = limiter.acquire(self._estimate_tokens(messages, kwargs))
+            telemetry.start_provider()
+            response = self._retry_with_backoff(self._make_api_call, messages, telemetry=telemetry, **kwargs)
+            telemetry.end_provider()
+            telemetry.record_request_id(self._request_id(response))
+            with span("extract_usage", self) as usage_span:
+                usage = self._complete_usage(messages, self._extract_usage(response))
+                usage_span.set(**usage)
+            self._reconcile_rate_limit(reservation, usage)
+            reservation = None
+            with span("calculate_cost", self) as cost_span:
+                cost = self._calculate_cost(self.model, usage["prompt_tokens"], usage["completion_tokens"],
+                                            **cache_tokens(usage))
+                cost_span.set(cost=cost)
+            with span("format_response", self):
+                formatted = self._format_response(response)
+            telemetry.response_bytes = payload_bytes(formatted)
             formatted["usage"] = usage
             formatted["cost"] = cost
+            if cache_key is not None:
+                self._cache.set(cache_key, formatted)
             # Log success
-            self.log_call(
+            telemetry.finish()
+            log(
                 prompt_tokens=usage["prompt_tokens"],
                 completion_tokens=usage["completion_tokens"],
                 cost=cost,
                 status="success",
-                error_message=None
+                error_message=None,
+                telemetry=telemetry,
+                **cache_tokens(usage)
             )
             return formatted
         except Exception as e:
             logger.error(f"Error in chat_completion: {e}")
+            self._reconcile_rate_limit(reservation, None)
+            telemetry.end_provider()
+            telemetry.finish()
             # Log error
-            self.log_call(
+            log(
                 prompt_tokens=0,
                 completion_tokens=0,
                 cost=0.0,
                 status="failed",
-                error_message=str(e)
+                error_message=str(e),
+                telemetry=telemetry
             )
             raise
 
     async def async_chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> LLMResponse:
         """
-        Async version of chat_completion.
+        Async version of chat_completion. Uses the provider's async client,
+        retries without blocking the loop, and submits logs in the background.
         """
+        with span("chat_completion", self, mode="async"):
+            return await self._async_chat_completion(messages, self._submit_log, **kwargs)
+
+    async def _async_chat_completion(self, messages: List[Dict[str, str]], log: Callable[..., Any], **kwargs) -> LLMResponse:
+        """``async_chat_completion`` with log rows sent to ``log``."""
+        with span("validation", self, messages=len(messages)):
+            self._validate_messages(messages)
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return self._cached_response(cached, log=log)
+        flight_key = self._flight_key(messages, kwargs, cache_key)
+        if flight_key is None:
+            return await self._async_complete(messages, cache_key, log, **kwargs)
+        response, shared = await self._single_flight.do_async(
+            flight_key, lambda: self._async_complete(messages, cache_key, log, **kwargs)
+        )
+        # Waiters read the shared response, so the leader gets its own copy as well
+        return self._coalesced_response(response, log=log) if shared else copy.deepcopy(response)
+
+    async def _async_complete(self, messages: List[Dict[str, str]], cache_key: Optional[str], log: Callable[..., Any], **kwargs) -> LLMResponse:
+        """Async counterpart of ``_complete``."""
+        telemetry = self._start_telemetry(messages, kwargs)
+        reservation = None
         try:
-            response = await self._make_async_api_call(messages, **kwargs)
-            usage = self._extract_usage(response)
-            cost = self._calculate_cost(self.model, usage["prompt_tokens"], usage["completion_tokens"])
-            formatted = self._format_response(response)
+            limiter = get_limiter(self.provider_name, self.model)
+            if limiter is not None:
+                with span("rate_limit", self):
+                    reservation = await limiter.acquire_async(self._estimate_tokens(messages, kwargs))
+            telemetry.start_provider()
+            response = await self._async_retry_with_backoff(self._make_async_api_call, messages, telemetry=telemetry, **kwargs)
+            telemetry.end_provider()
+            telemetry.record_request_id(self._request_id(response))
+            with span("extract_usage", self) as usage_span:
+                usage = self._complete_usage(messages, self._extract_usage(response))
+                usage_span.set(**usage)
+            self._reconcile_rate_limit(reservation, usage)
+            reservation = None
+            with span("calculate_cost", self) as cost_span:
+                cost = self._calculate_cost(self.model, usage["prompt_tokens"], usage["completion_tokens"],
+                                            **cache_tokens(usage))
+                cost_span.set(cost=cost)
+            with span("format_response", self):
+                formatted = self._format_response(response)
+            telemetry.response_bytes = payload_bytes(formatted)
             formatted["usage"] = usage
             formatted["cost"] = cost
+            if cache_key is not None:
+                self._cache.set(cache_key, formatted)
+            telemetry.finish()
+            log(
+                prompt_tokens=usage["prompt_tokens"],
+                completion_tokens=usage["completion_tokens"],
+                cost=cost,
+                status="success",
+                error_message=None,
+                telemetry=telemetry,
+                **cache_tokens(usage)
+            )
             return formatted
         except Exception as e:
             logger.error(f"Error in async_chat_completion: {e}")
+            self._reconcile_rate_limit(reservation, None)
+            telemetry.end_provider()
+            telemetry.finish()
+            log(
+                prompt_tokens=0,
+                completion_tokens=0,
+                cost=0.0,
+                status="failed",
+                error_message=str(e),
+                telemetry=telemetry
+            )
             raise
 
-    def chat_completion_stream(self, messages: List[Dict[str, str]], **kwargs) -> LLMResponse:
+    def batch_chat_completion(
+        self, conversations: List[List[Dict[str, str]]], concurrency: int = 8, **kwargs
+    ) -> List[BatchResult]:
         """
-        Stream chat completion responses.
+        Run independent conversations on up to ``concurrency`` threads. Each
+        one gets the usual cache, coalescing, rate limiting and retries. A
+        failure only affects its own item: results come back in input order
+        as ``{"response", "error"}``. Log rows are written together in one
+        submission once every conversation has finished.
         """
-        try:
-            for chunk in self._make_api_call(messages, stream=True, **kwargs):
-                yield self._format_response(chunk)
-        except Exception as e:
-            logger.error(f"Error in chat_completion_stream: {e}")
-            raise
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        records = []
+
+        def log(**log_fields):
+            records.append(self._log_record(**log_fields))
+
+        def run(messages):
+            try:
+                with span("chat_completion", self, mode="batch"):
+                    return {"response": self._chat_completion(messages, log, **kwargs), "error": None}
+            except Exception as e:
+                return {"response": None, "error": e}
+
+        if not conversations:
+            return []
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(conversations)),
+                                thread_name_prefix="apilens-batch") as pool:
+            results = list(pool.map(run, conversations))
+        self._log_batch(records)
+        return results
+
+    async def async_batch_chat_completion(
+        self, conversations: List[List[Dict[str, str]]], concurrency: int = 8, **kwargs
+    ) -> List[BatchResult]:
+        """Async counterpart of ``batch_chat_completion``; logs are submitted in the background."""
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        records = []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        def log(**log_fields):
+            records.append(self._log_record(**log_fields))
+
+        async def run(messages):
+            async with semaphore:
+                try:
+                    with span("chat_completion", self, mode="async_batch"):
+                        return {"response": await self._async_chat_completion(messages, log, **kwargs), "error": None}
+                except Exception as e:
+                    return {"response": None, "error": e}
+
+        results = await asyncio.gather(*(run(messages) for messages in conversations))
+        if records:
+            if getattr(self._logger, "non_blocking", False):
+                self._log_batch(records)
+            else:
+                future = _log_executor.submit(self._log_batch, records)
+                with self._pending_logs_lock:
+                    self._pending_logs.add(future)
+                future.add_done_callback(self._log_submitted)
+        return list(results)
+
+    def _make_stream_call(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[Any]:
+        """Open a streaming call to the provider and return its raw chunks."""
+        return self._make_api_call(messages, stream=True, **kwargs)
+
+    def _stream_delta(self, chunk: Any) -> Optional[str]:
+        """Text carried by one raw stream chunk."""
+        return self._format_response(chunk)["choices"][0]["message"]["content"]
+
+    def _stream_usage(self, chunk: Any) -> Dict[str, int]:
+        """Token counts reported by one raw stream chunk, if any."""
+        return {}
+
+    def chat_completion_stream(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[LLMResponse]:
+        """
+        Stream a chat completion. Yields ``{"choices": [{"delta": {"content": ...}}]}``
+        chunks, then one final chunk with the full message, usage, cost and
+        stream timings (``ttft``, ``duration``, ``tokens_per_second``).
+
+        Opening the stream is retried like any other call. One row is logged
+        when the stream ends: ``success``, ``failed``, or ``cancelled`` with
+        the usage so far if the consumer stops early.
+        """
+        # The final chunk is yielded after the root span, so time the consumer holds it is not counted
+        with span("chat_completion", self, mode="stream"):
+            with span("validation", self, messages=len(messages)):
+                self._validate_messages(messages)
+            telemetry = self._start_telemetry(messages, kwargs)
+            accumulator = StreamAccumulator()
+            reservation = None
+            chunks = None
+            status, error = "cancelled", None
+            try:
+                limiter = get_limiter(self.provider_name, self.model)
+                if limiter is not None:
+                    with span("rate_limit", self):
+                        reservation = limiter.acquire(self._estimate_tokens(messages, kwargs))
+                # Time to first token is measured from the request, not from any rate-limit wait
+                telemetry.start_provider()
+                accumulator.started = telemetry.provider_started
+                chunks = self._retry_with_backoff(self._make_stream_call, messages, telemetry=telemetry, **kwargs)
+                telemetry.record_request_id(self._request_id(chunks))
+                # Reading the stream is provider time, along with whatever the consumer does between chunks
+                with span("stream", self):
+                    for chunk in chunks:
+                        accumulator.update_usage(**self._stream_usage(chunk))
+                        delta = self._stream_delta(chunk)
+                        if delta:
+                            accumulator.add(delta)
+                            yield delta_chunk(delta)
+                status = "success"
+            except Exception as e:
+                logger.error(f"Error in chat_completion_stream: {e}")
+                status, error = "failed", str(e)
+                raise
+            finally:
+                accumulator.finish()
+                close = getattr(chunks, "close", None)
+                if close is not None and status != "success":
+                    close()
+                if status == "failed" and accumulator.first_token_at is None:
+                    usage = {"prompt_tokens": 0, "completion_tokens": 0}
+                else:
+                    usage = accumulator.usage(estimate_prompt_tokens(messages, self.model), self.model)
+                cost = self._calculate_cost(self.model, usage["prompt_tokens"], usage["completion_tokens"],
+                                            **cache_tokens(usage))
+                self._reconcile_rate_limit(reservation, usage)
+                metrics = accumulator.metrics(usage["completion_tokens"])
+                logger.debug(f"Stream {status}: ttft={metrics['ttft']} tokens/s={metrics['tokens_per_second']}")
+                telemetry.end_provider()
+                telemetry.ttft = metrics["ttft"]
+                telemetry.response_bytes = len(accumulator.text.encode("utf-8"))
+                telemetry.finish()
+                self.log_call(
+                    prompt_tokens=usage["prompt_tokens"],
+                    completion_tokens=usage["completion_tokens"],
+                    cost=cost,
+                    status=status,
+                    error_message=error,
+                    telemetry=telemetry,
+                    **cache_tokens(usage)
+                )
+        yield final_chunk(accumulator, usage, cost)
+
+    def _submit_log(self, **log_fields) -> None:
+        """
+        Log without blocking the caller. Loggers that only enqueue are called
+        directly; anything else runs on a small shared thread pool.
+        """
+        if getattr(self._logger, "non_blocking", False):
+            self.log_call(**log_fields)
+            return
+        future = _log_executor.submit(self.log_call, **log_fields)
+        with self._pending_logs_lock:
+            self._pending_logs.add(future)
+        future.add_done_callback(self._log_submitted)
+
+    def _log_submitted(self, future) -> None:
+        with self._pending_logs_lock:
+            self._pending_logs.discard(future)
+        if future.exception() is not None:
+            logger.error(f"Failed to log API call: {future.exception()}")
+
+    def flush_logs(self, timeout: Optional[float] = None) -> bool:
+        """Wait for logs submitted in the background; returns False on timeout."""
+        with self._pending_logs_lock:
+            pending = list(self._pending_logs)
+        done, not_done = wait(pending, timeout=timeout)
+        flush = getattr(self._logger, "flush", None)
+        if flush is not None:
+            return flush(timeout) and not not_done
+        return not not_done
 
     def log_call(
         self, 
@@ -166,18 +574,72 @@ class BaseAIWrapper(ABC):
         completion_tokens: int = 0, 
         cost: float = 0.0, 
         status: str = "pending", 
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        telemetry: Optional[CallTelemetry] = None,
+        cache_read_tokens: Optional[int] = None,
+        cache_write_tokens: Optional[int] = None
     ) -> int:
         """Log the API call with standardized format."""
-        return self._logger.log_call(
+        record = self._log_record(
             call_id=call_id,
-            provider=self.provider_name,
-            model=self.model,
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
             cost=cost,
             status=status,
             error_message=error_message,
-            user_id=self.user_id,
-            tenant_id=self.tenant_id
-        ) 
\ No newline at end of file
+            telemetry=telemetry,
+            cache_read_tokens=cache_read_tokens,
+            cache_write_tokens=cache_write_tokens
+        )
+        with span("log_call", self, status=status):
+            observe_call(record)
+            return self._logger.log_call(**record)
+
+    def _log_record(
+        self,
+        call_id: Optional[int] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cost: float = 0.0,
+        status: str = "pending",
+        error_message: Optional[str] = None,
+        telemetry: Optional[CallTelemetry] = None,
+        cache_read_tokens: Optional[int] = None,
+        cache_write_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        The fields ``log_call`` sends to the logger, plus the telemetry and
+        prompt cache columns when given.
+        """
+        record = {
+            "call_id": call_id,
+            "provider": self.provider_name,
+            "model": self.model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost,
+            "status": status,
+            "error_message": error_message,
+            "user_id": self.user_id,
+            "tenant_id": self.tenant_id,
+        }
+        if telemetry is not None:
+            record.update(telemetry.as_log_fields())
+        if cache_read_tokens is not None:
+            record["cache_read_tokens"] = cache_read_tokens
+        if cache_write_tokens is not None:
+            record["cache_write_tokens"] = cache_write_tokens
+        return record
+
+    def _log_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Send many log records at once, in one request where the logger supports it."""
+        if not records:
+            return
+        with span("log_call", self, records=len(records)):
+            observe_calls(records)
+            log_calls = getattr(self._logger, "log_calls", None)
+            if log_calls is not None:
+                log_calls(records)
+                return
+            for record in records:
+                self._logger.log_call(**record)
\ No newline at end of file
@@ -0,0 +1,344 @@
+"""
+Offline batch jobs on the providers' discounted batch APIs.
+
+``OpenAIBatchClient`` uses the OpenAI Batch API and ``AnthropicBatchClient``
+uses Anthropic Message Batches. Both follow the same steps:
+
+    client = OpenAIBatchClient(model="gpt-4o-mini")
+    job_id = client.submit(read_jsonl("requests.jsonl"))
+    client.wait(job_id)
+    for item in client.collect(job_id):
+        ...
+
+Each request is a dict with a ``custom_id``, ``messages`` and any other
+generation params. Results are streamed back as ``BatchItemResult`` dicts.
+``collect`` also logs usage and cost for every item, in chunks of
+``log_chunk_size`` through the logger's ``log_calls``. Items are logged
+with the ``batch_success`` and ``batch_failed`` statuses, at BATCH_DISCOUNT.
+"""
+
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, TypedDict
+
+import requests
+
+from .pricing import BATCH_DISCOUNT, BATCH_STATUSES, calculate_cost, resolve_model
+from .metrics import observe_calls
+from .types import LLMResponse, ProviderError
+
+logger = logging.getLogger(__name__)
+
+class BatchJobStatus(NamedTuple):
+    id: str
+    status: str
+    done: bool
+    total: int
+    succeeded: int
+    failed: int
+
+
+class BatchItemResult(TypedDict):
+    custom_id: str
+    response: Optional[LLMResponse]
+    error: Optional[str]
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the requests in a JSONL file, one JSON object per line."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class BaseBatchClient(ABC):
+    """Submit, poll and collect one provider's batch jobs."""
+    provider_name: str
+    default_base_url: str
+
+    def __init__(
+        self,
+        model: str,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        user_id: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        logger: Optional[object] = None,
+        poll_interval: float = 30.0,
+        log_chunk_size: int = 500,
+        timeout: float = 60.0,
+        session: Optional[requests.Session] = None,
+    ):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = (base_url or self.default_base_url).rstrip("/")
+        self.user_id = user_id
+        self.tenant_id = tenant_id
+        self._logger = logger
+        self.poll_interval = poll_interval
+        self.log_chunk_size = log_chunk_size
+        self.timeout = timeout
+        self._session = session or requests.Session()
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            from .rest_logger import APILoggerREST
+            self._logger = APILoggerREST()
+        return self._logger
+
+    @abstractmethod
+    def _headers(self) -> Dict[str, str]:
+        pass
+
+    @abstractmethod
+    def submit(self, items: Iterable[Dict[str, Any]]) -> str:
+        """Create a batch job from request dicts and return its id."""
+
+    @abstractmethod
+    def status(self, job_id: str) -> BatchJobStatus:
+        pass
+
+    @abstractmethod
+    def results(self, job_id: str) -> Iterator[BatchItemResult]:
+        """Stream the results of a finished job, without logging them."""
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        if not url.startswith("http"):
+            url = f"{self.base_url}{url}"
+        headers = {**self._headers(), **kwargs.pop("headers", {})}
+        response = self._session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+        if response.status_code >= 400:
+            raise ProviderError(self.provider_name, f"{method} {url} returned {response.status_code}: {response.text[:500]}")
+        return response
+
+    def _iter_jsonl(self, url: str) -> Iterator[Dict[str, Any]]:
+        with self._request("GET", url, stream=True) as response:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def wait(self, job_id: str, poll_interval: Optional[float] = None, timeout: Optional[float] = None) -> BatchJobStatus:
+        """Poll until the job finishes; raises TimeoutError after ``timeout`` seconds."""
+        poll_interval = self.poll_interval if poll_interval is None else poll_interval
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = self.status(job_id)
+            if status.done:
+                return status
+            if deadline is not None and time.monotonic() + poll_interval > deadline:
+                raise TimeoutError(f"{self.provider_name} batch {job_id} still {status.status} after {timeout}s")
+            logger.debug(f"Batch {job_id} is {status.status} ({status.succeeded + status.failed}/{status.total})")
+            time.sleep(poll_interval)
+
+    def collect(self, job_id: str, log: bool = True) -> Iterator[BatchItemResult]:
+        """Stream a finished job's results, logging usage and cost in chunks as they go."""
+        records = []
+        try:
+            for item in self.results(job_id):
+                if log:
+                    records.append(self._log_record(item))
+                    if len(records) >= self.log_chunk_size:
+                        self._log_batch(records)
+                        records = []
+                yield item
+        finally:
+            if records:
+                self._log_batch(records)
+
+    def run(self, items: Iterable[Dict[str, Any]], timeout: Optional[float] = None) -> List[BatchItemResult]:
+        """Submit, wait for and collect a job in one call."""
+        job_id = self.submit(items)
+        self.wait(job_id, timeout=timeout)
+        return list(self.collect(job_id))
+
+    def _calculate_cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        model = model if resolve_model(model) else self.model
+        return calculate_cost(model, prompt_tokens, completion_tokens) * BATCH_DISCOUNT
+
+    def _item_result(self, custom_id: str, model: str, content: str, prompt_tokens: int, completion_tokens: int) -> BatchItemResult:
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+        response = {
+            "choices": [{"message": {"content": content}}],
+            "usage": usage,
+            "cost": self._calculate_cost(model, prompt_tokens, completion_tokens),
+            "model": model,
+        }
+        return {"custom_id": custom_id, "response": response, "error": None}
+
+    def _log_record(self, item: BatchItemResult) -> Dict[str, Any]:
+        response = item["response"]
+        usage = (response or {}).get("usage") or {}
+        return {
+            "call_id": None,
+            "provider": self.provider_name,
+            "model": (response or {}).get("model", self.model),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "cost": (response or {}).get("cost", 0.0),
+            "status": BATCH_STATUSES["success" if item["error"] is None else "failed"],
+            "error_message": item["error"],
+            "user_id": self.user_id,
+            "tenant_id": self.tenant_id,
+        }
+
+    def _log_batch(self, records: List[Dict[str, Any]]) -> None:
+        observe_calls(records)
+        log_calls = getattr(self.logger, "log_calls", None)
+        try:
+            if log_calls is not None:
+                log_calls(records)
+            else:
+                for record in records:
+                    self.logger.log_call(**record)
+        except Exception as e:
+            logger.error(f"Failed to log {len(records)} batch results: {e}")
+
+
+class OpenAIBatchClient(BaseBatchClient):
+    """OpenAI Batch API: upload a JSONL file, create a batch, then read the output file."""
+    provider_name = "openai"
+    default_base_url = "https://api.openai.com/v1"
+    endpoint = "/v1/chat/completions"
+    _FINISHED = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(self, model: str = "gpt-3.5-turbo", api_key: Optional[str] = None, **kwargs):
+        super().__init__(model, api_key or os.getenv("OPENAI_API_KEY"), **kwargs)
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def _request_line(self, item: Dict[str, Any]) -> str:
+        body = {key: value for key, value in item.items() if key != "custom_id"}
+        body.setdefault("model", self.model)
+        line = {"custom_id": item["custom_id"], "method": "POST", "url": self.endpoint, "body": body}
+        return json.dumps(line, separators=(",", ":"), ensure_ascii=False)
+
+    def submit(self, items: Iterable[Dict[str, Any]]) -> str:
+        payload = "\n".join(self._request_line(item) for item in items).encode("utf-8")
+        upload = self._request(
+            "POST", "/files",
+            files={"file": ("batch.jsonl", payload, "application/jsonl")},
+            data={"purpose": "batch"},
+        ).json()
+        job = self._request("POST", "/batches", json={
+            "input_file_id": upload["id"],
+            "endpoint": self.endpoint,
+            "completion_window": "24h",
+        }).json()
+        logger.info(f"Submitted OpenAI batch {job['id']}")
+        return job["id"]
+
+    def _job(self, job_id: str) -> Dict[str, Any]:
+        return self._request("GET", f"/batches/{job_id}").json()
+
+    def status(self, job_id: str) -> BatchJobStatus:
+        job = self._job(job_id)
+        counts = job.get("request_counts") or {}
+        return BatchJobStatus(
+            id=job_id,
+            status=job["status"],
+            done=job["status"] in self._FINISHED,
+            total=counts.get("total", 0),
+            succeeded=counts.get("completed", 0),
+            failed=counts.get("failed", 0),
+        )
+
+    def results(self, job_id: str) -> Iterator[BatchItemResult]:
+        job = self._job(job_id)
+        for file_id in (job.get("output_file_id"), job.get("error_file_id")):
+            if not file_id:
+                continue
+            for line in self._iter_jsonl(f"/files/{file_id}/content"):
+                yield self._parse_line(line)
+
+    def _parse_line(self, line: Dict[str, Any]) -> BatchItemResult:
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or body.get("error") or {}
+            return {"custom_id": line["custom_id"], "response": None, "error": error.get("message") or json.dumps(error)}
+        usage = body.get("usage") or {}
+        return self._item_result(
+            line["custom_id"],
+            body.get("model", self.model),
+            body["choices"][0]["message"]["content"],
+            usage.get("prompt_tokens", 0),
+            usage.get("completion_tokens", 0),
+        )
+
+
+class AnthropicBatchClient(BaseBatchClient):
+    """Anthropic Message Batches: create a batch of Messages requests, then stream its results."""
+    provider_name = "anthropic"
+    default_base_url = "https://api.anthropic.com/v1"
+    api_version = "2023-06-01"
+
+    def __init__(self, model: str = "claude-3-opus-20240229", api_key: Optional[str] = None, **kwargs):
+        super().__init__(model, api_key or os.getenv("ANTHROPIC_API_KEY"), **kwargs)
+
+    def _headers(self) -> Dict[str, str]:
+        return {"x-api-key": self.api_key or "", "anthropic-version": self.api_version}
+
+    def _params(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Messages API params for one request, moving any system message to ``system``."""
+        params = {key: value for key, value in item.items() if key not in ("custom_id", "messages")}
+        params.setdefault("model", self.model)
+        params.setdefault("max_tokens", 4096)
+        messages = []
+        for message in item["messages"]:
+            if message.get("role") == "system":
+                params["system"] = message.get("content")
+            else:
+                messages.append(message)
+        params["messages"] = messages
+        return params
+
+    def submit(self, items: Iterable[Dict[str, Any]]) -> str:
+        requests_ = [{"custom_id": item["custom_id"], "params": self._params(item)} for item in items]
+        job = self._request("POST", "/messages/batches", json={"requests": requests_}).json()
+        logger.info(f"Submitted Anthropic batch {job['id']}")
+        return job["id"]
+
+    def _job(self, job_id: str) -> Dict[str, Any]:
+        return self._request("GET", f"/messages/batches/{job_id}").json()
+
+    def status(self, job_id: str) -> BatchJobStatus:
+        job = self._job(job_id)
+        counts = job.get("request_counts") or {}
+        failed = counts.get("errored", 0) + counts.get("canceled", 0) + counts.get("expired", 0)
+        return BatchJobStatus(
+            id=job_id,
+            status=job["processing_status"],
+            done=job["processing_status"] == "ended",
+            total=counts.get("processing", 0) + counts.get("succeeded", 0) + failed,
+            succeeded=counts.get("succeeded", 0),
+            failed=failed,
+        )
+
+    def results(self, job_id: str) -> Iterator[BatchItemResult]:
+        job = self._job(job_id)
+        if not job.get("results_url"):
+            raise ProviderError(self.provider_name, f"batch {job_id} has no results yet ({job['processing_status']})")
+        for line in self._iter_jsonl(job["results_url"]):
+            yield self._parse_line(line)
+
+    def _parse_line(self, line: Dict[str, Any]) -> BatchItemResult:
+        result = line.get("result") or {}
+        if result.get("type") != "succeeded":
+            error = (result.get("error") or {}).get("error") or result.get("error") or {}
+            return {"custom_id": line["custom_id"], "response": None, "error": error.get("message") or result.get("type", "unknown")}
+        message = result["message"]
+        usage = message.get("usage") or {}
+        text = "".join(block.get("text", "") for block in message.get("content", []) if block.get("type") == "text")
+        return self._item_result(
+            line["custom_id"],
+            message.get("model", self.model),
+            text,
+            usage.get("input_tokens", 0),
+            usage.get("output_tokens", 0),
+        )
@@ -0,0 +1,260 @@
+"""
+Local stand-in for the OpenAI Batch and Anthropic Message Batches APIs.
+
+It implements just enough of both APIs to exercise the batch clients offline.
+That covers file upload, job creation, status polling and streaming results.
+Every request "succeeds" with an echo of its last user message unless its
+``custom_id`` is listed in ``fail_ids``. A job finishes after it has been
+polled ``polls_to_complete`` times:
+
+    with FakeBatchServer() as server:
+        client = OpenAIBatchClient(api_key="test", base_url=server.openai_url)
+
+Or run it standalone: ``python -m apilens.fake_batch_server --port 8089``.
+"""
+
+import argparse
+import itertools
+import json
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Optional
+
+
+def _fake_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _parse_multipart(content_type: str, body: bytes) -> Dict[str, bytes]:
+    """Form fields of a multipart/form-data body, by name."""
+    message = BytesParser(policy=policy.HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.iter_parts()}
+
+
+class FakeBatchServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, polls_to_complete: int = 1,
+                 fail_ids: Optional[Iterable[str]] = None):
+        self.polls_to_complete = polls_to_complete
+        self.fail_ids = set(fail_ids or ())
+        self.files: Dict[str, bytes] = {}
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_url(self) -> str:
+        return f"{self.url}/openai/v1"
+
+    @property
+    def anthropic_url(self) -> str:
+        return f"{self.url}/anthropic/v1"
+
+    def start(self) -> "FakeBatchServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-batch-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _next_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}_{next(self._ids)}"
+
+    def _poll(self, job: Dict[str, Any]) -> bool:
+        """Count a status poll; True once the job is finished."""
+        with self._lock:
+            job["polls"] += 1
+            return job["polls"] >= self.polls_to_complete
+
+    # OpenAI
+
+    def _openai_create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        job_id = self._next_id("batch")
+        lines = [json.loads(line) for line in self.files[body["input_file_id"]].splitlines() if line.strip()]
+        self.jobs[job_id] = {"provider": "openai", "requests": lines, "polls": 0, "endpoint": body["endpoint"]}
+        return self._openai_batch(job_id, finished=False)
+
+    def _openai_batch(self, job_id: str, finished: bool) -> Dict[str, Any]:
+        job = self.jobs[job_id]
+        requests_ = job["requests"]
+        failed = sum(1 for r in requests_ if r["custom_id"] in self.fail_ids)
+        response = {
+            "id": job_id,
+            "object": "batch",
+            "endpoint": job["endpoint"],
+            "status": "completed" if finished else "in_progress",
+            "request_counts": {
+                "total": len(requests_),
+                "completed": len(requests_) - failed if finished else 0,
+                "failed": failed if finished else 0,
+            },
+            "output_file_id": None,
+            "error_file_id": None,
+        }
+        if finished:
+            if "output_file_id" not in job:
+                job["output_file_id"] = self._store_openai_results(requests_, success=True)
+                job["error_file_id"] = self._store_openai_results(requests_, success=False)
+            response["output_file_id"] = job["output_file_id"]
+            response["error_file_id"] = job["error_file_id"]
+        return response
+
+    def _store_openai_results(self, requests_, success: bool) -> Optional[str]:
+        lines = []
+        for request in requests_:
+            if (request["custom_id"] in self.fail_ids) == success:
+                continue
+            body = request["body"]
+            if success:
+                content = f"echo: {body['messages'][-1]['content']}"
+                prompt = "".join(m["content"] for m in body["messages"])
+                result = {"status_code": 200, "request_id": self._next_id("req"), "body": {
+                    "id": self._next_id("chatcmpl"),
+                    "object": "chat.completion",
+                    "model": body["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": _fake_tokens(prompt), "completion_tokens": _fake_tokens(content),
+                              "total_tokens": _fake_tokens(prompt) + _fake_tokens(content)},
+                }}
+                lines.append({"id": self._next_id("batch_req"), "custom_id": request["custom_id"], "response": result, "error": None})
+            else:
+                result = {"status_code": 400, "request_id": self._next_id("req"), "body": {
+                    "error": {"message": "Invalid request", "type": "invalid_request_error"}}}
+                lines.append({"id": self._next_id("batch_req"), "custom_id": request["custom_id"], "response": result, "error": None})
+        if not lines:
+            return None
+        file_id = self._next_id("file")
+        self.files[file_id] = "\n".join(json.dumps(line) for line in lines).encode("utf-8")
+        return file_id
+
+    # Anthropic
+
+    def _anthropic_create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        job_id = self._next_id("msgbatch")
+        self.jobs[job_id] = {"provider": "anthropic", "requests": body["requests"], "polls": 0}
+        return self._anthropic_batch(job_id, finished=False)
+
+    def _anthropic_batch(self, job_id: str, finished: bool) -> Dict[str, Any]:
+        requests_ = self.jobs[job_id]["requests"]
+        errored = sum(1 for r in requests_ if r["custom_id"] in self.fail_ids)
+        return {
+            "id": job_id,
+            "type": "message_batch",
+            "processing_status": "ended" if finished else "in_progress",
+            "request_counts": {
+                "processing": 0 if finished else len(requests_),
+                "succeeded": len(requests_) - errored if finished else 0,
+                "errored": errored if finished else 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "results_url": f"{self.anthropic_url}/messages/batches/{job_id}/results" if finished else None,
+        }
+
+    def _anthropic_results(self, job_id: str) -> bytes:
+        lines = []
+        for request in self.jobs[job_id]["requests"]:
+            params = request["params"]
+            if request["custom_id"] in self.fail_ids:
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "invalid_request_error", "message": "Invalid request"}}}
+            else:
+                content = f"echo: {params['messages'][-1]['content']}"
+                prompt = params.get("system", "") + "".join(m["content"] for m in params["messages"])
+                result = {"type": "succeeded", "message": {
+                    "id": self._next_id("msg"),
+                    "type": "message",
+                    "role": "assistant",
+                    "model": params["model"],
+                    "content": [{"type": "text", "text": content}],
+                    "stop_reason": "end_turn",
+                    "usage": {"input_tokens": _fake_tokens(prompt), "output_tokens": _fake_tokens(content)},
+                }}
+            lines.append({"custom_id": request["custom_id"], "result": result})
+        return "\n".join(json.dumps(line) for line in lines).encode("utf-8")
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: Any, content_type: str = "application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_POST(self):
+                if self.path == "/openai/v1/files":
+                    form = _parse_multipart(self.headers["Content-Type"], self._body())
+                    file_id = server._next_id("file")
+                    server.files[file_id] = form["file"]
+                    return self._send(200, {"id": file_id, "object": "file", "purpose": form["purpose"].decode()})
+                if self.path == "/openai/v1/batches":
+                    return self._send(200, server._openai_create_batch(json.loads(self._body())))
+                if self.path == "/anthropic/v1/messages/batches":
+                    return self._send(200, server._anthropic_create_batch(json.loads(self._body())))
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if parts[:3] == ["openai", "v1", "batches"] and len(parts) == 4 and parts[3] in server.jobs:
+                    job = server.jobs[parts[3]]
+                    return self._send(200, server._openai_batch(parts[3], server._poll(job)))
+                if parts[:3] == ["openai", "v1", "files"] and len(parts) == 5 and parts[4] == "content":
+                    if parts[3] in server.files:
+                        return self._send(200, server.files[parts[3]], "application/jsonl")
+                if parts[:4] == ["anthropic", "v1", "messages", "batches"] and len(parts) >= 5 and parts[4] in server.jobs:
+                    if len(parts) == 6 and parts[5] == "results":
+                        return self._send(200, server._anthropic_results(parts[4]), "application/x-jsonl")
+                    job = server.jobs[parts[4]]
+                    return self._send(200, server._anthropic_batch(parts[4], server._poll(job)))
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local fake OpenAI/Anthropic batch API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--polls-to-complete", type=int, default=1)
+    args = parser.parse_args(argv)
+    server = FakeBatchServer(args.host, args.port, polls_to_complete=args.polls_to_complete)
+    print(f"OpenAI base URL:    {server.openai_url}")
+    print(f"Anthropic base URL: {server.anthropic_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Conversion of OpenAI-style chat messages to Gemini's native request format.
+
+System messages become the model's ``system_instruction``. User and
+assistant turns become ``contents`` entries with the roles ``user`` and
+``model``. Consecutive turns with the same role are merged, because Gemini
+expects the roles to alternate. Text parts and ``data:`` image URLs of
+multimodal content are converted; other parts are dropped.
+
+Conversions are remembered per message list, keyed by its opening
+messages, its length and its last message. A request that extends a
+remembered list by up to MAX_NEW_MESSAGES messages finds it under the key
+of its own prefix. The prefix is checked against the request by value, and
+only the appended messages are converted. Conversations that share a system
+prompt and opening turn therefore do not evict each other.
+
+``python -m apilens.gemini_contents [turns]`` prints a benchmark.
+"""
+
+import base64
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# Conversations remembered per converter
+CACHE_SIZE = int(os.getenv("APILENS_GEMINI_CONVERSATION_CACHE_SIZE", "1024"))
+
+# Opening messages that are part of every cache key
+KEY_MESSAGES = 2
+# Messages a request may append to a remembered prefix and still reuse it
+MAX_NEW_MESSAGES = 8
+
+ROLES = {"user": "user", "assistant": "model", "model": "model"}
+
+
+class _Conversation(NamedTuple):
+    messages: List[Dict[str, Any]]  # copies of the converted messages
+    system: Tuple[str, ...]
+    contents: List[Dict[str, Any]]
+
+
+_EMPTY = _Conversation([], (), [])
+
+
+def _copy(message: Dict[str, Any]) -> Dict[str, Any]:
+    # Callers may edit their message dicts in place later; the copy keeps what was converted
+    copy = dict(message)
+    if isinstance(copy.get("content"), list):
+        copy["content"] = list(copy["content"])
+    return copy
+
+
+def _content_key(content: Any) -> Any:
+    return content if isinstance(content, str) else repr(content)
+
+
+def _message_key(message: Dict[str, Any]) -> Tuple[Any, Any]:
+    return message.get("role"), _content_key(message.get("content"))
+
+
+def _inline_data(url: str) -> Optional[Dict[str, Any]]:
+    if not url.startswith("data:") or ";base64," not in url:
+        return None
+    header, data = url[5:].split(";base64,", 1)
+    return {"inline_data": {"mime_type": header or "application/octet-stream", "data": base64.b64decode(data)}}
+
+
+def to_parts(content: Any) -> List[Dict[str, Any]]:
+    """Gemini ``parts`` for a message's content."""
+    if isinstance(content, str):
+        return [{"text": content}]
+    if not isinstance(content, list):
+        return [] if content is None else [{"text": str(content)}]
+    parts = []
+    for part in content:
+        if isinstance(part, str):
+            parts.append({"text": part})
+        elif isinstance(part, dict) and part.get("type") == "text":
+            parts.append({"text": part.get("text", "")})
+        elif isinstance(part, dict) and part.get("type") == "image_url":
+            image_url = part.get("image_url")
+            url = image_url.get("url", "") if isinstance(image_url, dict) else str(image_url or "")
+            inline = _inline_data(url)
+            if inline is not None:
+                parts.append(inline)
+    return parts
+
+
+def _extend(conversation: _Conversation, messages: List[Dict[str, Any]]) -> _Conversation:
+    system = list(conversation.system)
+    contents = list(conversation.contents)
+    for message in messages:
+        role = message.get("role")
+        parts = to_parts(message.get("content"))
+        if role == "system":
+            system.extend(part["text"] for part in parts if "text" in part)
+        elif role in ROLES and parts:
+            role = ROLES[role]
+            if contents and contents[-1]["role"] == role:
+                contents[-1] = {"role": role, "parts": contents[-1]["parts"] + parts}
+            else:
+                contents.append({"role": role, "parts": parts})
+    return _Conversation(conversation.messages + [_copy(message) for message in messages], tuple(system), contents)
+
+
+class ContentsConverter:
+    """
+    Converts message lists to ``(system_instruction, contents)``, remembering
+    the last conversion of up to ``cache_size`` conversations.
+    """
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        self.cache_size = cache_size
+        self._conversations: "OrderedDict[int, _Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.converted = 0
+
+    def convert(self, messages: List[Dict[str, Any]]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        The system instruction (None without system messages) and the
+        contents for ``messages``. A request with only system messages sends
+        them as the user turn, since Gemini needs at least one.
+        """
+        opening = hash(tuple(_message_key(m) for m in messages[:KEY_MESSAGES]))
+        conversation, seen, key = _EMPTY, 0, None
+        # The longest remembered prefix, trying the request itself first
+        for length in range(len(messages), max(len(messages) - MAX_NEW_MESSAGES - 1, 0), -1):
+            candidate = (opening, length, hash(_message_key(messages[length - 1])))
+            with self._lock:
+                cached = self._conversations.get(candidate)
+            if cached is not None and messages[:length] == cached.messages:
+                conversation, seen, key = cached, length, candidate
+                break
+
+        with self._lock:
+            if key is not None:
+                self.hits += 1
+                if key in self._conversations:
+                    self._conversations.move_to_end(key)
+            else:
+                self.misses += 1
+
+        if seen < len(messages):
+            conversation = _extend(conversation, messages[seen:])
+            extended = (opening, len(messages), hash(_message_key(messages[-1])))
+            with self._lock:
+                self.converted += len(messages) - seen
+                if self.cache_size > 0:
+                    # The longer list supersedes its prefix; keeping both would hold every length of a conversation
+                    if key is not None:
+                        self._conversations.pop(key, None)
+                    self._conversations[extended] = conversation
+                    self._conversations.move_to_end(extended)
+                    while len(self._conversations) > self.cache_size:
+                        self._conversations.popitem(last=False)
+
+        system_instruction = "\n\n".join(conversation.system) or None
+        if not conversation.contents and system_instruction:
+            return None, [{"role": "user", "parts": [{"text": system_instruction}]}]
+        return system_instruction, list(conversation.contents)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cached_conversations": len(self._conversations), "hits": self.hits, "misses": self.misses,
+                    "converted_messages": self.converted}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conversations.clear()
+            self.hits = self.misses = self.converted = 0
+
+
+def _flattened_prompt(messages: List[Dict[str, Any]]) -> str:
+    # The single prompt string the Gemini wrapper used to send, kept as the benchmark baseline
+    prompt = ""
+    for message in messages:
+        role = message.get("role", "")
+        if role in ("system", "user", "assistant"):
+            prompt += f"{role.capitalize()}: {message.get('content', '')}\n"
+    return prompt.strip()
+
+
+def benchmark(turns: int = 400, message_chars: int = 400, window: int = 20) -> Dict[str, float]:
+    """
+    Convert a conversation as it grows turn by turn, the way a chat client
+    sends it. Returns microseconds per call over the first and the last
+    ``window`` turns for the old flattened prompt, for native contents without
+    the cache, and with it, plus how often the cache converted each message.
+    """
+    text = ("The quick brown fox jumps over the lazy dog, then checks the invoice total. " * 8)[:message_chars]
+    conversation = [{"role": "system", "content": "You are a helpful assistant."}]
+    conversation += [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i}: {text}"} for i in range(turns)]
+    uncached = ContentsConverter(cache_size=0)
+    memoized = ContentsConverter()
+    results = {}
+    for name, convert in (("flattened", _flattened_prompt), ("uncached", uncached.convert),
+                          ("memoized", memoized.convert)):
+        elapsed = []
+        for i in range(2, len(conversation) + 1):
+            started = time.perf_counter()
+            convert(conversation[:i])
+            elapsed.append(time.perf_counter() - started)
+        results[f"{name}_first_us"] = sum(elapsed[:window]) / window * 1e6
+        results[f"{name}_last_us"] = sum(elapsed[-window:]) / window * 1e6
+    results["memoized_conversions_per_message"] = memoized.stats()["converted_messages"] / len(conversation)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    for name, value in benchmark(turns).items():
+        print(f"{name:<32}{value:>16,.2f}")
@@ -1,56 +1,94 @@
 import os
 import logging
+import threading
+import time
+from datetime import timedelta
+from collections import OrderedDict
 import google.generativeai as genai
 from .rest_logger import APILoggerREST
 from .config import GEMINI_API_KEY, PRICING
 from .base_wrapper import BaseAIWrapper
+from .gemini_contents import ContentsConverter
+from .tokens import count_text_tokens, usage_from_metadata
+from .metrics import observe_call
+from .prompt_cache import cache_tokens
+from .telemetry import payload_bytes
 from .types import LLMResponse, RateLimitError, AuthError, BadRequestError
 
 logger = logging.getLogger(__name__)
 
+# GenerativeModels kept per distinct system instruction
+SYSTEM_CLIENT_CACHE_SIZE = 32
+
+# Shortest system instruction worth an explicit context cache, in tokens
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("APILENS_GEMINI_CACHE_MIN_TOKENS", "4096"))
+# A context cache is replaced this long before it expires, in seconds
+CONTEXT_CACHE_REFRESH_MARGIN = 30
+
 class GeminiWrapper(BaseAIWrapper):
     """
     Wraps Google's Gemini API calls, logs usage, and calculates cost.
+
+    With ``context_cache_ttl`` (seconds or a timedelta), system instructions
+    of at least CONTEXT_CACHE_MIN_TOKENS are uploaded once as an explicit
+    context cache and reused until it expires. Cached tokens are billed at the
+    model's cached input rate; the cache's hourly storage fee is not logged.
     """
-    def __init__(self, model="gemini-pro", db_path=None, user_id=None, tenant_id=None, logger=None):
+    def __init__(self, model="gemini-pro", db_path=None, user_id=None, tenant_id=None, logger=None,
+                 context_cache_ttl=None):
         if model not in PRICING:
             raise ValueError(f"Unsupported model: {model}. Supported models: {list(PRICING.keys())}")
         if not GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY not set in environment")
-        super().__init__(provider_name="gemini", model=model, db_path=db_path, user_id=user_id, tenant_id=tenant_id)
-        self.logger = logger or APILoggerREST()
+        # Share the logger with BaseAIWrapper so streamed calls are logged to the same place
+        super().__init__(provider_name="gemini", model=model, db_path=db_path, user_id=user_id, tenant_id=tenant_id,
+                         logger=logger or APILoggerREST())
+        self.logger = self._logger
         genai.configure(api_key=GEMINI_API_KEY)
         self.client = genai.GenerativeModel(model_name=model)
-
-    def _calculate_cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
-        pricing = PRICING.get(model, {"input": 0.01, "output": 0.02})
-        return (prompt_tokens / 1000 * pricing["input"]) + (completion_tokens / 1000 * pricing["output"])
+        self._contents = ContentsConverter()
+        # (GenerativeModel, monotonic replace-by time) per system instruction, most recently used last
+        self._system_clients = OrderedDict()
+        self._system_clients_lock = threading.Lock()
+        if isinstance(context_cache_ttl, (int, float)):
+            context_cache_ttl = timedelta(seconds=context_cache_ttl)
+        self.context_cache_ttl = context_cache_ttl
 
     def _make_api_call(self, messages: list, **kwargs):
         """Make the actual API call to Gemini."""
-        prompt = self._convert_messages_to_prompt(messages)
-        return self.client.generate_content(prompt, generation_config=self._get_generation_config(**kwargs))
+        client, contents = self._request(messages)
+        return client.generate_content(contents, generation_config=self._get_generation_config(**kwargs))
 
     async def _make_async_api_call(self, messages: list, **kwargs):
         """Make an async API call to Gemini."""
-        prompt = self._convert_messages_to_prompt(messages)
-        return await self.client.generate_content_async(prompt, generation_config=self._get_generation_config(**kwargs))
+        client, contents = self._request(messages)
+        return await client.generate_content_async(contents, generation_config=self._get_generation_config(**kwargs))
 
-    def _extract_usage(self, response) -> dict:
-        """Extract token usage from Gemini's response."""
-        # For new Gemini models, use the prompt and the generated text for token estimation
+    def _make_stream_call(self, messages: list, **kwargs):
+        """Open a streaming call to Gemini."""
+        client, contents = self._request(messages)
         try:
-            text = response.candidates[0].content.parts[0].text
-        except Exception:
-            text = ""
-        # We don't have prompt text in the response, so just estimate from the input prompt
-        # This is a rough estimate, you may want to improve this if the SDK provides token counts
-        prompt_tokens = 0  # Not available in response
-        completion_tokens = len(text) // 4
-        return {
-            "prompt_tokens": prompt_tokens,
-            "completion_tokens": completion_tokens
-        }
+            return client.generate_content(contents, generation_config=self._get_generation_config(**kwargs), stream=True)
+        except Exception as e:
+            self._handle_error(e)
+
+    def _stream_usage(self, chunk) -> dict:
+        return usage_from_metadata(getattr(chunk, "usage_metadata", None)) or {}
+
+    def _extract_usage(self, response) -> dict:
+        """
+        Token usage from Gemini's ``usage_metadata``. Without it the completion
+        is counted here and the prompt (None) by ``_complete_usage``.
+        """
+        usage = usage_from_metadata(getattr(response, "usage_metadata", None)) or {"prompt_tokens": None,
+                                                                                   "completion_tokens": None}
+        if usage["completion_tokens"] is None:
+            try:
+                text = response.candidates[0].content.parts[0].text
+            except Exception:
+                text = ""
+            usage["completion_tokens"] = count_text_tokens(text, self.model)
+        return usage
 
     def _format_response(self, response) -> LLMResponse:
         """Format Gemini's response into a standard format."""
@@ -66,19 +104,40 @@ class GeminiWrapper(BaseAIWrapper):
             }]
         }
 
-    def _convert_messages_to_prompt(self, messages: list) -> str:
-        """Convert OpenAI-style messages to Gemini prompt format."""
-        prompt = ""
-        for msg in messages:
-            role = msg.get("role", "")
-            content = msg.get("content", "")
-            if role == "system":
-                prompt += f"System: {content}\n"
-            elif role == "user":
-                prompt += f"User: {content}\n"
-            elif role == "assistant":
-                prompt += f"Assistant: {content}\n"
-        return prompt.strip()
+    def _request(self, messages: list):
+        """The model to call for ``messages`` and their native Gemini contents."""
+        system_instruction, contents = self._contents.convert(messages)
+        return self._client_for(system_instruction), contents
+
+    def _client_for(self, system_instruction):
+        """``self.client``, or a model configured with ``system_instruction``."""
+        if system_instruction is None:
+            return self.client
+        with self._system_clients_lock:
+            cached = self._system_clients.get(system_instruction)
+            if cached is None or cached[1] <= time.monotonic():
+                cached = self._system_client(system_instruction)
+                self._system_clients[system_instruction] = cached
+                while len(self._system_clients) > SYSTEM_CLIENT_CACHE_SIZE:
+                    self._system_clients.popitem(last=False)
+            else:
+                self._system_clients.move_to_end(system_instruction)
+            return cached[0]
+
+    def _system_client(self, system_instruction):
+        """A model for ``system_instruction`` and when to replace it, served from a context cache if enabled."""
+        ttl = self.context_cache_ttl
+        if ttl is None or count_text_tokens(system_instruction, self.model) < CONTEXT_CACHE_MIN_TOKENS:
+            return genai.GenerativeModel(model_name=self.model, system_instruction=system_instruction), float("inf")
+        try:
+            context = genai.caching.CachedContent.create(model=self.model, system_instruction=system_instruction, ttl=ttl)
+        except Exception as e:
+            # Models without context caching, or a prefix under the provider's minimum
+            logger.warning(f"Gemini context cache unavailable for {self.model}, sending the system instruction: {e}")
+            self.context_cache_ttl = None
+            return genai.GenerativeModel(model_name=self.model, system_instruction=system_instruction), float("inf")
+        expires = time.monotonic() + max(ttl.total_seconds() - CONTEXT_CACHE_REFRESH_MARGIN, 0)
+        return genai.GenerativeModel.from_cached_content(cached_content=context), expires
 
     def _get_generation_config(self, **kwargs):
         """Get Gemini generation configuration."""
@@ -100,42 +159,31 @@ class GeminiWrapper(BaseAIWrapper):
             raise BadRequestError(f"Gemini invalid request: {error_str}")
         raise error
 
+    def _log_call(self, **record):
+        observe_call(record)
+        if self.logger:
+            self.logger.log_call(**record)
+
     def chat_completion(self, messages, **kwargs):
+        telemetry = self._start_telemetry(messages, kwargs)
         try:
-            # Convert messages to Gemini format
-            # Gemini expects a list of strings or a single string
-            prompt = self._convert_messages_to_prompt(messages)
+            # Native role-structured contents, with system messages as the system instruction
+            client, contents = self._request(messages)
             
             # Generate response
-            response = self.client.generate_content(prompt)
+            telemetry.start_provider()
+            response = client.generate_content(contents)
+            telemetry.end_provider()
+            telemetry.record_request_id(self._request_id(response))
             
-            # Calculate tokens (approximate)
-            prompt_tokens = len(prompt.split())  # Rough estimate
-            completion_tokens = len(response.text.split())  # Rough estimate
-            
-            # Calculate cost (Gemini Pro pricing as of 2024)
-            # $0.00025 per 1K characters for input
-            # $0.0005 per 1K characters for output
-            input_cost = (len(prompt) / 1000) * 0.00025
-            output_cost = (len(response.text) / 1000) * 0.0005
-            total_cost = input_cost + output_cost
-            
-            # Log the API call
-            if self.logger:
-                self.logger.log_call(
-                    provider="google",
-                    model=self.model,
-                    prompt_tokens=prompt_tokens,
-                    completion_tokens=completion_tokens,
-                    cost=total_cost,
-                    status="success",
-                    error_message=None,
-                    user_id=kwargs.get("user_id"),
-                    tenant_id=kwargs.get("tenant_id")
-                )
+            # Reported usage_metadata, or counted locally when it is missing
+            usage = self._complete_usage(messages, self._extract_usage(response))
+            prompt_tokens = usage["prompt_tokens"]
+            completion_tokens = usage["completion_tokens"]
+            total_cost = self._calculate_cost(self.model, prompt_tokens, completion_tokens, **cache_tokens(usage))
             
             # Return in a format similar to OpenAI's response
-            return {
+            result = {
                 "choices": [{
                     "message": {
                         "content": response.text,
@@ -149,22 +197,43 @@ class GeminiWrapper(BaseAIWrapper):
                 },
                 "cost": total_cost
             }
+            telemetry.response_bytes = payload_bytes(result)
+            telemetry.finish()
+            
+            # Log the API call
+            self._log_call(
+                provider="google",
+                model=self.model,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cost=total_cost,
+                status="success",
+                error_message=None,
+                user_id=kwargs.get("user_id"),
+                tenant_id=kwargs.get("tenant_id"),
+                **cache_tokens(usage),
+                **telemetry.as_log_fields()
+            )
+            
+            return result
             
         except Exception as e:
             logger.error(f"Error in Gemini API call: {str(e)}")
+            telemetry.end_provider()
+            telemetry.finish()
             
             # Log the error
-            if self.logger:
-                self.logger.log_call(
-                    provider="google",
-                    model=self.model,
-                    prompt_tokens=0,
-                    completion_tokens=0,
-                    cost=0,
-                    status="error",
-                    error_message=str(e),
-                    user_id=kwargs.get("user_id"),
-                    tenant_id=kwargs.get("tenant_id")
-                )
+            self._log_call(
+                provider="google",
+                model=self.model,
+                prompt_tokens=0,
+                completion_tokens=0,
+                cost=0,
+                status="error",
+                error_message=str(e),
+                user_id=kwargs.get("user_id"),
+                tenant_id=kwargs.get("tenant_id"),
+                **telemetry.as_log_fields()
+            )
             
             raise 
\ No newline at end of file
@@ -0,0 +1,376 @@
+"""
+In-process metrics, exposed in the Prometheus text format.
+
+Wrappers update the default ``REGISTRY`` once per logged call: request
+counts, latency histograms, tokens and cost per provider/model/status.
+Batch writers and connection pools register collectors that are read only
+at scrape time, so queue depth and pool usage cost nothing between scrapes.
+
+Serve the registry from ``log_server.py`` (``GET /metrics``), from your own
+web app with ``render_metrics()`` and ``CONTENT_TYPE``, or from a
+standalone thread with ``start_metrics_server(port)``. Set
+``APILENS_METRICS=0`` to stop the wrappers from recording anything.
+"""
+
+import bisect
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers fast cache-adjacent calls up to long generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+ENABLED = os.getenv("APILENS_METRICS", "1").lower() not in ("0", "false", "no")
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Mapping[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Family(NamedTuple):
+    """One metric as a collector reports it at scrape time: ``samples`` are (labels, value) pairs."""
+    name: str
+    kind: str
+    help: str
+    samples: List[Tuple[Dict[str, Any], float]]
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        # Children by the label values exactly as passed, so hot paths skip str()
+        self._lookup: Dict[Tuple[Any, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: Any):
+        """The child for one label combination, created on first use."""
+        child = self._lookup.get(values)
+        if child is None:
+            key = tuple(str(value) for value in values)
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+                self._lookup[values] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_dict(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._children.clear()
+            self._lookup.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(self._label_dict(key), child))
+        return lines
+
+    def _render_child(self, labels: Dict[str, str], child) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(child.get())}"]
+
+
+class _Value:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def get(self) -> float:
+        return self._value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only go up")
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _render_child(self, labels: Dict[str, str], child) -> List[str]:
+        counts, total = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            bucket_labels = dict(labels, le=_format_value(bound) if bound != float("inf") else "+Inf")
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    A set of metrics plus scrape-time collectors. ``counter``, ``gauge`` and
+    ``histogram`` return the existing metric when the name is already taken,
+    so modules can declare their metrics independently.
+    """
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help: str, labelnames: Sequence[str], **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Call ``collector`` on every scrape; it returns ``Family`` values read from live objects."""
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def clear(self) -> None:
+        """Reset every metric's values; collectors stay registered."""
+        for metric in list(self._metrics.values()):
+            metric.clear()
+
+    def render(self) -> str:
+        """The whole registry in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector {collector!r} failed: {e}")
+                continue
+            for family in families:
+                lines.append(f"# HELP {family.name} {family.help}")
+                lines.append(f"# TYPE {family.name} {family.kind}")
+                for labels, value in family.samples:
+                    lines.append(f"{family.name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+_CALL_LABELS = ("provider", "model", "status")
+
+REQUESTS = REGISTRY.counter("apilens_requests_total", "Logged LLM calls.", _CALL_LABELS)
+REQUEST_DURATION = REGISTRY.histogram(
+    "apilens_request_duration_seconds", "Whole-call latency, including retries and rate-limit waits.", _CALL_LABELS
+)
+PROVIDER_DURATION = REGISTRY.histogram(
+    "apilens_provider_duration_seconds", "Time spent in provider requests, without backoff.", _CALL_LABELS
+)
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "apilens_time_to_first_token_seconds", "Time to the first streamed token.", ("provider", "model")
+)
+RETRIES = REGISTRY.counter("apilens_retries_total", "Rate-limit retries.", ("provider", "model"))
+TOKENS = REGISTRY.counter("apilens_tokens_total",
+                          "Tokens billed, by type. cache_read and cache_write tokens are also counted as prompt.",
+                          ("provider", "model", "type"))
+COST = REGISTRY.counter("apilens_cost_dollars_total", "Estimated spend in US dollars.", ("provider", "model"))
+
+
+def observe_call(record: Mapping[str, Any]) -> None:
+    """
+    Count one logged call. ``record`` is the dict a wrapper hands to
+    ``log_call``; the telemetry fields are used when present.
+    """
+    if ENABLED:
+        _observe_group(record.get("provider"), record.get("model"), record.get("status"), (record,))
+
+
+def observe_calls(records: Iterable[Mapping[str, Any]]) -> None:
+    """``observe_call`` for many records, updating each counter once per provider/model/status."""
+    if not ENABLED:
+        return
+    groups: Dict[Tuple[Any, Any, Any], List[Mapping[str, Any]]] = {}
+    for record in records:
+        key = (record.get("provider"), record.get("model"), record.get("status"))
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [record]
+        else:
+            group.append(record)
+    for (provider, model, status), group in groups.items():
+        _observe_group(provider, model, status, group)
+
+
+def _observe_group(provider: Any, model: Any, status: Any, records: Sequence[Mapping[str, Any]]) -> None:
+    REQUESTS.labels(provider, model, status).inc(len(records))
+    request_duration = provider_duration = ttft_histogram = None
+    retries = prompt_tokens = completion_tokens = cache_read_tokens = cache_write_tokens = 0
+    cost = 0.0
+    for record in records:
+        latency = record.get("latency_ms")
+        if latency is not None:
+            request_duration = request_duration or REQUEST_DURATION.labels(provider, model, status)
+            request_duration.observe(latency / 1000)
+        provider_latency = record.get("provider_latency_ms")
+        if provider_latency is not None:
+            provider_duration = provider_duration or PROVIDER_DURATION.labels(provider, model, status)
+            provider_duration.observe(provider_latency / 1000)
+        ttft = record.get("ttft_ms")
+        if ttft is not None:
+            ttft_histogram = ttft_histogram or TIME_TO_FIRST_TOKEN.labels(provider, model)
+            ttft_histogram.observe(ttft / 1000)
+        retries += record.get("retry_count") or 0
+        prompt_tokens += record.get("prompt_tokens") or 0
+        completion_tokens += record.get("completion_tokens") or 0
+        cache_read_tokens += record.get("cache_read_tokens") or 0
+        cache_write_tokens += record.get("cache_write_tokens") or 0
+        cost += float(record.get("cost") or 0)
+    if retries:
+        RETRIES.labels(provider, model).inc(retries)
+    # Cache hits report the original usage but bill nothing
+    if status != "cached":
+        if prompt_tokens:
+            TOKENS.labels(provider, model, "prompt").inc(prompt_tokens)
+        if completion_tokens:
+            TOKENS.labels(provider, model, "completion").inc(completion_tokens)
+        if cache_read_tokens:
+            TOKENS.labels(provider, model, "cache_read").inc(cache_read_tokens)
+        if cache_write_tokens:
+            TOKENS.labels(provider, model, "cache_write").inc(cache_write_tokens)
+    if cost:
+        COST.labels(provider, model).inc(cost)
+
+
+def render_metrics(registry: Registry = REGISTRY) -> str:
+    """Text to return from a ``/metrics`` route in a host application, with ``CONTENT_TYPE``."""
+    return registry.render()
+
+
+def start_metrics_server(port: int = 9464, host: str = "0.0.0.0", registry: Registry = REGISTRY):
+    """
+    Serve ``registry`` at ``http://host:port/metrics`` from a daemon thread.
+    Returns the server; call ``shutdown()`` on it to stop. ``port=0`` picks a free port.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="apilens-metrics", daemon=True)
+    thread.start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,212 @@
+"""
+Versioned schema migrations for the Postgres log tables.
+
+Applied migrations are recorded in ``schema_migrations``. Writers call
+``ensure_schema`` before their first write; it checks the version once per
+process and DSN and caches the result, so constructing loggers and wrappers
+does no schema work. Apply migrations out of band with:
+
+    python -m apilens.migrations [--db-url URL] [--status] [--maintain-partitions]
+
+Set ``APILENS_AUTO_MIGRATE=0`` to make writers refuse an out-of-date schema
+instead of upgrading it themselves.
+
+``ensure_schema`` also creates upcoming api_logs partitions, at most once
+per ``APILENS_PARTITION_CHECK_INTERVAL`` seconds (default one day) per
+process and DSN, so writers that bypass the log server never run out of
+partitions.
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+from .partitions import ensure_partitions, maintain_partitions
+from .pool import get_pool
+from .recompute import ensure_recompute_jobs_table
+from .rollups import ensure_rollup_tables
+from .schema import (ensure_api_logs_cache_tokens, ensure_api_logs_indexes, ensure_api_logs_table,
+                     ensure_api_logs_telemetry)
+from .types import SchemaVersionError
+
+logger = logging.getLogger(__name__)
+
+AUTO_MIGRATE = os.getenv("APILENS_AUTO_MIGRATE", "1").lower() not in ("0", "false", "no")
+# Seconds between the upcoming-partition checks writers make from ensure_schema
+PARTITION_CHECK_INTERVAL = float(os.getenv("APILENS_PARTITION_CHECK_INTERVAL", "86400"))
+
+# Arbitrary key for the advisory lock that serialises concurrent migrators
+_LOCK_KEY = 0x6170696C656E73
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+
+
+def _create_api_logs(cur):
+    ensure_api_logs_table(cur)
+    # Tables created by older releases may be missing columns other writers insert
+    cur.execute("""
+        ALTER TABLE api_logs
+            ADD COLUMN IF NOT EXISTS created_at_ist TIMESTAMP WITH TIME ZONE DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'Asia/Kolkata'),
+            ADD COLUMN IF NOT EXISTS created_at_cst TIMESTAMP WITH TIME ZONE DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'America/Chicago'),
+            ADD COLUMN IF NOT EXISTS timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
+            ADD COLUMN IF NOT EXISTS formatted_cost TEXT
+    """)
+
+
+def _create_api_logs_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_api_logs_tenant ON api_logs (tenant_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_api_logs_time ON api_logs (timestamp)")
+    ensure_api_logs_indexes(cur)
+
+
+MIGRATIONS = [
+    Migration(1, "create api_logs", _create_api_logs),
+    Migration(2, "api_logs filter and keyset indexes", _create_api_logs_indexes),
+    Migration(3, "usage rollup tables", ensure_rollup_tables),
+    Migration(4, "api_logs latency and retry telemetry", ensure_api_logs_telemetry),
+    Migration(5, "cost recompute jobs", ensure_recompute_jobs_table),
+    Migration(6, "api_logs prompt cache token columns", ensure_api_logs_cache_tokens),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+_checked = set()
+_checked_lock = threading.Lock()
+# DSN -> time.monotonic() of the next upcoming-partition check
+_partitions_due = {}
+
+
+def _ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def current_version(cur) -> int:
+    """Highest applied migration, or 0 for a database that has never been migrated."""
+    cur.execute("SELECT to_regclass('schema_migrations')")
+    if cur.fetchone()[0] is None:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cur.fetchone()[0]
+
+
+def migrate(db_url: str = None, target: Optional[int] = None, pool=None) -> List[int]:
+    """
+    Apply pending migrations up to ``target`` (default: all) in one
+    transaction and return the versions applied. Concurrent callers are
+    serialised with an advisory lock, so every migration runs exactly once.
+    """
+    target = LATEST_VERSION if target is None else target
+    pool = pool or get_pool(db_url or os.getenv("POSTGRES_DB_URL"))
+    applied = []
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+        _ensure_version_table(cur)
+        version = current_version(cur)
+        for migration in MIGRATIONS:
+            if version < migration.version <= target:
+                logger.info(f"Applying migration {migration.version}: {migration.name}")
+                migration.apply(cur)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (migration.version, migration.name)
+                )
+                applied.append(migration.version)
+        conn.commit()
+        cur.close()
+    return applied
+
+
+def ensure_schema(db_url: str = None, auto_migrate: Optional[bool] = None, pool=None) -> None:
+    """
+    Make sure the schema is at ``LATEST_VERSION`` and upcoming partitions
+    exist. The version is only read by the first call per process and DSN,
+    and partitions are checked once per PARTITION_CHECK_INTERVAL; other
+    calls return immediately. Raises ``SchemaVersionError`` if the schema is
+    behind and auto-migration is off.
+    """
+    db_url = db_url or os.getenv("POSTGRES_DB_URL")
+    if db_url in _checked and time.monotonic() < _partitions_due.get(db_url, 0):
+        return
+    with _checked_lock:
+        pool = pool or get_pool(db_url)
+        if db_url not in _checked:
+            with pool.connection() as conn:
+                cur = conn.cursor()
+                version = current_version(cur)
+                cur.close()
+                if version >= LATEST_VERSION:
+                    _ensure_upcoming_partitions(conn, db_url)
+            if version < LATEST_VERSION:
+                if not (AUTO_MIGRATE if auto_migrate is None else auto_migrate):
+                    raise SchemaVersionError(
+                        f"Database schema is at version {version}, expected {LATEST_VERSION}. "
+                        f"Run `python -m apilens.migrations` to upgrade."
+                    )
+                migrate(db_url, pool=pool)
+            _checked.add(db_url)
+        if time.monotonic() >= _partitions_due.get(db_url, 0):
+            with pool.connection() as conn:
+                _ensure_upcoming_partitions(conn, db_url)
+
+
+def _ensure_upcoming_partitions(conn, db_url: str) -> None:
+    """Create upcoming api_logs partitions. A failure is logged and retried after the next interval."""
+    _partitions_due[db_url] = time.monotonic() + PARTITION_CHECK_INTERVAL
+    cur = conn.cursor()
+    try:
+        ensure_partitions(cur)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Creating upcoming api_logs partitions failed: {e}")
+    finally:
+        cur.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m apilens.migrations", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db-url", default=os.getenv("POSTGRES_DB_URL"), help="Postgres DSN (default: $POSTGRES_DB_URL)")
+    parser.add_argument("--target", type=int, help="Migrate up to this version instead of the latest")
+    parser.add_argument("--status", action="store_true", help="Print the current and latest versions and exit")
+    parser.add_argument("--maintain-partitions", action="store_true",
+                        help="Also create upcoming api_logs partitions and apply retention")
+    args = parser.parse_args(argv)
+    if not args.db_url:
+        parser.error("--db-url or POSTGRES_DB_URL is required")
+
+    pool = get_pool(args.db_url)
+    if args.status:
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            print(f"Schema version {current_version(cur)} (latest {LATEST_VERSION})")
+            cur.close()
+        return 0
+
+    applied = migrate(args.db_url, target=args.target, pool=pool)
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+    if args.maintain_partitions:
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            result = maintain_partitions(cur)
+            conn.commit()
+            cur.close()
+        print(f"Partitions created: {result['created']}, dropped: {result['dropped']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
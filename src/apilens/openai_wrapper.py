@@ -1,68 +1,82 @@
-import os
 import logging
 import openai
+from . import config
+from .metrics import observe_call
+from .pricing import calculate_cost
+from .prompt_cache import cache_tokens, openai_cache_usage
 from .rest_logger import APILoggerREST
+from .streaming import StreamAccumulator, delta_chunk, estimate_prompt_tokens, final_chunk, open_stream
+from .telemetry import CallTelemetry, payload_bytes
 from .types import LLMResponse, APILensError, RateLimitError, AuthError, BadRequestError
 
 logger = logging.getLogger(__name__)
 
 class OpenAIWrapper:
-    def __init__(self, model="gpt-4", logger=None):
+    def __init__(self, model="gpt-4", logger=None, max_retries=3, backoff_base=2.0):
         self.model_name = model
         self.logger = logger or APILoggerREST()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
         
         # Initialize OpenAI client
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        # Model pricing (cost per 1K tokens)
-        self.pricing = {
-            "gpt-4": {"input": 0.03, "output": 0.06},
-            "gpt-4-turbo-preview": {"input": 0.01, "output": 0.03},
-            "gpt-3.5-turbo": {"input": 0.0015, "output": 0.002}
-        }
-        
-        if model not in self.pricing:
-            logger.warning(f"Pricing not configured for model {model}. Using default pricing.")
-            self.pricing[model] = {"input": 0.01, "output": 0.02}  # Default pricing
+        self.client = openai.OpenAI(api_key=config.OPENAI_API_KEY)
+
+    def _log_call(self, **record):
+        observe_call(record)
+        if self.logger:
+            self.logger.log_call(**record)
 
     def chat_completion(self, messages, temperature=0.7, max_tokens=None):
+        telemetry = CallTelemetry()
+        telemetry.request_bytes = payload_bytes(
+            {"model": self.model_name, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        )
         try:
             # Make API call
+            telemetry.start_provider()
             response = self.client.chat.completions.create(
                 model=self.model_name,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens
             )
+            telemetry.end_provider()
+            telemetry.record_request_id(getattr(response, "_request_id", None))
             
             # Calculate cost
             prompt_tokens = response.usage.prompt_tokens
             completion_tokens = response.usage.completion_tokens
-            total_cost = (
-                (prompt_tokens / 1000 * self.pricing[self.model_name]["input"]) +
-                (completion_tokens / 1000 * self.pricing[self.model_name]["output"])
-            )
+            # Prompt tokens OpenAI served from its automatic prompt cache, billed at the cached rate
+            cached = openai_cache_usage(response.usage)
+            total_cost = self._calculate_cost(prompt_tokens, completion_tokens, **cached)
+            
+            result = {
+                "choices": [{"message": {"content": response.choices[0].message.content}}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": response.usage.total_tokens,
+                    **cached
+                },
+                "cost": total_cost
+            }
+            telemetry.response_bytes = payload_bytes(result)
+            telemetry.finish()
             
             # Log the API call
-            self.logger.log_call(
+            self._log_call(
                 provider="openai",
                 model=self.model_name,
                 prompt_tokens=prompt_tokens,
                 completion_tokens=completion_tokens,
                 cost=total_cost,
                 status="success",
-                error_message=None
+                error_message=None,
+                **cache_tokens(cached),
+                **telemetry.as_log_fields()
             )
             
-            return {
-                "choices": [{"message": {"content": response.choices[0].message.content}}],
-                "usage": {
-                    "prompt_tokens": prompt_tokens,
-                    "completion_tokens": completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                },
-                "cost": total_cost
-            }
+            return result
             
         except openai.RateLimitError as e:
             logger.error(f"Rate limit exceeded: {str(e)}")
@@ -77,4 +91,79 @@ class OpenAIWrapper:
             logger.error(f"Unexpected error: {str(e)}")
             raise APILensError(str(e))
 
+    def _calculate_cost(self, prompt_tokens, completion_tokens, cache_read_tokens=None):
+        return calculate_cost(self.model_name, prompt_tokens, completion_tokens, cached_tokens=cache_read_tokens or 0)
+
+    def chat_completion_stream(self, messages, temperature=0.7, max_tokens=None):
+        """
+        Stream a chat completion. Yields ``{"choices": [{"delta": {"content": ...}}]}``
+        chunks, then a final chunk with the full message, usage, cost and
+        stream timings. Opening the stream is retried on rate limits. One row
+        is logged when the stream ends, with partial usage if it is cancelled.
+        """
+        telemetry = CallTelemetry()
+        telemetry.request_bytes = payload_bytes(
+            {"model": self.model_name, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        )
+        accumulator = StreamAccumulator(started=telemetry.started)
+        stream = None
+        status, error = "cancelled", None
+        try:
+            telemetry.start_provider()
+            stream = open_stream(
+                lambda: self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                ),
+                retry_on=(openai.RateLimitError,),
+                max_retries=self.max_retries,
+                backoff_base=self.backoff_base,
+                telemetry=telemetry
+            )
+            telemetry.record_request_id(getattr(stream, "_request_id", None))
+            for chunk in stream:
+                if chunk.usage is not None:
+                    accumulator.update_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens,
+                                             **openai_cache_usage(chunk.usage))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    accumulator.add(chunk.choices[0].delta.content)
+                    yield delta_chunk(chunk.choices[0].delta.content)
+            status = "success"
+        except Exception as e:
+            logger.error(f"Error in OpenAI stream: {str(e)}")
+            status, error = "failed", str(e)
+            if isinstance(e, openai.RateLimitError):
+                raise RateLimitError(str(e))
+            raise
+        finally:
+            accumulator.finish()
+            if stream is not None and status != "success":
+                stream.close()
+            if status == "failed" and accumulator.first_token_at is None:
+                usage = {"prompt_tokens": 0, "completion_tokens": 0}
+            else:
+                usage = accumulator.usage(estimate_prompt_tokens(messages, self.model_name), self.model_name)
+            total_cost = self._calculate_cost(usage["prompt_tokens"], usage["completion_tokens"],
+                                              usage.get("cache_read_tokens"))
+            telemetry.end_provider()
+            telemetry.ttft = accumulator.metrics(usage["completion_tokens"])["ttft"]
+            telemetry.response_bytes = len(accumulator.text.encode("utf-8"))
+            telemetry.finish()
+            self._log_call(
+                provider="openai",
+                model=self.model_name,
+                prompt_tokens=usage["prompt_tokens"],
+                completion_tokens=usage["completion_tokens"],
+                cost=total_cost,
+                status=status,
+                error_message=error,
+                **cache_tokens(usage),
+                **telemetry.as_log_fields()
+            )
+        yield final_chunk(accumulator, usage, total_cost)
+
 # Future: AnthropicWrapper
@@ -0,0 +1,299 @@
+"""
+Process-wide Postgres connection pooling shared by every APILens writer and reader.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import psycopg2
+from psycopg2 import extensions
+
+from .metrics import REGISTRY, Family
+from .types import PoolTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections to one database.
+
+    Connections are opened lazily up to ``max_size``. Idle connections are
+    health-checked with ``SELECT 1`` when they have not been used for
+    ``health_check_interval`` seconds, and closed once they have been idle for
+    ``max_idle`` seconds as long as at least ``min_size`` stay open. Callers
+    that cannot get a connection within ``acquire_timeout`` seconds get a
+    ``PoolTimeoutError``.
+    """
+    def __init__(
+        self,
+        dsn: Optional[str] = None,
+        min_size: int = 1,
+        max_size: int = 10,
+        acquire_timeout: float = 30.0,
+        max_idle: float = 300.0,
+        health_check_interval: float = 30.0,
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle: List[Tuple[object, float]] = []  # (conn, released_at), most recent last
+        self._in_use = 0
+        self._opening = 0
+        self._closed = False
+        self._prepared: Dict[int, set] = {}
+
+        self._stats = {
+            "created": 0,
+            "closed": 0,
+            "evicted": 0,
+            "health_check_failures": 0,
+            "acquisitions": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    @property
+    def size(self) -> int:
+        return self._in_use + len(self._idle) + self._opening
+
+    def acquire(self, timeout: Optional[float] = None):
+        """Check out a connection, waiting up to ``timeout`` seconds for one to free up."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                self._evict_idle_locked()
+                while not self._idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {timeout}s waiting for a database connection "
+                            f"(pool size {self.max_size})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    self._in_use += 1
+                else:
+                    conn, released_at = None, None
+                    self._opening += 1
+
+            if conn is None:
+                try:
+                    conn = psycopg2.connect(self.dsn)
+                except Exception:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._in_use += 1
+                    self._stats["created"] += 1
+            elif time.monotonic() - released_at >= self.health_check_interval and not self._is_healthy(conn):
+                with self._cond:
+                    self._stats["health_check_failures"] += 1
+                self.release(conn, discard=True)
+                continue
+
+            self._record_acquisition(time.monotonic() - started, waited)
+            return conn
+
+    def release(self, conn, discard: bool = False) -> None:
+        """Return a connection to the pool, or close it if ``discard`` or unusable."""
+        if not discard:
+            discard = not self._reset(conn)
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._close_conn(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        Context manager that checks out a connection and returns it afterwards.
+        The transaction is rolled back if the block raises; committing is up to the caller.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except Exception:
+            discard = False
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            self.release(conn, discard=discard)
+            raise
+        else:
+            self.release(conn)
+
+    def prepare(self, conn, name: str, statement: str) -> None:
+        """
+        Create the server-side prepared statement ``name`` on a pooled
+        connection unless it already exists there; run it with ``EXECUTE name (...)``.
+        """
+        prepared = self._prepared.setdefault(id(conn), set())
+        if name not in prepared:
+            cur = conn.cursor()
+            cur.execute(f"PREPARE {name} AS {statement}")
+            cur.close()
+            prepared.add(name)
+
+    def stats(self) -> Dict[str, float]:
+        """Pool usage and acquisition metrics."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(size=self.size, in_use=self._in_use, idle=len(self._idle),
+                         min_size=self.min_size, max_size=self.max_size)
+        stats["wait_time_avg"] = stats["wait_time_total"] / stats["acquisitions"] if stats["acquisitions"] else 0.0
+        return stats
+
+    def close(self) -> None:
+        """Close every idle connection; checked-out ones are closed when released."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close_conn(conn)
+            self._cond.notify_all()
+
+    def _record_acquisition(self, wait_time: float, waited: bool) -> None:
+        with self._cond:
+            self._stats["acquisitions"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_time_total"] += wait_time
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+
+    def _evict_idle_locked(self) -> None:
+        now = time.monotonic()
+        # Oldest idle connections sit at the front of the list.
+        while self._idle and self.size > self.min_size and now - self._idle[0][1] >= self.max_idle:
+            conn, _ = self._idle.pop(0)
+            self._close_conn(conn)
+            self._stats["evicted"] += 1
+
+    def _close_conn(self, conn) -> None:
+        self._prepared.pop(id(conn), None)
+        self._stats["closed"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _reset(self, conn) -> bool:
+        """Leave the connection idle-in-no-transaction. Returns False if it is unusable."""
+        try:
+            if conn.closed:
+                return False
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding unhealthy pooled connection: {e}")
+            return False
+
+
+_pools: Dict[Optional[str], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn: Optional[str] = None, **kwargs) -> ConnectionPool:
+    """
+    Return the process-wide pool for ``dsn`` (default: ``POSTGRES_DB_URL``),
+    creating it on first use. ``kwargs`` only apply when the pool is created;
+    sizes default to ``APILENS_POOL_MIN_SIZE``/``APILENS_POOL_MAX_SIZE``.
+    """
+    dsn = dsn or os.getenv("POSTGRES_DB_URL")
+    pool = _pools.get(dsn)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None:
+            kwargs.setdefault("min_size", int(os.getenv("APILENS_POOL_MIN_SIZE", "1")))
+            kwargs.setdefault("max_size", int(os.getenv("APILENS_POOL_MAX_SIZE", "10")))
+            pool = ConnectionPool(dsn, **kwargs)
+            _pools[dsn] = pool
+        return pool
+
+
+def _pool_label(dsn: Optional[str]) -> str:
+    """Host and database of a DSN, without credentials, to label pool metrics."""
+    if not dsn:
+        return "default"
+    if "://" in dsn:
+        parsed = urlparse(dsn)
+        return f"{parsed.hostname or ''}{parsed.path}"
+    params = dict(part.split("=", 1) for part in dsn.split() if "=" in part)
+    return f"{params.get('host', '')}/{params.get('dbname', '')}"
+
+
+def _collect_metrics():
+    """Usage of every process-wide pool, read at scrape time."""
+    connections, max_size, acquisitions, waits, timeouts, wait_time = [], [], [], [], [], []
+    for dsn, pool in list(_pools.items()):
+        stats = pool.stats()
+        label = {"pool": _pool_label(dsn)}
+        connections.append((dict(label, state="in_use"), stats["in_use"]))
+        connections.append((dict(label, state="idle"), stats["idle"]))
+        max_size.append((label, stats["max_size"]))
+        acquisitions.append((label, stats["acquisitions"]))
+        waits.append((label, stats["waits"]))
+        timeouts.append((label, stats["timeouts"]))
+        wait_time.append((label, stats["wait_time_total"]))
+    return [
+        Family("apilens_pool_connections", "gauge", "Open pooled connections, by state.", connections),
+        Family("apilens_pool_max_size", "gauge", "Largest number of connections the pool will open.", max_size),
+        Family("apilens_pool_acquisitions_total", "counter", "Connections checked out of the pool.", acquisitions),
+        Family("apilens_pool_waits_total", "counter", "Checkouts that had to wait for a free connection.", waits),
+        Family("apilens_pool_timeouts_total", "counter", "Checkouts that timed out.", timeouts),
+        Family("apilens_pool_wait_seconds_total", "counter", "Time spent waiting to check out connections.", wait_time),
+    ]
+
+
+REGISTRY.register_collector(_collect_metrics)
+
+
+def close_all_pools() -> None:
+    """Close and forget every process-wide pool."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
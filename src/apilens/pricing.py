@@ -0,0 +1,374 @@
+"""
+Model prices and cost calculation.
+
+Every wrapper prices calls through one ``PricingEngine``. The engine has
+these features:
+
+- Model names resolve to a priced model by exact name, by alias, or by the
+  longest priced prefix that ends at a ``-``, ``@`` or ``:``. That way
+  ``gpt-4-0613`` is priced as ``gpt-4`` and ``claude-3-opus-20240229`` as
+  ``claude-3-opus``, but ``gpt-4o`` is never priced as ``gpt-4``.
+  Resolutions are memoized.
+- A model can have several prices, each effective from a date. Calls are
+  priced at the price in effect when they were made. The current price is
+  cached until the next one takes effect, so pricing a call is a couple of
+  dict lookups.
+- Prompt tokens read from or written to a provider's prompt cache can have
+  their own rates (``cached_input``, ``cache_write``).
+- ``cost_many`` prices millions of rows at once with NumPy, when it is
+  installed, for recomputing historical costs.
+
+Prices are USD per 1M tokens. Set ``APILENS_PRICES_FILE`` to a JSON file
+mapping model names to a price, or to a list of dated prices, to add or
+override entries::
+
+    {"gpt-4o": [{"input": 2.5, "output": 10, "cached_input": 1.25, "effective_from": "2024-10-02"}]}
+
+``config.PRICING`` remains available as a read-only view of current prices
+per 1K tokens.
+"""
+
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections.abc import Mapping
+from datetime import date, datetime, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Timestamp = Union[None, str, date, datetime, int, float]
+
+# Characters that may follow a priced prefix in a longer model name
+_SEPARATORS = frozenset("-@:")
+
+# Offline batch APIs bill at half the synchronous price. Their results are
+# logged with these statuses, so they can be told apart from synchronous calls.
+BATCH_DISCOUNT = 0.5
+BATCH_STATUSES = {"success": "batch_success", "failed": "batch_failed"}
+
+
+class ModelPrice(NamedTuple):
+    """USD per 1M tokens. Cache rates default to the input rate when a model has none."""
+    input: float
+    output: float
+    cached_input: Optional[float] = None
+    cache_write: Optional[float] = None
+    effective_from: Optional[str] = None
+
+    def cost(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+             cache_write_tokens: int = 0) -> float:
+        """
+        Cost of one call. ``prompt_tokens`` includes any ``cached_tokens`` read
+        from the prompt cache and ``cache_write_tokens`` written to it.
+        """
+        cached_rate = self.input if self.cached_input is None else self.cached_input
+        write_rate = self.input if self.cache_write is None else self.cache_write
+        uncached = prompt_tokens - cached_tokens - cache_write_tokens
+        return (uncached * self.input + cached_tokens * cached_rate + cache_write_tokens * write_rate
+                + completion_tokens * self.output) / 1_000_000
+
+    def rates(self) -> Tuple[float, float, float, float]:
+        """Input, cached input, cache write and output rates, with defaults applied."""
+        return (self.input, self.input if self.cached_input is None else self.cached_input,
+                self.input if self.cache_write is None else self.cache_write, self.output)
+
+
+PRICES: Dict[str, Tuple[ModelPrice, ...]] = {
+    # OpenAI
+    "gpt-4": (ModelPrice(30.0, 60.0),),
+    "gpt-4-32k": (ModelPrice(60.0, 120.0),),
+    "gpt-4-turbo": (ModelPrice(10.0, 30.0),),
+    "gpt-4o": (ModelPrice(5.0, 15.0),
+               ModelPrice(2.5, 10.0, cached_input=1.25, effective_from="2024-10-02")),
+    "gpt-4o-mini": (ModelPrice(0.15, 0.6, cached_input=0.075),),
+    "gpt-3.5-turbo": (ModelPrice(1.5, 2.0),),
+    "o1": (ModelPrice(15.0, 60.0, cached_input=7.5),),
+    "o3-mini": (ModelPrice(1.1, 4.4, cached_input=0.55),),
+
+    # Anthropic: cache reads cost 10% of input, cache writes 125%
+    "claude-3-opus": (ModelPrice(15.0, 75.0, cached_input=1.5, cache_write=18.75),),
+    "claude-3-sonnet": (ModelPrice(3.0, 15.0, cached_input=0.3, cache_write=3.75),),
+    "claude-3-haiku": (ModelPrice(0.25, 1.25, cached_input=0.03, cache_write=0.3),),
+    "claude-3-5-sonnet": (ModelPrice(3.0, 15.0, cached_input=0.3, cache_write=3.75),),
+    "claude-3-5-haiku": (ModelPrice(0.8, 4.0, cached_input=0.08, cache_write=1.0),),
+    "claude-3-7-sonnet": (ModelPrice(3.0, 15.0, cached_input=0.3, cache_write=3.75),),
+
+    # Google
+    "gemini-pro": (ModelPrice(0.25, 0.5),),
+    "gemini-pro-vision": (ModelPrice(0.25, 0.5),),
+    "gemini-1.5-flash": (ModelPrice(0.075, 0.3, cached_input=0.01875),),
+    "gemini-1.5-pro": (ModelPrice(1.25, 5.0, cached_input=0.3125),),
+    "gemini-2.0-flash": (ModelPrice(0.1, 0.4, cached_input=0.025),),
+    "gemini-2.5-pro": (ModelPrice(1.25, 10.0, cached_input=0.31),),
+}
+
+# Names that are not a priced name followed by a suffix
+ALIASES: Dict[str, str] = {
+    "chatgpt-4o-latest": "gpt-4o",
+    "gemini-1.0-pro": "gemini-pro",
+}
+
+
+def to_epoch(value: Timestamp) -> float:
+    """Seconds since the epoch. Dates are midnight UTC; naive datetimes are taken to be UTC."""
+    if value is None:
+        return float("-inf")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class PricingEngine:
+    """Resolves model names and prices calls. Safe to share between threads."""
+
+    def __init__(self, prices: Optional[Dict[str, Sequence[ModelPrice]]] = None,
+                 aliases: Optional[Dict[str, str]] = None):
+        self._lock = threading.Lock()
+        # model -> prices and their effective epochs, both sorted by effective date
+        self._prices: Dict[str, List[ModelPrice]] = {}
+        self._effective: Dict[str, List[float]] = {}
+        self._aliases: Dict[str, str] = dict(ALIASES if aliases is None else aliases)
+        self._resolved: Dict[str, Optional[str]] = {}
+        # model -> (current price, epoch at which the next price takes effect)
+        self._current: Dict[str, Tuple[Optional[ModelPrice], float]] = {}
+        self._warned = set()
+        for model, entries in (PRICES if prices is None else prices).items():
+            for price in entries:
+                self.set_price(model, price)
+
+    def set_price(self, model: str, price: ModelPrice) -> None:
+        """Add a price for ``model``, replacing any with the same effective date."""
+        epoch = to_epoch(price.effective_from)
+        with self._lock:
+            prices = self._prices.setdefault(model, [])
+            effective = self._effective.setdefault(model, [])
+            i = bisect.bisect_left(effective, epoch)
+            if i < len(effective) and effective[i] == epoch:
+                prices[i] = price
+            else:
+                effective.insert(i, epoch)
+                prices.insert(i, price)
+            self._resolved = {}
+            self._current = {}
+
+    def set_alias(self, alias: str, model: str) -> None:
+        with self._lock:
+            self._aliases[alias] = model
+            self._resolved = {}
+
+    def models(self) -> List[str]:
+        """Every priced model name."""
+        return sorted(self._prices)
+
+    def resolve(self, model: Optional[str]) -> Optional[str]:
+        """The priced model that ``model`` refers to, or None if it has no price."""
+        try:
+            return self._resolved[model]
+        except KeyError:
+            pass
+        resolved = None
+        if model:
+            name = self._aliases.get(model, model)
+            if name in self._prices:
+                resolved = name
+            else:
+                # Longest prefix first, cut only at separators
+                for i in range(len(name) - 1, 0, -1):
+                    if name[i] in _SEPARATORS:
+                        prefix = self._aliases.get(name[:i], name[:i])
+                        if prefix in self._prices:
+                            resolved = prefix
+                            break
+        self._resolved[model] = resolved
+        return resolved
+
+    def price(self, model: Optional[str], at: Timestamp = None) -> Optional[ModelPrice]:
+        """The price of ``model`` in effect at ``at`` (default: now), or None if it has none."""
+        resolved = self.resolve(model)
+        if resolved is None:
+            return None
+        if at is not None:
+            return self._price_at(resolved, to_epoch(at))
+        now = time.time()
+        current = self._current.get(resolved)
+        if current is None or now >= current[1]:
+            effective = self._effective[resolved]
+            i = bisect.bisect_right(effective, now)
+            price = self._prices[resolved][i - 1] if i else None
+            current = self._current[resolved] = (price, effective[i] if i < len(effective) else float("inf"))
+        return current[0]
+
+    def price_history(self, model: Optional[str]) -> List[Tuple[float, float, ModelPrice]]:
+        """``(valid_from, valid_until, price)`` for every price of ``model``, as epoch seconds (±inf when open)."""
+        resolved = self.resolve(model)
+        if resolved is None:
+            return []
+        effective = self._effective[resolved]
+        bounds = effective[1:] + [float("inf")]
+        return list(zip(effective, bounds, self._prices[resolved]))
+
+    def _price_at(self, model: str, epoch: float) -> Optional[ModelPrice]:
+        i = bisect.bisect_right(self._effective[model], epoch)
+        return self._prices[model][i - 1] if i else None
+
+    def cost(self, model: Optional[str], prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+             cache_write_tokens: int = 0, at: Timestamp = None) -> float:
+        """
+        Cost of one call in USD. Models without a price cost 0.0, with a
+        warning the first time each one is seen, rather than a guessed price.
+        """
+        price = self.price(model, at)
+        if price is None:
+            if model not in self._warned:
+                self._warned.add(model)
+                logger.warning(f"No price configured for model {model!r}; its cost is recorded as 0")
+            return 0.0
+        return price.cost(prompt_tokens, completion_tokens, cached_tokens, cache_write_tokens)
+
+    def cost_many(self, models: Sequence[Optional[str]], prompt_tokens: Sequence[int],
+                  completion_tokens: Sequence[int], cached_tokens: Optional[Sequence[int]] = None,
+                  cache_write_tokens: Optional[Sequence[int]] = None, timestamps: Optional[Sequence[Timestamp]] = None):
+        """
+        Cost of many calls, priced at their ``timestamps`` (default: current
+        prices). Timestamps are fastest as epoch seconds. Rows for models without
+        a price are NaN. Returns a NumPy array, or a list without NumPy.
+        """
+        np = _numpy()
+        if np is None:
+            return self._cost_many_python(models, prompt_tokens, completion_tokens, cached_tokens,
+                                          cache_write_tokens, timestamps)
+        prompt = np.asarray(prompt_tokens, dtype=np.float64)
+        completion = np.asarray(completion_tokens, dtype=np.float64)
+        cached = np.zeros_like(prompt) if cached_tokens is None else np.asarray(cached_tokens, dtype=np.float64)
+        written = np.zeros_like(prompt) if cache_write_tokens is None else np.asarray(cache_write_tokens, dtype=np.float64)
+
+        # Factorize model names with a dict, which is far cheaper than sorting them
+        codes: Dict[Optional[str], int] = {}
+        inverse = np.fromiter((codes.setdefault(model, len(codes)) for model in models), dtype=np.intp,
+                              count=len(prompt))
+        names = list(codes)
+        if timestamps is None:
+            table = np.array([self._rates(self.price(name)) for name in names]).reshape(-1, 4)
+            rates = table[inverse]
+        else:
+            rates = np.full((len(prompt), 4), np.nan)
+            epochs = self._epoch_array(np, timestamps)
+            # Rows grouped by model, so each model's dated prices are searched once for all its rows
+            order = np.argsort(inverse, kind="stable")
+            bounds = np.cumsum(np.bincount(inverse, minlength=len(names)))[:-1]
+            for name, rows in zip(names, np.split(order, bounds)):
+                resolved = self.resolve(name)
+                if resolved is None or not len(rows):
+                    continue
+                table = np.array([price.rates() for price in self._prices[resolved]])
+                idx = np.searchsorted(np.array(self._effective[resolved]), epochs[rows], side="right") - 1
+                priced = idx >= 0
+                rates[rows[priced]] = table[idx[priced]]
+        return ((prompt - cached - written) * rates[:, 0] + cached * rates[:, 1] + written * rates[:, 2]
+                + completion * rates[:, 3]) / 1_000_000
+
+    @staticmethod
+    def _rates(price: Optional[ModelPrice]) -> Tuple[float, ...]:
+        return price.rates() if price is not None else (math.nan,) * 4
+
+    @staticmethod
+    def _epoch_array(np, timestamps):
+        values = np.asarray(timestamps)
+        if values.dtype.kind in "iuf":
+            return values.astype(np.float64)
+        if values.dtype.kind == "M":
+            return values.astype("datetime64[us]").astype(np.int64) / 1_000_000
+        return np.array([to_epoch(value) for value in timestamps], dtype=np.float64)
+
+    def _cost_many_python(self, models, prompt_tokens, completion_tokens, cached_tokens, cache_write_tokens,
+                          timestamps) -> List[float]:
+        n = len(prompt_tokens)
+        cached_tokens = cached_tokens if cached_tokens is not None else [0] * n
+        cache_write_tokens = cache_write_tokens if cache_write_tokens is not None else [0] * n
+        timestamps = timestamps if timestamps is not None else [None] * n
+        costs = []
+        for row in zip(models, prompt_tokens, completion_tokens, cached_tokens, cache_write_tokens, timestamps):
+            price = self.price(row[0], row[5])
+            costs.append(math.nan if price is None else price.cost(*row[1:5]))
+        return costs
+
+
+_engine: Optional[PricingEngine] = None
+_engine_lock = threading.Lock()
+
+
+def load_prices(path: str) -> Dict[str, List[ModelPrice]]:
+    """Prices from a JSON file in the format described in the module docstring."""
+    with open(path) as f:
+        data = json.load(f)
+    return {model: [ModelPrice(**entry) for entry in (entries if isinstance(entries, list) else [entries])]
+            for model, entries in data.items()}
+
+
+def get_engine() -> PricingEngine:
+    """The process-wide engine: built-in prices plus any from ``APILENS_PRICES_FILE``."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = PricingEngine()
+                path = os.getenv("APILENS_PRICES_FILE")
+                if path:
+                    for model, prices in load_prices(path).items():
+                        for price in prices:
+                            engine.set_price(model, price)
+                _engine = engine
+    return _engine
+
+
+def set_engine(engine: Optional[PricingEngine]) -> None:
+    """Replace the process-wide engine; None rebuilds the default on next use."""
+    global _engine
+    _engine = engine
+
+
+def resolve_model(model: Optional[str]) -> Optional[str]:
+    return get_engine().resolve(model)
+
+
+def calculate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+                   cache_write_tokens: int = 0, at: Timestamp = None) -> float:
+    return get_engine().cost(model, prompt_tokens, completion_tokens, cached_tokens, cache_write_tokens, at)
+
+
+class PricingView(Mapping):
+    """Current prices per 1K tokens as ``{model: {"input": ..., "output": ...}}``, resolving aliases."""
+
+    def __getitem__(self, model: str) -> Dict[str, float]:
+        price = get_engine().price(model)
+        if price is None:
+            raise KeyError(model)
+        return {"input": price.input / 1000, "output": price.output / 1000}
+
+    def __contains__(self, model: object) -> bool:
+        return isinstance(model, str) and get_engine().price(model) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(get_engine().models())
+
+    def __len__(self) -> int:
+        return len(get_engine().models())
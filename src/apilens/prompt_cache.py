@@ -0,0 +1,110 @@
+"""
+Provider prompt caching.
+
+Anthropic caches a prompt prefix only where the request marks it with a
+``cache_control`` breakpoint. ``add_cache_breakpoints`` places them
+automatically on the parts of a prompt that are resent unchanged:
+
+- the system prompt, when it is long enough to cache on its own,
+- the last message, so the next turn of the conversation can read
+  everything before it from the cache,
+- the previous user turn, where the last request wrote its cache entry.
+
+Prefixes shorter than the model's minimum are never cached, so they are not
+marked. Requests that already carry a breakpoint are left as they are.
+
+OpenAI caches long prompts automatically and reports the cached part.
+Gemini caches explicitly created contexts (see ``GeminiWrapper``'s
+``context_cache_ttl``). Each provider's usage is reduced to
+``cache_read_tokens`` and ``cache_write_tokens``. They are logged in their
+own api_logs columns and priced at the model's cached input and cache write
+rates. ``prompt_tokens`` always includes both.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from .tokens import count_message_tokens, count_text_tokens
+
+# Shortest prefix Anthropic will cache, in tokens
+MIN_CACHE_TOKENS = int(os.getenv("APILENS_PROMPT_CACHE_MIN_TOKENS", "1024"))
+MODEL_MIN_CACHE_TOKENS = {"claude-3-haiku": 2048, "claude-3-5-haiku": 2048}
+
+EPHEMERAL = {"type": "ephemeral"}
+
+# api_logs columns written from cache usage, in insert order
+CACHE_TOKEN_FIELDS = ("cache_read_tokens", "cache_write_tokens")
+
+
+def min_cache_tokens(model: Optional[str]) -> int:
+    for prefix, tokens in MODEL_MIN_CACHE_TOKENS.items():
+        if model and model.startswith(prefix):
+            return max(tokens, MIN_CACHE_TOKENS)
+    return MIN_CACHE_TOKENS
+
+
+def _has_breakpoint(content: Any) -> bool:
+    return isinstance(content, list) and any(isinstance(block, dict) and "cache_control" in block
+                                             for block in content)
+
+
+def _marked(content: Any) -> Any:
+    """``content`` as content blocks, with a breakpoint on the last one."""
+    if isinstance(content, str):
+        return [{"type": "text", "text": content, "cache_control": EPHEMERAL}]
+    if not isinstance(content, list) or not content or not isinstance(content[-1], dict):
+        return content
+    return content[:-1] + [dict(content[-1], cache_control=EPHEMERAL)]
+
+
+def add_cache_breakpoints(system: Any, messages: List[Dict[str, Any]],
+                          model: Optional[str]) -> Tuple[Any, List[Dict[str, Any]]]:
+    """
+    ``system`` and ``messages`` for an Anthropic request, with breakpoints on
+    their long stable prefixes. The caller's messages are not modified.
+    """
+    if _has_breakpoint(system) or any(_has_breakpoint(m.get("content")) for m in messages):
+        return system, messages
+    minimum = min_cache_tokens(model)
+    system_tokens = count_text_tokens(system, model) if isinstance(system, str) else 0
+    if system_tokens >= minimum:
+        system = _marked(system)
+
+    # The last message, then the user turn before it: with the system prompt, three breakpoints at most
+    user_turns = [i for i, message in enumerate(messages[:-1]) if message.get("role") == "user"]
+    marked = list(messages)
+    for index in ([len(messages) - 1] + user_turns[-1:] if messages else []):
+        if system_tokens + count_message_tokens(messages[:index + 1], model) >= minimum:
+            marked[index] = dict(messages[index], content=_marked(messages[index].get("content")))
+    return system, marked
+
+
+def _count(usage: Any, name: str) -> Optional[int]:
+    value = getattr(usage, name, None)
+    return value if isinstance(value, int) else None
+
+
+def anthropic_usage(usage: Any) -> Dict[str, int]:
+    """
+    Prompt and cache token counts from an Anthropic ``usage``. Anthropic's
+    ``input_tokens`` excludes cache reads and writes, so they are added back.
+    """
+    result = {"prompt_tokens": usage.input_tokens}
+    for field, name in (("cache_read_tokens", "cache_read_input_tokens"),
+                        ("cache_write_tokens", "cache_creation_input_tokens")):
+        value = _count(usage, name)
+        if value is not None:
+            result[field] = value
+            result["prompt_tokens"] += value
+    return result
+
+
+def openai_cache_usage(usage: Any) -> Dict[str, int]:
+    """``cache_read_tokens`` from an OpenAI ``usage``, if it reports them. They are part of ``prompt_tokens``."""
+    cached = _count(getattr(usage, "prompt_tokens_details", None), "cached_tokens")
+    return {} if cached is None else {"cache_read_tokens": cached}
+
+
+def cache_tokens(usage: Dict[str, Any]) -> Dict[str, Optional[int]]:
+    """The CACHE_TOKEN_FIELDS of a usage dict, None where the provider reported nothing."""
+    return {field: usage.get(field) for field in CACHE_TOKEN_FIELDS}
@@ -0,0 +1,216 @@
+"""
+Client-side rate limiting per provider and model.
+
+Each (provider, model) pair gets a requests-per-minute bucket and a
+tokens-per-minute bucket, shared by every wrapper in the process. Callers
+reserve capacity before a request, using an estimated token count, and
+sleep until the reservation is covered. When the real usage comes back the
+estimate is corrected, so the next caller sees the true balance.
+
+Limits are set with ``set_rate_limit`` or the ``APILENS_RATE_LIMITS``
+environment variable, a JSON object keyed by ``provider`` or
+``provider/model``:
+
+    APILENS_RATE_LIMITS='{"openai/gpt-4": {"rpm": 500, "tpm": 30000}, "anthropic": {"rpm": 50}}'
+
+A provider-wide entry applies to each of its models separately.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from .tokens import count_message_tokens
+
+
+class TokenBucket:
+    """
+    Bucket holding up to ``capacity`` units that refills at ``capacity`` per
+    ``period`` seconds. ``reserve`` may drive the balance negative. The caller
+    then waits until the refill covers the debt, which keeps reservations
+    first come, first served without holding a lock while sleeping.
+    """
+    def __init__(self, capacity: float, period: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Debit ``amount`` and return the seconds until the balance is non-negative."""
+        self._refill()
+        # A single request larger than the whole budget would otherwise never fit
+        self._tokens -= min(amount, self.capacity)
+        return max(0.0, -self._tokens / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """Credit (positive) or debit (negative) ``amount`` after the fact."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+    def wait_time(self, amount: float = 0.0) -> float:
+        """Seconds a reservation of ``amount`` would wait right now."""
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self._tokens) / self.rate)
+
+
+class Reservation(NamedTuple):
+    limiter: "RateLimiter"
+    tokens: int
+    wait: float
+
+
+class RateLimiter:
+    """RPM and TPM budgets for one provider/model, safe to share across threads and event loops."""
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(rpm, clock=clock) if rpm else None
+        self._tokens = TokenBucket(tpm, clock=clock) if tpm else None
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def reserve(self, tokens: int) -> Reservation:
+        """Reserve one request and ``tokens`` tokens; the caller must wait ``Reservation.wait`` seconds."""
+        with self._lock:
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.reserve(tokens))
+            self.requests += 1
+            if wait > 0:
+                self.waits += 1
+                self.wait_time_total += wait
+                self.wait_time_max = max(self.wait_time_max, wait)
+        return Reservation(self, tokens, wait)
+
+    def acquire(self, tokens: int) -> Reservation:
+        reservation = self.reserve(tokens)
+        if reservation.wait > 0:
+            time.sleep(reservation.wait)
+        return reservation
+
+    async def acquire_async(self, tokens: int) -> Reservation:
+        reservation = self.reserve(tokens)
+        if reservation.wait > 0:
+            try:
+                await asyncio.sleep(reservation.wait)
+            except asyncio.CancelledError:
+                # The request will never be made, so its place in the budget goes to the next caller
+                self.release(reservation)
+                raise
+        return reservation
+
+    def reconcile(self, reservation: Reservation, actual_tokens: int) -> None:
+        """Replace the reservation's token estimate with the real usage."""
+        if self._tokens is None:
+            return
+        with self._lock:
+            # reserve() debits at most the bucket's capacity, so refunds and charges are capped the same way
+            capacity = self._tokens.capacity
+            self._tokens.adjust(min(reservation.tokens, capacity) - min(actual_tokens, capacity))
+
+    def release(self, reservation: Reservation) -> None:
+        """Give back a reservation whose request was never made."""
+        with self._lock:
+            if self._requests is not None:
+                self._requests.adjust(1)
+            if self._tokens is not None:
+                self._tokens.adjust(min(reservation.tokens, self._tokens.capacity))
+
+    def wait_time(self, tokens: int = 0) -> float:
+        """How long a request for ``tokens`` tokens would wait if made now."""
+        with self._lock:
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.wait_time(1))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.wait_time(tokens))
+            return wait
+
+    def stats(self) -> Dict[str, float]:
+        current_wait = self.wait_time()
+        with self._lock:
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "requests": self.requests,
+                "waits": self.waits,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_max": self.wait_time_max,
+                "current_wait": current_wait,
+            }
+
+
+_limits: Dict[str, Dict[str, float]] = {}
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def _load_env_limits() -> None:
+    raw = os.getenv("APILENS_RATE_LIMITS")
+    if raw:
+        for key, limits in json.loads(raw).items():
+            _limits.setdefault(key, {k: float(v) for k, v in limits.items() if k in ("rpm", "tpm")})
+
+
+_load_env_limits()
+
+
+def set_rate_limit(provider: str, model: Optional[str] = None, rpm: Optional[float] = None,
+                   tpm: Optional[float] = None) -> None:
+    """Set RPM/TPM budgets for a provider's models (or one model); None removes the limit."""
+    key = f"{provider}/{model}" if model else provider
+    with _registry_lock:
+        if rpm or tpm:
+            _limits[key] = {"rpm": rpm, "tpm": tpm}
+        else:
+            _limits.pop(key, None)
+        # Rebuild affected limiters on next use
+        for limiter_key in [k for k in _limiters if k[0] == provider and (model is None or k[1] == model)]:
+            del _limiters[limiter_key]
+
+
+def get_limiter(provider: str, model: str) -> Optional[RateLimiter]:
+    """The process-wide limiter for ``provider``/``model``, or None when it has no limits."""
+    limiter = _limiters.get((provider, model))
+    if limiter is not None or not _limits:
+        return limiter
+    with _registry_lock:
+        limiter = _limiters.get((provider, model))
+        if limiter is None:
+            limits = _limits.get(f"{provider}/{model}") or _limits.get(provider)
+            if not limits:
+                return None
+            limiter = _limiters[(provider, model)] = RateLimiter(limits.get("rpm"), limits.get("tpm"))
+        return limiter
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, float]]:
+    """Stats for every active limiter, keyed by ``provider/model``."""
+    return {f"{provider}/{model}": limiter.stats() for (provider, model), limiter in list(_limiters.items())}
+
+
+# Completion budget assumed when a request does not set max_tokens
+DEFAULT_COMPLETION_ESTIMATE = int(os.getenv("APILENS_RATE_LIMIT_COMPLETION_ESTIMATE", "256"))
+
+
+def estimate_tokens(messages, max_tokens: Optional[int] = None, model: Optional[str] = None) -> int:
+    """Pre-call token count: the prompt as counted for ``model`` plus the completion budget."""
+    return count_message_tokens(messages, model) + (max_tokens or DEFAULT_COMPLETION_ESTIMATE)
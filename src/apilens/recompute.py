@@ -0,0 +1,301 @@
+"""
+Recompute the stored cost of historical api_logs rows after a price change.
+
+A job covers a time range and, optionally, a set of models. It runs in
+chunks of ``chunk`` time. Each chunk is one transaction with one set-based
+UPDATE statement that:
+
+- reprices the chunk's rows inside Postgres against the current prices from
+  ``apilens.pricing``, passed in as a small table of dated prices, with
+  prompt cache reads and writes at their own rates,
+- writes only the rows whose cost actually changes,
+- adds the difference to the minute, hour and day rollups.
+
+After each chunk the job's checkpoint moves forward in the same
+transaction, so an interrupted job resumes where it stopped. Re-running a
+chunk changes nothing. Cache hits and coalesced calls are logged at zero
+cost on purpose and are never repriced. Offline batch results
+(``batch_success``/``batch_failed``) are repriced at the batch discount::
+
+    python -m apilens.recompute --start 2024-05-01 --end 2024-06-01 [--model gpt-4o ...]
+    python -m apilens.recompute --resume 7
+    python -m apilens.recompute --status 7
+
+The log server runs the same jobs via ``POST /costs/recompute``.
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .pool import get_pool
+from .pricing import BATCH_DISCOUNT, BATCH_STATUSES, PricingEngine, get_engine
+from .rollups import DIMENSIONS, ROLLUP_TABLES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK = timedelta(minutes=int(os.getenv("APILENS_RECOMPUTE_CHUNK_MINUTES", "60")))
+
+# Logged at zero cost on purpose: nothing was billed for them
+UNBILLED_STATUSES = ["cached", "coalesced"]
+
+# Cost of an api_logs row ``a`` at the prices ``p``. Offline batch results keep their discount.
+REPRICED_COST = f"""
+    ((COALESCE(a.prompt_tokens, 0) - COALESCE(a.cache_read_tokens, 0) - COALESCE(a.cache_write_tokens, 0)) * p.input
+     + COALESCE(a.cache_read_tokens, 0) * p.cached_input
+     + COALESCE(a.cache_write_tokens, 0) * p.cache_write
+     + COALESCE(a.completion_tokens, 0) * p.output) / CAST(1000000 AS DOUBLE PRECISION)
+    * CASE WHEN a.status IN ({", ".join(f"'{status}'" for status in BATCH_STATUSES.values())}) THEN {BATCH_DISCOUNT}
+           ELSE 1 END"""
+
+JOB_COLUMNS = ("id", "start_time", "end_time", "models", "checkpoint", "rows_updated", "cost_delta", "status",
+               "error_message", "created_at", "updated_at")
+
+RECOMPUTE_JOBS_TABLE = """
+    CREATE TABLE IF NOT EXISTS cost_recompute_jobs (
+        id BIGSERIAL PRIMARY KEY,
+        start_time TIMESTAMPTZ NOT NULL,
+        end_time TIMESTAMPTZ NOT NULL,
+        models TEXT[],
+        checkpoint TIMESTAMPTZ NOT NULL,
+        rows_updated BIGINT NOT NULL DEFAULT 0,
+        cost_delta DOUBLE PRECISION NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'pending',
+        error_message TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+def ensure_recompute_jobs_table(cur) -> None:
+    cur.execute(RECOMPUTE_JOBS_TABLE)
+
+
+def _rollup_delta(granularity: str) -> str:
+    """CTE adding each changed row's cost difference to one rollup table, in key order."""
+    dimensions = ", ".join(DIMENSIONS)
+    coalesced = ", ".join(f"COALESCE({d}, '')" for d in DIMENSIONS)
+    keys = ", ".join(str(i) for i in range(1, len(DIMENSIONS) + 2))
+    return f"""
+    rollup_{granularity} AS (
+        INSERT INTO {ROLLUP_TABLES[granularity]} AS r (bucket, {dimensions}, cost)
+        SELECT date_trunc('{granularity}', logged_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', {coalesced}, SUM(delta)
+        FROM changed
+        GROUP BY {keys}
+        ORDER BY {keys}
+        ON CONFLICT (bucket, {dimensions}) DO UPDATE SET cost = r.cost + EXCLUDED.cost
+    )"""
+
+
+RECOMPUTE_STATEMENT = f"""
+    WITH prices (model, valid_from, valid_until, input, cached_input, cache_write, output) AS (
+        SELECT * FROM unnest(%(models)s::text[], %(valid_from)s::float8[], %(valid_until)s::float8[],
+                             %(input)s::float8[], %(cached_input)s::float8[], %(cache_write)s::float8[],
+                             %(output)s::float8[])
+    ),
+    repriced AS (
+        SELECT a.id, a.timestamp, a.cost AS old_cost, {REPRICED_COST} AS new_cost
+        FROM api_logs a
+        JOIN prices p ON a.model = p.model
+            AND a.timestamp >= to_timestamp(p.valid_from) AND a.timestamp < to_timestamp(p.valid_until)
+        WHERE a.timestamp >= %(start)s AND a.timestamp < %(end)s
+            AND COALESCE(a.status, '') <> ALL(%(unbilled)s::text[])
+    ),
+    changed AS (
+        UPDATE api_logs a
+        SET cost = r.new_cost, formatted_cost = round(r.new_cost::numeric, 6)::text
+        FROM repriced r
+        WHERE a.id = r.id AND a.timestamp = r.timestamp
+            AND a.timestamp >= %(start)s AND a.timestamp < %(end)s
+            AND a.cost IS DISTINCT FROM r.new_cost
+        RETURNING a.timestamp AS logged_at, {", ".join(f"a.{d}" for d in DIMENSIONS)}, r.new_cost - COALESCE(r.old_cost, 0) AS delta
+    ),{",".join(_rollup_delta(granularity) for granularity in ROLLUP_TABLES)}
+    SELECT count(*), COALESCE(SUM(delta), 0) FROM changed
+"""
+
+
+def price_table(cur, start: datetime, end: datetime, models: Optional[Sequence[str]] = None,
+                engine: Optional[PricingEngine] = None) -> Tuple[Dict[str, list], List[str]]:
+    """
+    Dated prices for every model name logged between ``start`` and ``end``,
+    as the columns of RECOMPUTE_STATEMENT's price table. ``models`` limits
+    them to those names or names that resolve to them. Also returns the
+    matching names that have no price; their rows are left alone.
+    """
+    engine = engine or get_engine()
+    cur.execute("SELECT DISTINCT model FROM api_logs WHERE timestamp >= %s AND timestamp < %s AND model IS NOT NULL",
+                (start, end))
+    names = sorted(row[0] for row in cur.fetchall())
+    if models:
+        wanted = set(models)
+        names = [name for name in names if name in wanted or engine.resolve(name) in wanted]
+    table = {"models": [], "valid_from": [], "valid_until": [], "input": [], "cached_input": [], "cache_write": [],
+             "output": []}
+    unpriced = []
+    for name in names:
+        history = engine.price_history(name)
+        if not history:
+            unpriced.append(name)
+        for valid_from, valid_until, price in history:
+            table["models"].append(name)
+            table["valid_from"].append(valid_from)
+            table["valid_until"].append(valid_until)
+            for column, rate in zip(("input", "cached_input", "cache_write", "output"), price.rates()):
+                table[column].append(rate)
+    return table, unpriced
+
+
+def recompute_chunk(cur, start: datetime, end: datetime, prices: Dict[str, list]) -> Tuple[int, float]:
+    """Reprice rows logged in [start, end) and update the rollups. Returns (rows changed, total cost change)."""
+    if not prices["models"]:
+        return 0, 0.0
+    cur.execute(RECOMPUTE_STATEMENT, dict(prices, start=start, end=end, unbilled=UNBILLED_STATUSES))
+    rows, delta = cur.fetchone()
+    return rows, float(delta)
+
+
+def create_job(cur, start: datetime, end: datetime, models: Optional[Sequence[str]] = None) -> int:
+    if start >= end:
+        raise ValueError(f"start ({start}) must be before end ({end})")
+    cur.execute(
+        "INSERT INTO cost_recompute_jobs (start_time, end_time, models, checkpoint) VALUES (%s, %s, %s, %s) RETURNING id",
+        (start, end, list(models) if models else None, start)
+    )
+    return cur.fetchone()[0]
+
+
+def get_job(cur, job_id: int) -> Optional[Dict[str, Any]]:
+    cur.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM cost_recompute_jobs WHERE id = %s", (job_id,))
+    row = cur.fetchone()
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+
+def _set_status(pool, job_id: int, status: str, error_message: Optional[str] = None) -> None:
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE cost_recompute_jobs SET status = %s, error_message = %s, updated_at = now() WHERE id = %s",
+                    (status, error_message, job_id))
+        conn.commit()
+        cur.close()
+
+
+def run_job(job_id: int, db_url: Optional[str] = None, pool=None, chunk: timedelta = DEFAULT_CHUNK,
+            engine: Optional[PricingEngine] = None) -> Dict[str, Any]:
+    """
+    Run or resume job ``job_id`` from its checkpoint until it is done, and
+    return the finished job. Each chunk locks the job row and re-reads the
+    checkpoint first, so two runners of the same job never repeat a chunk.
+    """
+    pool = pool or get_pool(db_url or os.getenv("POSTGRES_DB_URL"))
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        job = get_job(cur, job_id)
+        if job is None:
+            raise ValueError(f"No cost recompute job {job_id}")
+        prices, unpriced = price_table(cur, job["checkpoint"], job["end_time"], job["models"], engine)
+        cur.close()
+    if unpriced:
+        logger.warning(f"Cost recompute job {job_id}: no price for {unpriced}; their rows keep their cost")
+    _set_status(pool, job_id, "running")
+    try:
+        while True:
+            with pool.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT checkpoint, end_time FROM cost_recompute_jobs WHERE id = %s FOR UPDATE", (job_id,))
+                checkpoint, end = cur.fetchone()
+                if checkpoint >= end:
+                    conn.rollback()
+                    cur.close()
+                    break
+                chunk_end = min(checkpoint + chunk, end)
+                rows, delta = recompute_chunk(cur, checkpoint, chunk_end, prices)
+                cur.execute(
+                    """
+                    UPDATE cost_recompute_jobs
+                    SET checkpoint = %s, rows_updated = rows_updated + %s, cost_delta = cost_delta + %s, updated_at = now()
+                    WHERE id = %s
+                    """,
+                    (chunk_end, rows, delta, job_id)
+                )
+                conn.commit()
+                cur.close()
+            logger.info(f"Cost recompute job {job_id}: {checkpoint} to {chunk_end}, {rows} rows changed by {delta:+.6f}")
+    except Exception as e:
+        logger.error(f"Cost recompute job {job_id} failed: {e}")
+        _set_status(pool, job_id, "failed", str(e))
+        raise
+    _set_status(pool, job_id, "done")
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        job = get_job(cur, job_id)
+        cur.close()
+    return job
+
+
+def recompute_costs(start: datetime, end: datetime, models: Optional[Sequence[str]] = None,
+                    db_url: Optional[str] = None, pool=None, chunk: timedelta = DEFAULT_CHUNK,
+                    engine: Optional[PricingEngine] = None) -> Dict[str, Any]:
+    """Create a job for ``start`` to ``end`` and run it to completion."""
+    pool = pool or get_pool(db_url or os.getenv("POSTGRES_DB_URL"))
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        job_id = create_job(cur, start, end, models)
+        conn.commit()
+        cur.close()
+    return run_job(job_id, pool=pool, chunk=chunk, engine=engine)
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _print_job(job: Dict[str, Any]) -> None:
+    print(f"Job {job['id']} {job['status']}: {job['start_time']} to {job['end_time']}, "
+          f"models {job['models'] or 'all'}, checkpoint {job['checkpoint']}, "
+          f"{job['rows_updated']} rows changed, cost {job['cost_delta']:+.6f}")
+    if job["error_message"]:
+        print(f"Error: {job['error_message']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m apilens.recompute", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db-url", default=os.getenv("POSTGRES_DB_URL"), help="Postgres DSN (default: $POSTGRES_DB_URL)")
+    parser.add_argument("--start", type=_parse_time, help="Start of the range, inclusive (ISO 8601, UTC if no offset)")
+    parser.add_argument("--end", type=_parse_time, help="End of the range, exclusive")
+    parser.add_argument("--model", action="append", dest="models", help="Only this model; may be repeated")
+    parser.add_argument("--chunk-minutes", type=int, default=int(DEFAULT_CHUNK.total_seconds() // 60),
+                        help="Time covered by each transaction")
+    parser.add_argument("--resume", type=int, metavar="JOB_ID", help="Continue an interrupted job")
+    parser.add_argument("--status", type=int, metavar="JOB_ID", help="Print a job's progress and exit")
+    args = parser.parse_args(argv)
+    if not args.db_url:
+        parser.error("--db-url or POSTGRES_DB_URL is required")
+    if args.status is None and args.resume is None and not (args.start and args.end):
+        parser.error("--start and --end are required unless --resume or --status is given")
+
+    pool = get_pool(args.db_url)
+    if args.status is not None:
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            job = get_job(cur, args.status)
+            cur.close()
+        if job is None:
+            parser.error(f"No cost recompute job {args.status}")
+        _print_job(job)
+        return 0
+
+    chunk = timedelta(minutes=args.chunk_minutes)
+    if args.resume is not None:
+        job = run_job(args.resume, pool=pool, chunk=chunk)
+    else:
+        job = recompute_costs(args.start, args.end, args.models, pool=pool, chunk=chunk)
+    _print_job(job)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
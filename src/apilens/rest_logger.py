@@ -1,78 +1,185 @@
-import os
 import logging
-import psycopg2
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 from datetime import datetime
 import pytz
+from . import config
+from .batch_writer import BatchWriter
+from .migrations import ensure_schema
+from .pool import get_pool
+from .rollups import apply_rollups
+from .prompt_cache import CACHE_TOKEN_FIELDS
+from .telemetry import TELEMETRY_FIELDS
 
 logger = logging.getLogger(__name__)
 
+_INSERT_COLUMNS = f"""
+    timestamp, created_at_ist, created_at_cst,
+    provider, model, prompt_tokens,
+    completion_tokens, cost, status, error_message,
+    user_id, tenant_id, {", ".join(TELEMETRY_FIELDS + CACHE_TOKEN_FIELDS)}
+"""
+
+_INSERT_PARAMS = 12 + len(TELEMETRY_FIELDS) + len(CACHE_TOKEN_FIELDS)
+
+_INSERT_STATEMENT = f"""
+    INSERT INTO api_logs ({_INSERT_COLUMNS})
+    VALUES ({", ".join(f"${i}" for i in range(1, _INSERT_PARAMS + 1))})
+    RETURNING id
+"""
+
+
+def _rollup_record(row):
+    """Rollup record (see ``rollups.RollupRecord``) for a row from ``_build_row``."""
+    (timestamp, _, _, provider, model, prompt_tokens, completion_tokens,
+     cost, status, _, user_id, tenant_id) = row[:12]
+    return (timestamp, tenant_id, user_id, provider, model, status, prompt_tokens, completion_tokens, cost)
+
+
 class APILoggerREST:
-    def __init__(self, api_url=None):
-        self.api_url = api_url or os.getenv("POSTGRES_DB_URL")
+    """
+    Writes API call logs to Postgres.
+
+    By default every ``log_call`` inserts and commits on the caller's thread.
+    With ``non_blocking=True`` records are queued and written in multi-row
+    INSERTs by a background flusher (see ``BatchWriter``); call ``flush()`` or
+    ``close()`` before shutdown to make sure everything is written.
+    """
+    def __init__(
+        self,
+        api_url=None,
+        non_blocking=False,
+        batch_size=100,
+        flush_interval=1.0,
+        max_queue_size=10000,
+        overflow="block",
+        spill_path=None,
+    ):
+        self.api_url = api_url or config.POSTGRES_DB_URL
+        self._pool = get_pool(self.api_url)
         logger.info(f"Initialized APILoggerREST with URL: {self.api_url}")
-        # Ensure the table exists with both timestamps
-        from .db import DB
-        DB.create_api_logs_table(self.api_url)
+        # The schema is checked on the first write, once per process
+
+        self._writer = None
+        if non_blocking:
+            self._writer = BatchWriter(
+                self._insert_rows,
+                batch_size=batch_size,
+                flush_interval=flush_interval,
+                max_queue_size=max_queue_size,
+                overflow=overflow,
+                spill_path=spill_path,
+            )
+
+    def _build_row(self, log_data):
+        # Stamp the row when it is logged, not when a queued batch is flushed,
+        # so the raw log and its rollup buckets agree
+        now = datetime.now(pytz.UTC)
+        ist_time = now.astimezone(pytz.timezone('Asia/Kolkata'))
+        cst_time = now.astimezone(pytz.timezone('America/Chicago'))
+        return (
+            now, ist_time, cst_time,
+            log_data.get("provider"),
+            log_data.get("model"),
+            log_data.get("prompt_tokens"),
+            log_data.get("completion_tokens"),
+            log_data.get("cost"),
+            log_data.get("status"),
+            log_data.get("error_message"),
+            log_data.get("user_id"),
+            log_data.get("tenant_id"),
+            *(log_data.get(field) for field in TELEMETRY_FIELDS + CACHE_TOKEN_FIELDS)
+        )
 
     def log_call(self, **log_data):
-        print("Attempting to log to DB...", flush=True)
         # Ensure user_id and tenant_id are strings, not None
         if log_data.get("user_id") is None:
             log_data["user_id"] = ""
         if log_data.get("tenant_id") is None:
             log_data["tenant_id"] = ""
 
+        if self._writer is not None:
+            # Non-blocking mode: no row id is available until the batch is written
+            self._writer.put(self._build_row(log_data))
+            return None
+
+        logger.debug("Writing log to the database")
         try:
-            print("Connecting to DB with URL:", self.api_url, flush=True)
-            # Connect to PostgreSQL
-            conn = psycopg2.connect(self.api_url)
-            cur = conn.cursor()
-            print("Connected to DB, inserting log...", flush=True)
-
-            # Get current time in both IST and CST
-            now = datetime.now(pytz.UTC)
-            ist_time = now.astimezone(pytz.timezone('Asia/Kolkata'))
-            cst_time = now.astimezone(pytz.timezone('America/Chicago'))
-
-            # Insert the log data with both timestamps
-            cur.execute("""
-                INSERT INTO api_logs (
-                    created_at_ist, created_at_cst,
-                    provider, model, prompt_tokens, 
-                    completion_tokens, cost, status, error_message, 
-                    user_id, tenant_id
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                ) RETURNING id
-            """, (
-                ist_time, cst_time,
-                log_data.get("provider"),
-                log_data.get("model"),
-                log_data.get("prompt_tokens"),
-                log_data.get("completion_tokens"),
-                log_data.get("cost"),
-                log_data.get("status"),
-                log_data.get("error_message"),
-                log_data.get("user_id"),
-                log_data.get("tenant_id")
-            ))
-
-            # Get the inserted ID
-            log_id = cur.fetchone()[0]
-            print("Log inserted with ID:", log_id, flush=True)
-
-            # Commit the transaction
-            conn.commit()
+            ensure_schema(self.api_url, pool=self._pool)
+            with self._pool.connection() as conn:
+                cur = conn.cursor()
+                # Reuse the connection's server-side prepared INSERT
+                self._pool.prepare(conn, "apilens_insert_log", _INSERT_STATEMENT)
+                row = self._build_row(log_data)
+                cur.execute(
+                    f"EXECUTE apilens_insert_log ({', '.join(['%s'] * _INSERT_PARAMS)})",
+                    row
+                )
 
-            # Close the connection
-            cur.close()
-            conn.close()
+                # Get the inserted ID
+                log_id = cur.fetchone()[0]
+                apply_rollups(cur, [_rollup_record(row)])
+
+                # Commit the transaction
+                conn.commit()
+                cur.close()
 
             logger.debug(f"Log sent successfully. ID: {log_id}")
             return log_id
 
         except Exception as e:
-            print("DB LOGGING ERROR:", e, flush=True)
             logger.error(f"Failed to send log: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
+
+    def log_calls(self, records):
+        """Write many logs in one multi-row INSERT (or queue them in non-blocking mode)."""
+        rows = []
+        for log_data in records:
+            if log_data.get("user_id") is None:
+                log_data["user_id"] = ""
+            if log_data.get("tenant_id") is None:
+                log_data["tenant_id"] = ""
+            rows.append(self._build_row(log_data))
+        if self._writer is not None:
+            for row in rows:
+                self._writer.put(row)
+            return
+        try:
+            self._insert_rows(rows)
+        except Exception as e:
+            logger.error(f"Failed to send {len(rows)} logs: {str(e)}")
+
+    def _insert_rows(self, rows):
+        """Write a batch of rows with a single multi-row INSERT."""
+        ensure_schema(self.api_url, pool=self._pool)
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    f"INSERT INTO api_logs ({_INSERT_COLUMNS}) VALUES %s",
+                    rows,
+                    page_size=len(rows)
+                )
+                apply_rollups(cur, [_rollup_record(row) for row in rows])
+            conn.commit()
+
+    @property
+    def non_blocking(self):
+        """True when log_call only enqueues, so it is safe to call from an event loop."""
+        return self._writer is not None
+
+    def flush(self, timeout=None):
+        """Block until all queued logs are written (non-blocking mode only)."""
+        if self._writer is None:
+            return True
+        return self._writer.flush(timeout)
+
+    def close(self, timeout=10.0):
+        """Flush queued logs and stop the background flusher."""
+        if self._writer is not None:
+            self._writer.close(timeout)
+
+    def stats(self):
+        """Queued/flushed/dropped counters for the background flusher."""
+        if self._writer is None:
+            return {}
+        return self._writer.stats()
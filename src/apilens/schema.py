@@ -0,0 +1,110 @@
+"""
+Shared DDL for the api_logs table.
+"""
+
+from .partitions import ensure_partitions
+
+# New databases get api_logs range-partitioned on timestamp (see partitions.py).
+# The primary key has to include the partition key. Columns are the union of
+# what every writer inserts. Tables created before partitioning are left as they are.
+API_LOGS_TABLE = """
+    CREATE TABLE IF NOT EXISTS api_logs (
+        id BIGSERIAL,
+        timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
+        created_at_ist TIMESTAMP WITH TIME ZONE DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'Asia/Kolkata'),
+        created_at_cst TIMESTAMP WITH TIME ZONE DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'America/Chicago'),
+        provider TEXT,
+        model TEXT,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        cost DOUBLE PRECISION,
+        formatted_cost TEXT,
+        status TEXT,
+        error_message TEXT,
+        user_id TEXT,
+        tenant_id TEXT,
+        latency_ms DOUBLE PRECISION,
+        provider_latency_ms DOUBLE PRECISION,
+        ttft_ms DOUBLE PRECISION,
+        retry_count INTEGER,
+        backoff_ms DOUBLE PRECISION,
+        request_bytes INTEGER,
+        response_bytes INTEGER,
+        request_id TEXT,
+        cache_read_tokens INTEGER,
+        cache_write_tokens INTEGER,
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp)
+"""
+
+# Composite indexes for the GET /logs filters. Each leads with an equality
+# filter and ends in the (timestamp, id) keyset order, so a page is an index
+# range scan no matter how deep it is. Filters that are combined use whichever
+# index is most selective and check the rest on the fetched rows.
+API_LOGS_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_time_id ON api_logs (timestamp DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_provider_model_time ON api_logs (provider, model, timestamp DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_model_time ON api_logs (model, timestamp DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_status_time ON api_logs (status, timestamp DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_user_time ON api_logs (user_id, timestamp DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_tenant_time ON api_logs (tenant_id, timestamp DESC, id DESC)",
+]
+
+
+# Telemetry columns added to existing tables by migration 4 (see telemetry.py)
+API_LOGS_TELEMETRY_COLUMNS = {
+    "latency_ms": "DOUBLE PRECISION",
+    "provider_latency_ms": "DOUBLE PRECISION",
+    "ttft_ms": "DOUBLE PRECISION",
+    "retry_count": "INTEGER",
+    "backoff_ms": "DOUBLE PRECISION",
+    "request_bytes": "INTEGER",
+    "response_bytes": "INTEGER",
+    "request_id": "TEXT",
+}
+
+# Indexes for finding slow calls overall, per model and per tenant, and for looking up a request id
+API_LOGS_TELEMETRY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_latency ON api_logs (latency_ms DESC NULLS LAST)",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_provider_latency ON api_logs (provider_latency_ms DESC NULLS LAST)",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_ttft ON api_logs (ttft_ms DESC NULLS LAST) WHERE ttft_ms IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_retries ON api_logs (retry_count DESC) WHERE retry_count > 0",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_model_latency ON api_logs (model, latency_ms DESC NULLS LAST)",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_tenant_latency ON api_logs (tenant_id, latency_ms DESC NULLS LAST)",
+    "CREATE INDEX IF NOT EXISTS idx_api_logs_request_id ON api_logs (request_id)",
+]
+
+
+def ensure_api_logs_telemetry(cur) -> None:
+    """Add the telemetry columns and their indexes to api_logs if they are missing."""
+    cur.execute("ALTER TABLE api_logs " + ", ".join(
+        f"ADD COLUMN IF NOT EXISTS {name} {type_}" for name, type_ in API_LOGS_TELEMETRY_COLUMNS.items()
+    ))
+    for statement in API_LOGS_TELEMETRY_INDEXES:
+        cur.execute(statement)
+
+
+# Prompt cache token counts added to existing tables by migration 6 (see prompt_cache.py)
+API_LOGS_CACHE_TOKEN_COLUMNS = {
+    "cache_read_tokens": "INTEGER",
+    "cache_write_tokens": "INTEGER",
+}
+
+
+def ensure_api_logs_cache_tokens(cur) -> None:
+    """Add the prompt cache token columns to api_logs if they are missing."""
+    cur.execute("ALTER TABLE api_logs " + ", ".join(
+        f"ADD COLUMN IF NOT EXISTS {name} {type_}" for name, type_ in API_LOGS_CACHE_TOKEN_COLUMNS.items()
+    ))
+
+
+def ensure_api_logs_indexes(cur) -> None:
+    """Create the keyset pagination indexes on api_logs if they are missing."""
+    for statement in API_LOGS_INDEXES:
+        cur.execute(statement)
+
+
+def ensure_api_logs_table(cur) -> None:
+    """Create the partitioned api_logs table and its partitions if they are missing."""
+    cur.execute(API_LOGS_TABLE)
+    ensure_partitions(cur)
@@ -0,0 +1,122 @@
+"""
+Bookkeeping for streamed completions.
+
+``StreamAccumulator`` collects text deltas in a list and joins them once at
+the end, so a long stream costs O(n) rather than O(n^2) string copies. It
+also records time to first token and throughput, and keeps whatever usage
+the provider has reported so far. If the stream is cut short, it estimates
+the missing counts instead.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .tokens import count_message_tokens, count_text_tokens
+from .types import LLMResponse
+
+
+class StreamAccumulator:
+    def __init__(self, clock: Callable[[], float] = time.perf_counter, started: Optional[float] = None):
+        self._clock = clock
+        self.started = clock() if started is None else started
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.parts: List[str] = []
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.cache_read_tokens: Optional[int] = None
+        self.cache_write_tokens: Optional[int] = None
+
+    def add(self, text: Optional[str]) -> None:
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = self._clock()
+        self.parts.append(text)
+
+    def update_usage(self, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None,
+                     cache_read_tokens: Optional[int] = None, cache_write_tokens: Optional[int] = None) -> None:
+        """Record usage reported mid-stream; later reports replace earlier ones."""
+        if prompt_tokens is not None:
+            self.prompt_tokens = prompt_tokens
+        if completion_tokens is not None:
+            self.completion_tokens = completion_tokens
+        if cache_read_tokens is not None:
+            self.cache_read_tokens = cache_read_tokens
+        if cache_write_tokens is not None:
+            self.cache_write_tokens = cache_write_tokens
+
+    def finish(self) -> None:
+        if self.finished_at is None:
+            self.finished_at = self._clock()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def usage(self, prompt_estimate: int = 0, model: Optional[str] = None) -> Dict[str, int]:
+        """
+        Reported usage, with estimates for anything the stream never reported.
+        Cache token counts are only included when the provider reported them.
+        """
+        usage = {
+            "prompt_tokens": self.prompt_tokens if self.prompt_tokens is not None else prompt_estimate,
+            "completion_tokens": (self.completion_tokens if self.completion_tokens is not None
+                                  else count_text_tokens(self.text, model)),
+        }
+        if self.cache_read_tokens is not None:
+            usage["cache_read_tokens"] = self.cache_read_tokens
+        if self.cache_write_tokens is not None:
+            usage["cache_write_tokens"] = self.cache_write_tokens
+        return usage
+
+    def metrics(self, completion_tokens: Optional[int] = None) -> Dict[str, Optional[float]]:
+        """Time to first token, total duration and generation speed, in seconds and tokens/second."""
+        end = self.finished_at if self.finished_at is not None else self._clock()
+        ttft = None if self.first_token_at is None else self.first_token_at - self.started
+        if completion_tokens is None:
+            completion_tokens = self.usage()["completion_tokens"]
+        generating = None if self.first_token_at is None else end - self.first_token_at
+        return {
+            "ttft": ttft,
+            "duration": end - self.started,
+            "tokens_per_second": completion_tokens / generating if generating else None,
+        }
+
+
+def delta_chunk(text: str) -> Dict[str, Any]:
+    """A streamed chunk carrying one text delta, in the OpenAI-style shape every wrapper yields."""
+    return {"choices": [{"delta": {"content": text}}]}
+
+
+def final_chunk(accumulator: StreamAccumulator, usage: Dict[str, int], cost: float) -> LLMResponse:
+    """The last chunk of a stream: the full text, usage, cost and stream timings."""
+    return {
+        "choices": [{"delta": {"content": ""}, "message": {"content": accumulator.text}}],
+        "usage": usage,
+        "cost": cost,
+        "stream": accumulator.metrics(usage["completion_tokens"]),
+    }
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, Any]], model: Optional[str] = None) -> int:
+    return count_message_tokens(messages, model)
+
+
+def open_stream(open_fn: Callable[[], Any], retry_on: tuple, max_retries: int = 3, backoff_base: float = 2.0,
+                telemetry: Optional[Any] = None) -> Any:
+    """
+    Open a stream, retrying ``retry_on`` errors with exponential backoff.
+    Only the connection step is retried; a stream that fails part-way
+    cannot be replayed. Backoff sleeps are recorded on ``telemetry`` if given.
+    """
+    for attempt in range(max_retries):
+        try:
+            return open_fn()
+        except retry_on:
+            if attempt == max_retries - 1:
+                raise
+            delay = backoff_base ** attempt
+            if telemetry is not None:
+                telemetry.record_backoff(delay)
+            time.sleep(delay)
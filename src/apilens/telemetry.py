@@ -0,0 +1,92 @@
+"""
+Per-call performance telemetry, stored alongside each api_logs row.
+
+``CallTelemetry`` is started when a wrapper begins a call and filled in as
+the call runs. Retries record their backoff sleeps, and the response supplies
+its size and request id. ``as_log_fields()`` turns it into the telemetry
+columns of ``api_logs``.
+"""
+
+import json
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+# api_logs columns written from CallTelemetry, in insert order
+TELEMETRY_FIELDS = (
+    "latency_ms",
+    "provider_latency_ms",
+    "ttft_ms",
+    "retry_count",
+    "backoff_ms",
+    "request_bytes",
+    "response_bytes",
+    "request_id",
+)
+
+
+def payload_bytes(payload: Any) -> int:
+    """Size of ``payload`` as compact UTF-8 JSON, about what goes over the wire."""
+    return len(json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class CallTelemetry:
+    """
+    Timings and sizes for one logical call. ``latency`` covers everything from
+    creation to ``finish()``, including rate-limit waits and backoff.
+    ``provider_latency`` covers only the time spent in provider calls.
+    ``request_id`` is the provider's id when the response has one, otherwise
+    a client-generated UUID.
+    """
+    __slots__ = ("_clock", "started", "finished", "provider_started", "provider_seconds",
+                 "ttft", "retries", "backoff_seconds", "request_bytes", "response_bytes", "request_id")
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self._clock = clock
+        self.started = clock()
+        self.finished: Optional[float] = None
+        self.provider_started: Optional[float] = None
+        self.provider_seconds: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self.request_bytes: Optional[int] = None
+        self.response_bytes: Optional[int] = None
+        self.request_id = uuid.uuid4().hex
+
+    def start_provider(self) -> None:
+        self.provider_started = self._clock()
+
+    def end_provider(self) -> None:
+        """Close the provider span; backoff slept inside it does not count as provider time."""
+        if self.provider_started is not None:
+            self.provider_seconds = max(0.0, self._clock() - self.provider_started - self.backoff_seconds)
+
+    def record_backoff(self, seconds: float) -> None:
+        self.retries += 1
+        self.backoff_seconds += seconds
+
+    def record_request_id(self, request_id: Any) -> None:
+        if isinstance(request_id, str) and request_id:
+            self.request_id = request_id
+
+    def finish(self) -> None:
+        if self.finished is None:
+            self.finished = self._clock()
+
+    def as_log_fields(self) -> Dict[str, Any]:
+        finished = self.finished if self.finished is not None else self._clock()
+        return {
+            "latency_ms": _ms(finished - self.started),
+            "provider_latency_ms": _ms(self.provider_seconds),
+            "ttft_ms": _ms(self.ttft),
+            "retry_count": self.retries,
+            "backoff_ms": _ms(self.backoff_seconds),
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "request_id": self.request_id,
+        }
@@ -0,0 +1,277 @@
+"""
+Token counting per model family.
+
+Counts come from the best source available:
+
+1. what the provider reported (``usage`` on OpenAI/Anthropic responses,
+   ``usage_metadata`` on Gemini ones; see ``usage_from_metadata``),
+2. an offline tokenizer for the model's family: ``tiktoken`` for OpenAI
+   models, when it is installed,
+3. otherwise a fast estimator based on characters per token. Each model's ratio
+   starts from a per-family default and is calibrated against the prompt
+   counts the provider reports afterwards.
+
+Message lists are counted through a memo of message prefixes. When a
+conversation grows by one turn, only the new message is tokenized, because
+the count for the history is already cached.
+
+``python -m apilens.tokens [model]`` prints a tokens-per-second benchmark.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prefix counts remembered per model
+CACHE_SIZE = int(os.getenv("APILENS_TOKEN_CACHE_SIZE", "4096"))
+
+# Characters per token before any calibration. These are typical for English text.
+CHARS_PER_TOKEN = {"openai": 4.0, "anthropic": 3.5, "gemini": 4.0, "default": 4.0}
+# Calibrated ratios stay within these bounds, so one odd response cannot skew them
+MIN_CHARS_PER_TOKEN, MAX_CHARS_PER_TOKEN = 1.5, 8.0
+# Weight given to each newly reported prompt count
+CALIBRATION_RATE = 0.1
+
+# Chat formatting overhead: tokens added per message, plus the priming of the reply
+TOKENS_PER_MESSAGE = 3
+REPLY_PRIMING_TOKENS = 3
+
+_FAMILY_PREFIXES = (
+    ("gpt-", "openai"), ("o1", "openai"), ("o3", "openai"), ("o4", "openai"), ("chatgpt-", "openai"),
+    ("text-embedding-", "openai"), ("claude", "anthropic"), ("gemini", "gemini"),
+)
+
+
+def model_family(model: Optional[str]) -> str:
+    """``openai``, ``anthropic``, ``gemini`` or ``default``, from the model name."""
+    if model:
+        for prefix, family in _FAMILY_PREFIXES:
+            if model.startswith(prefix):
+                return family
+    return "default"
+
+
+def _tiktoken_encoder(model: str) -> Optional[Callable[[str], int]]:
+    """A function that counts tokens with tiktoken, or None if tiktoken is not usable."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base" if model.startswith(("gpt-4o", "o")) else "cl100k_base")
+    except Exception as e:
+        # tiktoken fetches its vocabulary on first use, which fails offline
+        logger.warning(f"tiktoken unavailable for {model}, estimating tokens instead: {e}")
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+# Offline tokenizers by family. Anthropic and Google do not publish one for current models.
+TOKENIZERS: Dict[str, Callable[[str], Optional[Callable[[str], int]]]] = {"openai": _tiktoken_encoder}
+
+
+def _text_of(content: Any) -> str:
+    """The text in a message's content, including the text parts of multimodal content."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return "" if content is None else str(content)
+
+
+def _weighted_length(text: str) -> int:
+    # Non-ASCII text (accents, CJK, emoji) takes more tokens per character, roughly by UTF-8 length
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+class TokenCounter:
+    """
+    Counts tokens for one model. ``exact`` is True when an offline tokenizer
+    is in use. Otherwise counts are estimates from ``chars_per_token``, which
+    ``calibrate()`` adjusts under the same lock that guards the prefix memo.
+
+    Prefix counts are stored in raw units: tokens from a tokenizer, or
+    weighted characters for the estimator. As a result, calibration never
+    makes cached entries stale.
+    """
+    def __init__(self, model: Optional[str] = None, cache_size: int = CACHE_SIZE,
+                 tokenizer: Optional[Callable[[str], int]] = None):
+        self.model = model
+        self.family = model_family(model)
+        if tokenizer is None and self.family in TOKENIZERS:
+            tokenizer = TOKENIZERS[self.family](model)
+        self._tokenizer = tokenizer
+        self.exact = tokenizer is not None
+        self.chars_per_token = CHARS_PER_TOKEN[self.family]
+        self.cache_size = cache_size
+        # prefix key -> (units, messages)
+        self._prefixes: "OrderedDict[int, Tuple[int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _units(self, text: str) -> int:
+        return self._tokenizer(text) if self._tokenizer is not None else _weighted_length(text)
+
+    def _to_tokens(self, units: int) -> int:
+        if self._tokenizer is not None:
+            return units
+        if not units:
+            return 0
+        with self._lock:
+            chars_per_token = self.chars_per_token
+        return -(-units * 100 // int(chars_per_token * 100))
+
+    def count_text(self, text: str) -> int:
+        """Tokens in a plain string, such as a completion."""
+        return self._to_tokens(self._units(text)) if text else 0
+
+    def _prefix_units(self, messages: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """Raw units and message count of ``messages``, reusing the longest cached prefix."""
+        units = count = 0
+        key = hash(self.model)
+        pending = []
+        with self._lock:
+            for message in messages:
+                content = message.get("content", "")
+                if not isinstance(content, str):
+                    content = _text_of(content)
+                key = hash((key, message.get("role"), message.get("name"), content))
+                cached = self._prefixes.get(key)
+                if cached is not None:
+                    self._prefixes.move_to_end(key)
+                    self.hits += 1
+                    units, count = cached
+                    pending.clear()
+                else:
+                    pending.append((key, message.get("role") or "", message.get("name"), content))
+        if not pending:
+            return units, count
+
+        # Tokenize outside the lock; only the messages past the cached prefix get here
+        entries = []
+        for key, role, name, content in pending:
+            units += self._units(content) + self._units(role)
+            if name:
+                units += self._units(name)
+            count += 1
+            entries.append((key, (units, count)))
+        with self._lock:
+            self.misses += len(entries)
+            for key, value in entries:
+                self._prefixes[key] = value
+            while len(self._prefixes) > self.cache_size:
+                self._prefixes.popitem(last=False)
+        return units, count
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """Prompt tokens for a chat request, including per-message formatting overhead."""
+        if not messages:
+            return 0
+        units, count = self._prefix_units(messages)
+        return self._to_tokens(units) + count * TOKENS_PER_MESSAGE + REPLY_PRIMING_TOKENS
+
+    def calibrate(self, messages: List[Dict[str, Any]], reported_prompt_tokens: Optional[int]) -> None:
+        """Move the estimator's ratio towards what the provider reported for ``messages``."""
+        if self.exact or not messages or not reported_prompt_tokens:
+            return
+        units, count = self._prefix_units(messages)
+        content_tokens = reported_prompt_tokens - count * TOKENS_PER_MESSAGE - REPLY_PRIMING_TOKENS
+        if units <= 0 or content_tokens <= 0:
+            return
+        observed = min(max(units / content_tokens, MIN_CHARS_PER_TOKEN), MAX_CHARS_PER_TOKEN)
+        # Concurrent calls would otherwise lose each other's updates
+        with self._lock:
+            self.chars_per_token += (observed - self.chars_per_token) * CALIBRATION_RATE
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"exact": self.exact, "chars_per_token": self.chars_per_token, "cached_prefixes": len(self._prefixes),
+                    "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._prefixes.clear()
+            self.hits = self.misses = 0
+
+
+_counters: Dict[Optional[str], TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_counter(model: Optional[str] = None) -> TokenCounter:
+    """The process-wide counter for ``model``, created on first use."""
+    counter = _counters.get(model)
+    if counter is not None:
+        return counter
+    with _counters_lock:
+        counter = _counters.get(model)
+        if counter is None:
+            counter = _counters[model] = TokenCounter(model)
+        return counter
+
+
+def clear_counters() -> None:
+    """Forget every process-wide counter, including calibration."""
+    with _counters_lock:
+        _counters.clear()
+
+
+def count_text_tokens(text: str, model: Optional[str] = None) -> int:
+    return get_counter(model).count_text(text)
+
+
+def count_message_tokens(messages: List[Dict[str, Any]], model: Optional[str] = None) -> int:
+    return get_counter(model).count_messages(messages)
+
+
+def usage_from_metadata(metadata: Any) -> Optional[Dict[str, int]]:
+    """
+    Prompt and completion tokens from a Gemini ``usage_metadata``, or None if
+    it has no counts. ``completion_tokens`` is None until the model reports it.
+    Tokens read from a context cache are part of ``prompt_tokens`` and are
+    also reported as ``cache_read_tokens``.
+    """
+    prompt_tokens = getattr(metadata, "prompt_token_count", None)
+    if not prompt_tokens:
+        return None
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": getattr(metadata, "candidates_token_count", None)}
+    cached = getattr(metadata, "cached_content_token_count", None)
+    if isinstance(cached, int) and cached > 0:
+        usage["cache_read_tokens"] = cached
+    return usage
+
+
+def benchmark(model: Optional[str] = "gpt-4", turns: int = 200, message_chars: int = 400) -> Dict[str, float]:
+    """
+    Count a conversation as it grows turn by turn, the way a chat client does.
+    Returns tokens counted per second with a cold memo (the history is counted
+    again on every turn) and with the prefix memo (only the new turn is counted).
+    """
+    text = ("The quick brown fox jumps over the lazy dog, then checks the invoice total. " * 8)[:message_chars]
+    conversation = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i}: {text}"} for i in range(turns)]
+    results = {}
+    for name, cache_size in (("uncached", 0), ("memoized", CACHE_SIZE)):
+        counter = TokenCounter(model, cache_size=max(cache_size, 0))
+        started = time.perf_counter()
+        total = sum(counter.count_messages(conversation[:i]) for i in range(1, turns + 1))
+        elapsed = time.perf_counter() - started
+        results[f"{name}_tokens_per_second"] = total / elapsed if elapsed else float("inf")
+    results["exact"] = float(TokenCounter(model).exact)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    model = sys.argv[1] if len(sys.argv) > 1 else "gpt-4"
+    for name, value in benchmark(model).items():
+        print(f"{name:<32}{value:>16,.0f}")
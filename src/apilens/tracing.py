@@ -0,0 +1,235 @@
+"""
+Tracing hooks around the phases of a wrapper call.
+
+``BaseAIWrapper`` opens a span for each phase it runs: ``chat_completion``
+(the whole call, or one item of a batch or stream), ``validation``,
+``rate_limit``, ``retry``, one ``provider_call`` per attempt, ``backoff``,
+``stream`` while a streamed response is read, ``extract_usage``,
+``calculate_cost``, ``format_response`` and ``log_call``. Registered hooks get
+``on_start(span)`` and ``on_end(span)`` for each span. Spans carry attributes
+such as provider, model, attempt, token counts, cost and status, plus their
+parent span, so an adapter can forward them to OpenTelemetry or similar.
+
+With no hooks registered, ``span()`` returns a shared no-op object, so
+instrumented code pays one function call and one tuple check per phase.
+
+``Profiler`` is a built-in hook that sums time per phase and splits each
+call's latency between the provider and APILens itself::
+
+    with Profiler() as profiler:
+        wrapper.chat_completion(messages)
+    print(profiler.report())
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TraceHook:
+    """Base class for hooks. Override either method; exceptions they raise are logged and ignored."""
+
+    def on_start(self, span: "Span") -> None:
+        pass
+
+    def on_end(self, span: "Span") -> None:
+        pass
+
+
+_hooks: Tuple[TraceHook, ...] = ()
+_hooks_lock = threading.Lock()
+_current_span: contextvars.ContextVar = contextvars.ContextVar("apilens_span", default=None)
+
+
+def add_hook(hook: TraceHook) -> TraceHook:
+    """Register ``hook`` for every wrapper in the process. Returns it for convenience."""
+    global _hooks
+    with _hooks_lock:
+        if hook not in _hooks:
+            _hooks = _hooks + (hook,)
+    return hook
+
+
+def remove_hook(hook: TraceHook) -> None:
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+def clear_hooks() -> None:
+    global _hooks
+    with _hooks_lock:
+        _hooks = ()
+
+
+def get_hooks() -> Tuple[TraceHook, ...]:
+    return _hooks
+
+
+class Span:
+    """One timed phase. Hooks read ``phase``, ``attributes``, ``duration``, ``error`` and ``parent``."""
+    __slots__ = ("phase", "attributes", "parent", "started", "ended", "error", "_hooks", "_token")
+
+    def __init__(self, phase: str, attributes: Dict[str, Any], hooks: Tuple[TraceHook, ...]):
+        self.phase = phase
+        self.attributes = attributes
+        self.parent: Optional["Span"] = None
+        self.started: Optional[float] = None
+        self.ended: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        self._hooks = hooks
+        self._token = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Seconds between start and end, or None while the span is open."""
+        if self.started is None or self.ended is None:
+            return None
+        return self.ended - self.started
+
+    def set(self, **attributes: Any) -> None:
+        """Add attributes that are only known partway through the phase."""
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self.parent = _current_span.get()
+        self._token = _current_span.set(self)
+        self.started = time.perf_counter()
+        for hook in self._hooks:
+            try:
+                hook.on_start(self)
+            except Exception as e:
+                logger.error(f"Trace hook {hook!r} failed on start of {self.phase}: {e}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.ended = time.perf_counter()
+        self.error = exc
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited in a different context than it was entered in (e.g. a generator)
+            pass
+        for hook in self._hooks:
+            try:
+                hook.on_end(self)
+            except Exception as e:
+                logger.error(f"Trace hook {hook!r} failed on end of {self.phase}: {e}")
+        return False
+
+
+class _NoopSpan:
+    """Stands in for ``Span`` when no hooks are registered."""
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(phase: str, wrapper: Any = None, **attributes: Any):
+    """
+    Context manager timing ``phase``. ``wrapper`` adds its provider and model
+    to the attributes. Returns a shared no-op when no hooks are registered.
+    """
+    hooks = _hooks
+    if not hooks:
+        return _NOOP_SPAN
+    if wrapper is not None:
+        attributes = {"provider": wrapper.provider_name, "model": wrapper.model, **attributes}
+    return Span(phase, attributes, hooks)
+
+
+def current_span() -> Optional[Span]:
+    """The innermost open span in this context, if any."""
+    return _current_span.get()
+
+
+# Phases spent outside APILens: in the provider, waiting on rate limits or backing off before a retry
+PROVIDER_PHASES = ("provider_call", "stream")
+WAIT_PHASES = ("rate_limit", "backoff")
+ROOT_PHASES = ("chat_completion",)
+
+
+class Profiler(TraceHook):
+    """
+    Aggregates count, total, mean and max seconds per phase. ``breakdown()``
+    splits the time of finished ``chat_completion`` spans into provider time,
+    waiting (rate limits and backoff) and APILens overhead (everything else).
+    Use it as a context manager to register it only for a block.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases: Dict[str, List[float]] = {}
+
+    def on_end(self, span: Span) -> None:
+        duration = span.duration
+        with self._lock:
+            stats = self._phases.get(span.phase)
+            if stats is None:
+                self._phases[span.phase] = [1, duration, duration]
+            else:
+                stats[0] += 1
+                stats[1] += duration
+                if duration > stats[2]:
+                    stats[2] = duration
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                phase: {"count": count, "total": total, "mean": total / count, "max": max_}
+                for phase, (count, total, max_) in self._phases.items()
+            }
+
+    def _total(self, stats: Dict[str, Dict[str, float]], phases: Tuple[str, ...]) -> float:
+        return sum(stats[phase]["total"] for phase in phases if phase in stats)
+
+    def breakdown(self) -> Dict[str, float]:
+        """Seconds of provider, waiting and APILens time across all profiled calls, and APILens's share."""
+        stats = self.stats()
+        total = self._total(stats, ROOT_PHASES)
+        provider = self._total(stats, PROVIDER_PHASES)
+        waiting = self._total(stats, WAIT_PHASES)
+        overhead = max(0.0, total - provider - waiting)
+        return {
+            "calls": sum(stats[phase]["count"] for phase in ROOT_PHASES if phase in stats),
+            "total": total,
+            "provider": provider,
+            "waiting": waiting,
+            "apilens": overhead,
+            "apilens_share": overhead / total if total else 0.0,
+        }
+
+    def report(self) -> str:
+        """A plain-text table of per-phase timings followed by the breakdown."""
+        lines = [f"{'phase':<18}{'count':>8}{'total ms':>12}{'mean ms':>12}{'max ms':>12}"]
+        for phase, s in sorted(self.stats().items(), key=lambda item: -item[1]["total"]):
+            lines.append(f"{phase:<18}{s['count']:>8}{s['total'] * 1000:>12.3f}"
+                         f"{s['mean'] * 1000:>12.3f}{s['max'] * 1000:>12.3f}")
+        b = self.breakdown()
+        lines.append(f"provider {b['provider'] * 1000:.3f} ms, waiting {b['waiting'] * 1000:.3f} ms, "
+                     f"apilens {b['apilens'] * 1000:.3f} ms ({b['apilens_share']:.2%} of {b['calls']} calls)")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._phases.clear()
+
+    def __enter__(self) -> "Profiler":
+        return add_hook(self)
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        remove_hook(self)
+        return False
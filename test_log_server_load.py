@@ -0,0 +1,104 @@
+"""
+Load test: ingestion latency on /log must stay flat while a slow /logs query
+is running on the same worker.
+"""
+import asyncio
+import gc
+import time
+import httpx
+import pytest
+from datetime import datetime, timezone
+from log_server import app
+
+SLOW_QUERY_SECONDS = 1.0
+INGEST_REQUESTS = 200
+INGEST_CONCURRENCY = 20
+
+LOG_ENTRY = {
+    "provider": "openai",
+    "model": "gpt-4",
+    "prompt_tokens": 10,
+    "completion_tokens": 20,
+    "cost": 0.00123,
+    "status": "success",
+    "user_id": "loaduser",
+    "tenant_id": "loadtenant",
+}
+
+
+class SlowQueryCursor:
+    description = [("id",), ("timestamp",)]
+
+    def execute(self, sql, params=None):
+        if sql.lstrip().startswith("SELECT"):
+            # A large scan: blocks whichever thread runs it
+            time.sleep(SLOW_QUERY_SECONDS)
+
+    def fetchall(self):
+        return [(1, datetime.now(timezone.utc))]
+
+    def close(self):
+        pass
+
+
+class DummyConn:
+    def cursor(self):
+        return SlowQueryCursor()
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def p99(latencies):
+    ordered = sorted(latencies)
+    return ordered[int(len(ordered) * 0.99) - 1]
+
+
+async def ingest(client):
+    semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/log", json=LOG_ENTRY)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200
+
+    await asyncio.gather(*(one() for _ in range(INGEST_REQUESTS)))
+    return latencies
+
+
+@pytest.fixture
+def frozen_gc():
+    # A full collection of the test process heap takes longer than the
+    # latencies being measured; keep it out of the numbers.
+    gc.collect()
+    gc.freeze()
+    yield
+    gc.unfreeze()
+
+
+@pytest.mark.asyncio
+async def test_ingest_p99_stays_flat_during_slow_query(monkeypatch, frozen_gc):
+    monkeypatch.setattr("psycopg2.connect", lambda *a, **kw: DummyConn())
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        baseline = p99(await ingest(client))
+
+        slow_query = asyncio.create_task(client.get("/logs", params={"limit": 1000}))
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        under_load = p99(await ingest(client))
+        assert not slow_query.done(), "ingestion should finish while the query is still running"
+        response = await slow_query
+
+    assert response.status_code == 200
+    assert time.perf_counter() - started < SLOW_QUERY_SECONDS + 0.5
+    print(f"ingest p99: baseline {baseline * 1000:.1f}ms, during slow query {under_load * 1000:.1f}ms")
+    # A blocked event loop would push p99 up to the full query time
+    assert under_load < SLOW_QUERY_SECONDS / 4
+    assert under_load < max(baseline * 5, 0.05)
@@ -1,5 +1,10 @@
 import pytest
 import os
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from apilens import OpenAIWrapper
+
 
 @pytest.fixture(autouse=True)
 def mock_env_vars():
@@ -9,4 +14,55 @@ def mock_env_vars():
     yield
     # Cleanup
     os.environ.pop('OPENAI_API_KEY', None)
-    os.environ.pop('ANTHROPIC_API_KEY', None) 
\ No newline at end of file
+    os.environ.pop('ANTHROPIC_API_KEY', None) 
+
+@pytest.fixture(autouse=True)
+def fresh_token_counters():
+    """Token estimators calibrate from reported usage; start each test uncalibrated."""
+    from apilens.tokens import clear_counters
+    clear_counters()
+    yield
+    clear_counters()
+
+
+class FakeClock:
+    """Clock for code that takes a ``clock`` callable; tests move it by setting ``now``."""
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def openai_response():
+    """Builds a chat completion response the way the OpenAI SDK returns it."""
+    def build(content="Hello!", prompt_tokens=10, completion_tokens=20, request_id=None):
+        response = Mock()
+        response.choices = [Mock(message=Mock(content=content))]
+        response.usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        response._request_id = request_id
+        return response
+    return build
+
+
+@pytest.fixture
+def make_openai_wrapper():
+    """OpenAIWrapper factory: no backoff between retries and a Mock logger, unless overridden."""
+    def make(model="gpt-3.5-turbo", **kwargs):
+        kwargs.setdefault("backoff_base", 0)
+        with patch('apilens.openai_wrapper.OPENAI_API_KEY', 'fake-key'):
+            wrapper = OpenAIWrapper(model=model, **kwargs)
+        wrapper._logger = Mock()
+        return wrapper
+    return make
+
+
+@pytest.fixture
+def openai_wrapper(make_openai_wrapper):
+    return make_openai_wrapper()
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from apilens import AnthropicWrapper
+from apilens import base_wrapper as base_wrapper_module
+from apilens.types import RateLimitError
+
+MESSAGES = [{"role": "user", "content": "Hello!"}]
+
+
+class SlowLogger:
+    """Blocking logger, like the per-call HTTP logger."""
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def log_call(self, **log_data):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append(log_data)
+
+
+@pytest.mark.asyncio
+async def test_openai_async_path_uses_async_client(openai_wrapper, openai_response):
+    openai_wrapper.client = Mock()
+    openai_wrapper.async_client = Mock()
+    openai_wrapper.async_client.chat.completions.create = AsyncMock(return_value=openai_response())
+    response = await openai_wrapper.async_chat_completion(MESSAGES, temperature=0.2)
+    assert response["choices"][0]["message"]["content"] == "Hello!"
+    openai_wrapper.async_client.chat.completions.create.assert_awaited_once_with(
+        model="gpt-3.5-turbo", messages=MESSAGES, temperature=0.2
+    )
+    openai_wrapper.client.chat.completions.create.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_anthropic_async_path_uses_async_client():
+    with patch('apilens.anthropic_wrapper.ANTHROPIC_API_KEY', 'fake-key'):
+        wrapper = AnthropicWrapper(model="claude-3-opus-20240229", logger=Mock())
+    reply = Mock(content=[Mock(text="Hi")], usage=Mock(input_tokens=3, output_tokens=4))
+    wrapper.async_client = Mock()
+    wrapper.async_client.messages.create = AsyncMock(return_value=reply)
+    messages = [{"role": "system", "content": "Be brief."}] + MESSAGES
+    response = await wrapper.async_chat_completion(messages)
+    assert response["usage"] == {"prompt_tokens": 3, "completion_tokens": 4}
+    kwargs = wrapper.async_client.messages.create.await_args.kwargs
+    assert kwargs["system"] == "Be brief."
+    assert kwargs["messages"] == MESSAGES
+
+
+@pytest.mark.asyncio
+async def test_async_retries_rate_limits_without_blocking(openai_wrapper, openai_response):
+    api_call = AsyncMock(side_effect=[RateLimitError("Rate limit"), openai_response()])
+    sleep = AsyncMock()
+    with patch.object(openai_wrapper, '_make_async_api_call', new=api_call), \
+            patch.object(base_wrapper_module.asyncio, 'sleep', new=sleep):
+        response = await openai_wrapper.async_chat_completion(MESSAGES)
+    assert response["usage"]["completion_tokens"] == 20
+    assert api_call.await_count == 2
+    sleep.assert_awaited_once_with(1.0)
+
+
+@pytest.mark.asyncio
+async def test_async_logging_does_not_block_the_loop(openai_wrapper, openai_response):
+    openai_wrapper._logger = SlowLogger(delay=0.05)
+
+    async def api_call(messages, **kwargs):
+        await asyncio.sleep(0.01)
+        return openai_response()
+
+    with patch.object(openai_wrapper, '_make_async_api_call', new=api_call):
+        started = time.perf_counter()
+        await asyncio.gather(*(openai_wrapper.async_chat_completion(MESSAGES) for _ in range(100)))
+        elapsed = time.perf_counter() - started
+    # Logging inline would take 100 * 50ms on the loop
+    assert elapsed < 1.0
+    assert openai_wrapper.flush_logs(timeout=10)
+    assert len(openai_wrapper._logger.calls) == 100
+    assert {call["status"] for call in openai_wrapper._logger.calls} == {"success"}
+
+
+@pytest.mark.asyncio
+async def test_async_failure_is_logged(openai_wrapper):
+    with patch.object(openai_wrapper, '_make_async_api_call', new=AsyncMock(side_effect=ValueError("boom"))):
+        with pytest.raises(ValueError):
+            await openai_wrapper.async_chat_completion(MESSAGES)
+    openai_wrapper.flush_logs(timeout=5)
+    log = openai_wrapper._logger.log_call.call_args.kwargs
+    assert (log["status"], log["error_message"]) == ("failed", "boom")
+
+
+@pytest.mark.asyncio
+async def test_enqueueing_logger_is_called_inline(openai_wrapper, openai_response):
+    openai_wrapper._logger = Mock(non_blocking=True)
+    with patch.object(openai_wrapper, '_make_async_api_call', new=AsyncMock(return_value=openai_response())):
+        await openai_wrapper.async_chat_completion(MESSAGES)
+    # No flush needed: the call happened before async_chat_completion returned
+    assert openai_wrapper._logger.log_call.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_async_path_validates_messages_before_calling_the_provider(openai_wrapper):
+    with patch.object(openai_wrapper, '_make_async_api_call', new=AsyncMock()) as call:
+        with pytest.raises(ValueError):
+            await openai_wrapper.async_chat_completion([{"role": "user", "content": ""}])
+    call.assert_not_called()
+
+
+def test_max_retries_must_allow_one_attempt(make_openai_wrapper):
+    with pytest.raises(ValueError):
+        make_openai_wrapper(max_retries=0)
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from apilens import RateLimitError
+
+
+def _conversation(i):
+    return [{"role": "user", "content": f"Question {i}"}]
+
+
+def test_results_in_input_order_with_per_item_errors(openai_wrapper, openai_response):
+    def api_call(messages, **kwargs):
+        content = messages[0]["content"]
+        # Finish out of order
+        time.sleep(0.01 * (5 - int(content.split()[1])))
+        if content == "Question 3":
+            raise ValueError("bad item")
+        return openai_response(content)
+
+    conversations = [_conversation(i) for i in range(5)] + [[{"role": "user"}]]
+    with patch.object(openai_wrapper, '_make_api_call', side_effect=api_call):
+        results = openai_wrapper.batch_chat_completion(conversations, concurrency=3)
+
+    assert [r["response"]["choices"][0]["message"]["content"] if r["response"] else None for r in results] == \
+        ["Question 0", "Question 1", "Question 2", None, "Question 4", None]
+    assert isinstance(results[3]["error"], ValueError)
+    assert isinstance(results[5]["error"], ValueError)
+    assert all(r["error"] is None for i, r in enumerate(results) if i not in (3, 5))
+
+
+def test_concurrency_is_bounded(openai_wrapper, openai_response):
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def api_call(messages, **kwargs):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.pop()
+        return openai_response("ok")
+
+    with patch.object(openai_wrapper, '_make_api_call', side_effect=api_call):
+        openai_wrapper.batch_chat_completion([_conversation(i) for i in range(20)], concurrency=4)
+    assert max(peak) <= 4
+
+
+def test_items_are_retried_and_logged_in_one_submission(openai_wrapper, openai_response):
+    attempts = {}
+
+    def api_call(messages, **kwargs):
+        content = messages[0]["content"]
+        attempts[content] = attempts.get(content, 0) + 1
+        if content == "Question 1" and attempts[content] == 1:
+            raise RateLimitError("slow down")
+        return openai_response(content)
+
+    with patch.object(openai_wrapper, '_make_api_call', side_effect=api_call):
+        results = openai_wrapper.batch_chat_completion([_conversation(i) for i in range(3)])
+
+    assert attempts["Question 1"] == 2
+    assert all(r["error"] is None for r in results)
+    openai_wrapper._logger.log_call.assert_not_called()
+    openai_wrapper._logger.log_calls.assert_called_once()
+    records = openai_wrapper._logger.log_calls.call_args.args[0]
+    assert [record["status"] for record in records] == ["success"] * 3
+    assert records[0]["provider"] == "openai"
+
+
+def test_logger_without_log_calls_gets_one_call_per_record(openai_wrapper, openai_response):
+    openai_wrapper._logger = Mock(spec=["log_call"])
+    with patch.object(openai_wrapper, '_make_api_call', return_value=openai_response("ok")):
+        openai_wrapper.batch_chat_completion([_conversation(i) for i in range(3)])
+    assert openai_wrapper._logger.log_call.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_async_batch_orders_results_and_bounds_concurrency(openai_wrapper, openai_response):
+    active = 0
+    peak = 0
+
+    async def api_call(messages, **kwargs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if messages[0]["content"] == "Question 2":
+            raise ValueError("bad item")
+        return openai_response(messages[0]["content"])
+
+    with patch.object(openai_wrapper, '_make_async_api_call', new=api_call):
+        results = await openai_wrapper.async_batch_chat_completion([_conversation(i) for i in range(10)], concurrency=3)
+    assert openai_wrapper.flush_logs(timeout=5)
+
+    assert peak <= 3
+    assert results[0]["response"]["choices"][0]["message"]["content"] == "Question 0"
+    assert isinstance(results[2]["error"], ValueError)
+    records = openai_wrapper._logger.log_calls.call_args.args[0]
+    assert sorted(record["status"] for record in records) == ["failed"] + ["success"] * 9
+    assert openai_wrapper._logger.log_calls.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_async_batch_does_not_log_on_the_event_loop(openai_wrapper, openai_response):
+    calling_threads = []
+    openai_wrapper._logger.non_blocking = False
+    openai_wrapper._logger.log_calls.side_effect = lambda records: calling_threads.append(threading.current_thread())
+
+    async def api_call(messages, **kwargs):
+        return openai_response("ok")
+
+    with patch.object(openai_wrapper, '_make_async_api_call', new=api_call):
+        await openai_wrapper.async_batch_chat_completion([_conversation(i) for i in range(2)])
+    assert openai_wrapper.flush_logs(timeout=5)
+    assert calling_threads[0].name.startswith("apilens-log-submit")
+
+
+def test_rejects_invalid_concurrency(openai_wrapper):
+    with pytest.raises(ValueError):
+        openai_wrapper.batch_chat_completion([_conversation(0)], concurrency=0)
+    assert openai_wrapper.batch_chat_completion([]) == []
+
+
+def test_rest_logger_posts_records_in_one_request():
+    from apilens.rest_logger import APILoggerREST
+    rest_logger = APILoggerREST("http://logs.example/log")
+    with patch('apilens.rest_logger.requests.post') as post:
+        post.return_value.json.return_value = {"inserted": 2}
+        rest_logger.log_calls([{"provider": "openai", "user_id": None}, {"provider": "openai", "tenant_id": "t1"}])
+    post.assert_called_once()
+    assert post.call_args.args[0] == "http://logs.example/logs/batch"
+    assert post.call_args.kwargs["json"][0]["user_id"] == ""
@@ -0,0 +1,100 @@
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from apilens.batch_jobs import AnthropicBatchClient, OpenAIBatchClient, read_jsonl
+from apilens.config import PRICING
+from apilens.fake_batch_server import FakeBatchServer
+from apilens.types import ProviderError
+
+
+def _items(n):
+    return [
+        {"custom_id": f"req-{i}", "messages": [{"role": "system", "content": "Be brief."},
+                                               {"role": "user", "content": f"Question number {i}"}],
+         "max_tokens": 100}
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def server():
+    with FakeBatchServer(polls_to_complete=3, fail_ids={"req-2"}) as server:
+        yield server
+
+
+def _client(cls, server, **kwargs):
+    base_url = server.openai_url if cls is OpenAIBatchClient else server.anthropic_url
+    return cls(api_key="test-key", base_url=base_url, poll_interval=0, logger=Mock(), **kwargs)
+
+
+@pytest.mark.parametrize("cls", [OpenAIBatchClient, AnthropicBatchClient])
+def test_submit_poll_and_collect(server, cls):
+    client = _client(cls, server)
+    job_id = client.submit(_items(5))
+    assert not client.status(job_id).done
+    status = client.wait(job_id)
+    assert status.done
+    assert (status.total, status.succeeded, status.failed) == (5, 4, 1)
+
+    results = {item["custom_id"]: item for item in client.collect(job_id)}
+    assert set(results) == {f"req-{i}" for i in range(5)}
+    assert results["req-2"]["response"] is None
+    assert results["req-2"]["error"] == "Invalid request"
+    ok = results["req-0"]["response"]
+    assert ok["choices"][0]["message"]["content"] == "echo: Question number 0"
+    pricing = PRICING[client.model]
+    usage = ok["usage"]
+    full_price = usage["prompt_tokens"] / 1000 * pricing["input"] + usage["completion_tokens"] / 1000 * pricing["output"]
+    assert ok["cost"] == pytest.approx(full_price / 2)
+
+
+def test_requests_are_translated_for_each_provider(server):
+    OpenAIBatchClient(api_key="k", base_url=server.openai_url, model="gpt-4").submit(_items(1))
+    AnthropicBatchClient(api_key="k", base_url=server.anthropic_url).submit(_items(1))
+    openai_job, anthropic_job = server.jobs.values()
+    line = openai_job["requests"][0]
+    assert line["url"] == "/v1/chat/completions"
+    assert line["body"]["model"] == "gpt-4"
+    assert line["body"]["messages"][0]["role"] == "system"
+    params = anthropic_job["requests"][0]["params"]
+    assert params["system"] == "Be brief."
+    assert [m["role"] for m in params["messages"]] == ["user"]
+    assert params["max_tokens"] == 100
+
+
+@pytest.mark.parametrize("cls", [OpenAIBatchClient, AnthropicBatchClient])
+def test_usage_is_logged_in_chunks(server, cls):
+    client = _client(cls, server, user_id="u1", tenant_id="t1", log_chunk_size=2)
+    results = client.run(_items(5), timeout=5)
+    assert len(results) == 5
+    log_calls = client.logger.log_calls
+    assert [len(call.args[0]) for call in log_calls.call_args_list] == [2, 2, 1]
+    records = [record for call in log_calls.call_args_list for record in call.args[0]]
+    assert sorted(record["status"] for record in records) == ["batch_failed"] + ["batch_success"] * 4
+    assert all(record["provider"] == client.provider_name and record["tenant_id"] == "t1" for record in records)
+    assert sum(record["cost"] for record in records) == pytest.approx(
+        sum(item["response"]["cost"] for item in results if item["response"]))
+
+
+def test_wait_times_out(server):
+    client = _client(OpenAIBatchClient, server)
+    server.polls_to_complete = 100
+    job_id = client.submit(_items(1))
+    with pytest.raises(TimeoutError):
+        client.wait(job_id, poll_interval=0.01, timeout=0.05)
+
+
+def test_http_errors_raise_provider_error(server):
+    client = _client(AnthropicBatchClient, server)
+    with pytest.raises(ProviderError):
+        client.status("msgbatch_missing")
+
+
+def test_submit_from_jsonl_file(server, tmp_path):
+    path = tmp_path / "requests.jsonl"
+    path.write_text("\n".join(json.dumps(item) for item in _items(3)) + "\n")
+    client = _client(OpenAIBatchClient, server)
+    results = client.run(read_jsonl(str(path)), timeout=5)
+    assert sorted(item["custom_id"] for item in results) == ["req-0", "req-1", "req-2"]
@@ -0,0 +1,114 @@
+import threading
+import time
+import pytest
+from apilens.batch_writer import BatchWriter
+
+
+class RecordingSink:
+    def __init__(self, fail=False, gate=None):
+        self.batches = []
+        self.fail = fail
+        self.gate = gate
+
+    def __call__(self, rows):
+        if self.gate is not None:
+            self.gate.wait()
+        if self.fail:
+            raise RuntimeError("db down")
+        self.batches.append(list(rows))
+
+
+def test_size_triggered_batches():
+    sink = RecordingSink()
+    writer = BatchWriter(sink, batch_size=10, flush_interval=60)
+    for i in range(25):
+        writer.put({"i": i})
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert [len(b) for b in sink.batches] == [10, 10, 5]
+    stats = writer.stats()
+    assert stats["queued"] == 25
+    assert stats["flushed"] == 25
+    assert stats["batches"] == 3
+
+
+def test_time_triggered_flush():
+    sink = RecordingSink()
+    writer = BatchWriter(sink, batch_size=1000, flush_interval=0.05)
+    writer.put({"i": 1})
+    deadline = time.monotonic() + 2
+    while not sink.batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.close()
+    assert sink.batches == [[{"i": 1}]]
+
+
+def test_drop_policy_counts_overflow():
+    gate = threading.Event()
+    sink = RecordingSink(gate=gate)
+    writer = BatchWriter(sink, batch_size=1, flush_interval=0.01, max_queue_size=2, overflow="drop")
+    results = [writer.put({"i": i}) for i in range(20)]
+    gate.set()
+    writer.close()
+    assert results.count(False) == writer.stats()["dropped"] > 0
+    assert writer.stats()["flushed"] == results.count(True)
+
+
+def test_spill_policy_replays_on_flush(tmp_path):
+    gate = threading.Event()
+    sink = RecordingSink(gate=gate)
+    spill_path = str(tmp_path / "spill.jsonl")
+    writer = BatchWriter(sink, batch_size=50, flush_interval=0.01, max_queue_size=2,
+                         overflow="spill", spill_path=spill_path)
+    for i in range(20):
+        assert writer.put({"i": i})
+    assert writer.stats()["spilled"] > 0
+    gate.set()
+    assert writer.flush(timeout=5)
+    writer.close()
+    written = sorted(row["i"] for batch in sink.batches for row in batch)
+    assert written == list(range(20))
+    assert writer.stats()["dropped"] == 0
+
+
+def test_failed_sink_is_counted():
+    writer = BatchWriter(RecordingSink(fail=True), batch_size=5, flush_interval=60)
+    for i in range(5):
+        writer.put(i)
+    writer.flush(timeout=5)
+    writer.close()
+    assert writer.stats()["failed"] == 5
+    assert writer.stats()["flushed"] == 0
+
+
+def test_invalid_overflow_policy():
+    with pytest.raises(ValueError):
+        BatchWriter(RecordingSink(), overflow="explode")
+
+
+def test_rest_logger_ships_batches_to_batch_endpoint(monkeypatch):
+    from apilens import rest_logger
+
+    posted = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"accepted": len(posted[-1][1]), "rejected": 0, "errors": []}
+
+    def post(url, json=None, timeout=None):
+        posted.append((url, json))
+        return Response()
+
+    monkeypatch.setattr(rest_logger.requests, "post", post)
+    logger = rest_logger.APILoggerREST("http://logs.local:8000/log", non_blocking=True,
+                                       batch_size=10, flush_interval=60)
+    for i in range(15):
+        logger.log_call(provider="openai", model="gpt-4", prompt_tokens=i)
+    assert logger.flush(timeout=5)
+    logger.close()
+    assert [url for url, _ in posted] == ["http://logs.local:8000/logs/batch"] * 2
+    assert [len(rows) for _, rows in posted] == [10, 5]
+    assert posted[0][1][0]["user_id"] == ""
@@ -0,0 +1,86 @@
+from unittest.mock import patch
+
+import pytest
+
+from apilens.cache import ResponseCache, make_cache_key
+
+MESSAGES = [{"role": "user", "content": "Hello!"}]
+
+
+def _response(text="Hello!"):
+    return {"choices": [{"message": {"content": text}}], "usage": {"prompt_tokens": 10, "completion_tokens": 20}, "cost": 0.5}
+
+
+def test_key_is_stable_and_param_sensitive():
+    key = make_cache_key("openai", "gpt-4", MESSAGES, {"temperature": 0, "max_tokens": 5})
+    assert key == make_cache_key("openai", "gpt-4", MESSAGES, {"max_tokens": 5, "temperature": 0})
+    assert key != make_cache_key("openai", "gpt-4", MESSAGES, {"temperature": 0, "max_tokens": 6})
+    assert key != make_cache_key("anthropic", "gpt-4", MESSAGES, {"temperature": 0, "max_tokens": 5})
+
+
+def test_lru_eviction_by_entry_count():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", _response("a"))
+    cache.set("b", _response("b"))
+    assert cache.get("a") is not None  # "b" is now least recently used
+    cache.set("c", _response("c"))
+    assert cache.get("b") is None
+    assert cache.get("a")["choices"][0]["message"]["content"] == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_eviction_by_bytes():
+    entry_size = len('{"choices":[{"message":{"content":"x"}}],"usage":{"prompt_tokens":10,"completion_tokens":20},"cost":0.5}')
+    cache = ResponseCache(max_entries=100, max_bytes=entry_size * 2)
+    for key in "xyz":
+        cache.set(key, _response("x"))
+    assert len(cache) == 2
+    assert cache.stats()["bytes"] <= entry_size * 2
+    assert not cache.set("huge", _response("x" * entry_size * 3))
+
+
+def test_ttl_expiry(clock):
+    cache = ResponseCache(ttl=10, clock=clock)
+    cache.set("a", _response())
+    cache.set("b", _response(), ttl=100)
+    clock.now = 11
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+
+
+def test_hits_are_independent_copies():
+    cache = ResponseCache()
+    cache.set("a", _response())
+    cache.get("a")["choices"][0]["message"]["content"] = "mutated"
+    assert cache.get("a")["choices"][0]["message"]["content"] == "Hello!"
+
+
+@pytest.fixture
+def cached_wrapper(make_openai_wrapper):
+    return make_openai_wrapper(cache=ResponseCache())
+
+
+def test_wrapper_serves_repeat_deterministic_calls_from_cache(cached_wrapper, openai_response):
+    with patch.object(cached_wrapper, '_make_api_call', return_value=openai_response()) as api_call:
+        first = cached_wrapper.chat_completion(MESSAGES, temperature=0)
+        second = cached_wrapper.chat_completion(MESSAGES, temperature=0)
+    assert api_call.call_count == 1
+    assert second["choices"] == first["choices"]
+    assert first["cost"] > 0
+    assert second["cost"] == 0.0
+    statuses = [call.kwargs["status"] for call in cached_wrapper._logger.log_call.call_args_list]
+    assert statuses == ["success", "cached"]
+    cached_log = cached_wrapper._logger.log_call.call_args_list[1].kwargs
+    assert cached_log["cost"] == 0.0
+    assert cached_log["prompt_tokens"] == 10
+    assert cached_wrapper._cache.stats()["hits"] == 1
+
+
+def test_wrapper_skips_cache_for_sampled_calls(cached_wrapper, openai_response):
+    with patch.object(cached_wrapper, '_make_api_call', return_value=openai_response()) as api_call:
+        cached_wrapper.chat_completion(MESSAGES, temperature=0.7)
+        cached_wrapper.chat_completion(MESSAGES, temperature=0.7)
+    assert api_call.call_count == 2
+    assert len(cached_wrapper._cache) == 0
@@ -0,0 +1,105 @@
+import multiprocessing
+import sqlite3
+from unittest.mock import patch
+
+from apilens import cache as cache_module
+from apilens.cache import DiskResponseCache
+
+
+def _response(text="Hello!"):
+    return {"choices": [{"message": {"content": text}}], "usage": {"prompt_tokens": 10, "completion_tokens": 20}, "cost": 0.5}
+
+
+def _table_totals(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache").fetchone()
+    finally:
+        conn.close()
+
+
+def test_round_trip_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache.db")
+    DiskResponseCache(path).set("k", _response())
+    reopened = DiskResponseCache(path)
+    assert reopened.get("k") == _response()
+    assert reopened.get("missing") is None
+    assert reopened.stats()["hits"] == 1
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_ttl_expiry(tmp_path, clock):
+    cache = DiskResponseCache(str(tmp_path / "cache.db"), ttl=10, clock=clock)
+    cache.set("a", _response())
+    clock.now += 11
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_lru_eviction_keeps_totals_exact(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    cache = DiskResponseCache(path, max_entries=3, touch_interval=0, clock=clock)
+    for key in "abc":
+        clock.now += 1
+        cache.set(key, _response(key))
+    clock.now += 1
+    assert cache.get("a") is not None  # "b" becomes least recently used
+    clock.now += 1
+    cache.set("d", _response("d"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert (stats["entries"], stats["bytes"]) == _table_totals(path)
+
+
+def test_byte_bound(tmp_path):
+    path = str(tmp_path / "cache.db")
+    entry_size = len(b'{"choices":[{"message":{"content":"x"}}],"usage":{"prompt_tokens":10,"completion_tokens":20},"cost":0.5}')
+    cache = DiskResponseCache(path, max_bytes=entry_size * 5)
+    for i in range(20):
+        cache.set(f"k{i}", _response("x"))
+    assert cache.stats()["bytes"] <= entry_size * 5
+    assert _table_totals(path) == (5, entry_size * 5)
+
+
+def _writer(path, worker, count):
+    cache = DiskResponseCache(path, max_entries=150)
+    for i in range(count):
+        cache.set(f"{worker}-{i}", _response(str(i)))
+        cache.get(f"{worker}-{i // 2}")
+
+
+def test_concurrent_processes_share_one_cache(tmp_path):
+    path = str(tmp_path / "cache.db")
+    DiskResponseCache(path)
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_writer, args=(path, w, 60)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(60)
+        assert p.exitcode == 0
+    stats = DiskResponseCache(path).stats()
+    assert (stats["entries"], stats["bytes"]) == _table_totals(path)
+    assert stats["entries"] == 150
+
+
+def test_wrappers_use_cache_from_environment(tmp_path, monkeypatch, make_openai_wrapper, openai_response):
+    monkeypatch.setenv("APILENS_CACHE_DB", str(tmp_path / "shared.db"))
+    monkeypatch.setattr(cache_module, "_default_caches", {})
+    messages = [{"role": "user", "content": "Hello!"}]
+
+    # Two wrappers with separate cache instances (think: two worker processes) share the file
+    first = make_openai_wrapper()
+    monkeypatch.setattr(cache_module, "_default_caches", {})
+    second = make_openai_wrapper()
+    assert first._cache is not second._cache
+    with patch.object(first, '_make_api_call', return_value=openai_response()):
+        first.chat_completion(messages, temperature=0)
+    with patch.object(second, '_make_api_call') as api_call:
+        assert second.chat_completion(messages, temperature=0)["choices"][0]["message"]["content"] == "Hello!"
+    api_call.assert_not_called()
@@ -0,0 +1,132 @@
+import base64
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from apilens.gemini_contents import ContentsConverter, benchmark
+
+
+def _conversation(turns):
+    messages = [{"role": "system", "content": "Be brief."}]
+    return messages + [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"} for i in range(turns)]
+
+
+def test_roles_and_system_instruction():
+    system, contents = ContentsConverter().convert([
+        {"role": "system", "content": "Be brief."},
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello"},
+        {"role": "system", "content": "Answer in French."},
+        {"role": "user", "content": "Weather?"},
+        {"role": "tool", "content": "ignored"},
+    ])
+    assert system == "Be brief.\n\nAnswer in French."
+    assert contents == [
+        {"role": "user", "parts": [{"text": "Hi"}]},
+        {"role": "model", "parts": [{"text": "Hello"}]},
+        {"role": "user", "parts": [{"text": "Weather?"}]},
+    ]
+
+
+def test_consecutive_turns_with_one_role_are_merged():
+    system, contents = ContentsConverter().convert([{"role": "user", "content": "a"}, {"role": "user", "content": "b"}])
+    assert system is None
+    assert contents == [{"role": "user", "parts": [{"text": "a"}, {"text": "b"}]}]
+
+
+def test_multimodal_parts():
+    image = base64.b64encode(b"\x89PNG").decode()
+    content = [{"type": "text", "text": "What is this?"},
+               {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image}"}},
+               {"type": "image_url", "image_url": {"url": "https://example.com/cat.png"}}]
+    _, contents = ContentsConverter().convert([{"role": "user", "content": content}])
+    assert contents[0]["parts"] == [{"text": "What is this?"},
+                                    {"inline_data": {"mime_type": "image/png", "data": b"\x89PNG"}}]
+
+
+def test_system_only_request_is_sent_as_the_user_turn():
+    assert ContentsConverter().convert([{"role": "system", "content": "Say hi"}]) == \
+        (None, [{"role": "user", "parts": [{"text": "Say hi"}]}])
+
+
+def test_growing_conversation_only_converts_new_messages():
+    converter = ContentsConverter()
+    conversation = _conversation(100)
+    converter.convert(conversation[:99])
+    before = converter.stats()["converted_messages"]
+
+    system, contents = converter.convert(conversation)
+    assert converter.stats()["converted_messages"] == before + 2
+    assert (system, contents) == ContentsConverter(cache_size=0).convert(conversation)
+    assert len(contents) == 100
+    # A merge into the last cached turn must not change what the shorter conversation converts to
+    converter.convert(conversation[:99] + [{"role": "assistant", "content": "extra"}])
+    assert converter.convert(conversation[:99])[1] == ContentsConverter().convert(conversation[:99])[1]
+
+
+def test_conversations_with_the_same_opening_do_not_evict_each_other():
+    converter = ContentsConverter()
+    opening = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}]
+    conversations = [list(opening) for _ in range(5)]
+    for turn in range(10):
+        for i, conversation in enumerate(conversations):
+            conversation.append({"role": "assistant" if turn % 2 == 0 else "user", "content": f"{i}.{turn}"})
+            converter.convert(conversation)
+    stats = converter.stats()
+    # Each call after a conversation's first converts only the appended message
+    assert stats["converted_messages"] == 5 * 3 + 5 * 9
+    assert (stats["misses"], stats["cached_conversations"]) == (5, 5)
+    assert converter.convert(conversations[3]) == ContentsConverter(cache_size=0).convert(conversations[3])
+
+
+def test_edited_history_is_converted_again():
+    converter = ContentsConverter()
+    conversation = _conversation(6)
+    converter.convert(conversation)
+    conversation[3]["content"] = "edited"
+    _, contents = converter.convert(conversation)
+    assert contents[2]["parts"] == [{"text": "edited"}]
+    assert converter.stats()["misses"] == 2
+
+
+def test_cache_is_bounded():
+    converter = ContentsConverter(cache_size=4)
+    for i in range(10):
+        converter.convert([{"role": "user", "content": f"conversation {i}"}])
+    assert converter.stats()["cached_conversations"] == 4
+
+
+def test_benchmark_conversion_cost_stays_flat():
+    results = benchmark(turns=400, message_chars=400)
+    assert results["memoized_conversions_per_message"] == 1.0
+    # Without the cache, each of the last turns converts ~400 messages
+    assert results["memoized_last_us"] < results["uncached_last_us"] / 3
+
+
+@pytest.fixture
+def gemini():
+    from apilens.gemini_wrapper import GeminiWrapper
+    with patch('apilens.gemini_wrapper.GEMINI_API_KEY', 'fake-key'), patch('apilens.gemini_wrapper.genai') as genai:
+        wrapper = GeminiWrapper(model="gemini-pro")
+        wrapper._logger = Mock()
+        yield wrapper, genai
+
+
+def test_wrapper_sends_native_contents_with_system_instruction(gemini):
+    wrapper, genai = gemini
+    metadata = SimpleNamespace(prompt_token_count=12, candidates_token_count=3)
+    part = SimpleNamespace(text="Hi!")
+    response = SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))],
+                               usage_metadata=metadata)
+    system_model = genai.GenerativeModel.return_value
+    system_model.generate_content.return_value = response
+
+    messages = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hello"}]
+    assert wrapper.chat_completion(messages)["choices"][0]["message"]["content"] == "Hi!"
+    wrapper.chat_completion(messages + [{"role": "assistant", "content": "Hi!"}, {"role": "user", "content": "Bye"}])
+
+    genai.GenerativeModel.assert_called_with(model_name="gemini-pro", system_instruction="Be brief.")
+    assert genai.GenerativeModel.call_count == 2  # the default model, then one for the system instruction
+    contents = system_model.generate_content.call_args[0][0]
+    assert [content["role"] for content in contents] == ["user", "model", "user"]
@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold `import apilens` budget; generous enough for slow CI machines, far
+# below the seconds it took when every provider SDK was imported eagerly.
+IMPORT_BUDGET_MS = float(os.getenv("APILENS_IMPORT_BUDGET_MS", "150"))
+
+HEAVY_MODULES = ["openai", "anthropic", "google.generativeai", "psycopg2", "pytz", "dotenv", "requests"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import apilens
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({"ms": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _probe(package_root):
+    # Run from the package root so it is the first entry on sys.path
+    best = None
+    for _ in range(3):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE], cwd=package_root, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(out)
+        if best is None or result["ms"] < best["ms"]:
+            best = result
+    return best
+
+
+@pytest.mark.parametrize("package_root", [ROOT, os.path.join(ROOT, "src")])
+def test_import_apilens_is_lazy_and_fast(package_root):
+    result = _probe(package_root)
+    assert result["loaded"] == []
+    assert result["ms"] < IMPORT_BUDGET_MS
+
+
+def test_wrappers_resolve_on_first_access():
+    import apilens
+    assert "OpenAIWrapper" in dir(apilens)
+    wrapper = apilens.OpenAIWrapper
+    from apilens.openai_wrapper import OpenAIWrapper
+    assert wrapper is OpenAIWrapper
+    with pytest.raises(AttributeError):
+        apilens.NoSuchWrapper
+
+
+_ENV_PROBE = """
+import json
+from apilens.anthropic_wrapper import ClaudeWrapper
+from apilens.openai_wrapper import OpenAIWrapper
+openai_wrapper = OpenAIWrapper()
+claude = ClaudeWrapper()
+print(json.dumps([openai_wrapper.client.api_key, claude.client.api_key, openai_wrapper.logger.api_url]))
+"""
+
+
+def test_src_wrappers_read_keys_from_dotenv(tmp_path):
+    # Importing apilens no longer loads .env, so the wrappers and logger must do it when they are built
+    (tmp_path / ".env").write_text("OPENAI_API_KEY=sk-from-dotenv\nANTHROPIC_API_KEY=ak-from-dotenv\n"
+                                   "POSTGRES_DB_URL=postgresql://dotenv/apilens\n")
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "POSTGRES_DB_URL")}
+    env["PYTHONPATH"] = os.path.join(ROOT, "src")
+    out = subprocess.run([sys.executable, "-c", _ENV_PROBE], cwd=tmp_path, env=env, capture_output=True, text=True,
+                         check=True).stdout
+    assert json.loads(out) == ["sk-from-dotenv", "ak-from-dotenv", "postgresql://dotenv/apilens"]
@@ -0,0 +1,120 @@
+import contextlib
+
+import pytest
+
+from apilens import migrations
+from apilens.logger import _APILogger
+from apilens.migrations import LATEST_VERSION, MIGRATIONS, ensure_schema, migrate
+from apilens.types import SchemaVersionError
+
+
+class FakeDatabase:
+    """Tracks the schema_migrations rows and every statement the migrator runs."""
+
+    def __init__(self, versions=()):
+        self.versions = list(versions)
+        self.has_version_table = bool(versions)
+        self.executed = []
+        self.connections = 0
+
+    def cursor(self):
+        db = self
+
+        class Cursor:
+            def execute(self, sql, params=None):
+                db.executed.append(sql)
+                if "to_regclass('schema_migrations')" in sql:
+                    self._row = ("schema_migrations" if db.has_version_table else None,)
+                elif "MAX(version)" in sql:
+                    self._row = (max(db.versions, default=0),)
+                elif "CREATE TABLE IF NOT EXISTS schema_migrations" in sql:
+                    db.has_version_table = True
+                elif sql.startswith("INSERT INTO schema_migrations"):
+                    db.versions.append(params[0])
+                elif "pg_partitioned_table" in sql:
+                    self._row = None
+
+            def fetchone(self):
+                return self._row
+
+            def fetchall(self):
+                return []
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+    def commit(self):
+        pass
+
+    @contextlib.contextmanager
+    def connection(self):
+        self.connections += 1
+        yield self
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    migrations._checked.clear()
+    migrations._partitions_due.clear()
+    yield
+    migrations._checked.clear()
+    migrations._partitions_due.clear()
+
+
+def test_migrate_applies_pending_versions_in_order():
+    db = FakeDatabase()
+    assert migrate("postgres://test", pool=db) == [m.version for m in MIGRATIONS]
+    assert db.versions == [m.version for m in MIGRATIONS]
+    assert db.executed[0].startswith("SELECT pg_advisory_xact_lock")
+    assert migrate("postgres://test", pool=db) == []
+
+
+def test_migrate_only_runs_newer_migrations():
+    db = FakeDatabase(versions=[1])
+    assert migrate("postgres://test", pool=db) == [m.version for m in MIGRATIONS if m.version > 1]
+    assert not any("PARTITION BY RANGE" in sql for sql in db.executed)
+
+
+def test_ensure_schema_checks_once_per_process():
+    db = FakeDatabase(versions=range(1, LATEST_VERSION + 1))
+    for _ in range(5):
+        ensure_schema("postgres://test", pool=db)
+    assert db.connections == 1
+
+
+def test_ensure_schema_creates_upcoming_partitions_once_per_interval(monkeypatch):
+    db = FakeDatabase(versions=range(1, LATEST_VERSION + 1))
+    now = [1000.0]
+    monkeypatch.setattr(migrations.time, "monotonic", lambda: now[0])
+
+    def partition_checks():
+        return sum("pg_partitioned_table" in sql for sql in db.executed)
+
+    for _ in range(3):
+        ensure_schema("postgres://test", pool=db)
+    assert (partition_checks(), db.connections) == (1, 1)
+    now[0] += migrations.PARTITION_CHECK_INTERVAL
+    ensure_schema("postgres://test", pool=db)
+    ensure_schema("postgres://test", pool=db)
+    assert partition_checks() == 2
+    assert sum("MAX(version)" in sql for sql in db.executed) == 1
+
+
+def test_ensure_schema_without_auto_migrate_refuses_old_schema():
+    db = FakeDatabase(versions=[1])
+    with pytest.raises(SchemaVersionError):
+        ensure_schema("postgres://test", auto_migrate=False, pool=db)
+    assert db.versions == [1]
+    # Not cached, so it is checked again once someone runs the migrations
+    migrate("postgres://test", pool=db)
+    ensure_schema("postgres://test", auto_migrate=False, pool=db)
+
+
+def test_logger_construction_does_no_schema_work(monkeypatch):
+    def connect(*args, **kwargs):
+        raise AssertionError("constructing a logger must not touch the database")
+
+    monkeypatch.setattr("psycopg2.connect", connect)
+    _APILogger(db_url="postgres://nowhere")
@@ -52,17 +52,21 @@ async def test_async_chat_completion_anthropic(anthropic_wrapper):
 
 # Test Streaming Functionality
 def test_chat_completion_stream_openai(openai_wrapper):
+    openai_wrapper._logger = Mock()
     mock_stream = [
-        MOCK_OPENAI_RESPONSE,
-        MOCK_OPENAI_RESPONSE
+        Mock(choices=[Mock(delta=Mock(content="Hello"))], usage=None),
+        Mock(choices=[Mock(delta=Mock(content="!"))], usage=None),
+        Mock(choices=[], usage=MOCK_OPENAI_RESPONSE.usage)
     ]
     with patch.object(openai_wrapper, '_make_api_call', return_value=mock_stream):
         responses = list(openai_wrapper.chat_completion_stream(
             messages=[{"role": "user", "content": "Hello!"}]
         ))
-        assert len(responses) == 2
-        assert responses[0]["choices"][0]["message"]["content"] == "Hello!"
-        assert responses[1]["choices"][0]["message"]["content"] == "Hello!"
+        assert len(responses) == 3
+        assert responses[0]["choices"][0]["delta"]["content"] == "Hello"
+        assert responses[1]["choices"][0]["delta"]["content"] == "!"
+        assert responses[2]["choices"][0]["message"]["content"] == "Hello!"
+        assert responses[2]["usage"] == {"prompt_tokens": 10, "completion_tokens": 20}
 
 # Test Error Handling
 def test_rate_limit_error_openai(openai_wrapper):
@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from apilens.partitions import (
+    drop_partitions_before,
+    ensure_partitions,
+    maintain_partitions,
+    next_period,
+    partition_name,
+    period_start,
+)
+
+
+class FakeCatalogCursor:
+    """Answers the catalog queries from an in-memory list of partitions."""
+
+    def __init__(self, partitions=(), partitioned=True, default_rows=False):
+        self.partitioned = partitioned
+        self.default_rows = default_rows
+        self.partitions = list(partitions)
+        self.executed = []
+        self._result = []
+        self.rowcount = -1
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        if "pg_partitioned_table" in sql:
+            self._result = [(1,)] if self.partitioned else []
+        elif "pg_inherits" in sql:
+            self._result = list(self.partitions)
+        elif sql.startswith("SELECT 1 FROM api_logs_default"):
+            self._result = [(1,)] if self.default_rows else []
+        else:
+            self._result = []
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+    def ddl(self):
+        return [sql.strip() for sql, _ in self.executed if sql.strip().startswith(("CREATE", "DROP", "ALTER", "WITH"))]
+
+
+def _bound(start, end):
+    return f"FOR VALUES FROM ('{start}') TO ('{end}')"
+
+
+def test_periods_and_names():
+    ts = datetime(2024, 12, 31, 23, 30, tzinfo=timezone.utc)
+    month = period_start(ts, "month")
+    assert month == datetime(2024, 12, 1, tzinfo=timezone.utc)
+    assert next_period(month, "month") == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert partition_name(month, "month") == "api_logs_p202412"
+    assert partition_name(period_start(ts, "day"), "day") == "api_logs_p20241231"
+    with pytest.raises(ValueError):
+        period_start(ts, "week")
+
+
+def test_ensure_partitions_creates_default_and_upcoming():
+    cur = FakeCatalogCursor()
+    now = datetime(2024, 5, 25, tzinfo=timezone.utc)
+    created = ensure_partitions(cur, interval="month", ahead=2, now=now)
+    assert created == ["api_logs_default", "api_logs_p202405", "api_logs_p202406", "api_logs_p202407"]
+    sql, params = cur.executed[-1]
+    assert "PARTITION OF api_logs FOR VALUES FROM" in sql
+    assert params == ("2024-07-01T00:00:00+00:00", "2024-08-01T00:00:00+00:00")
+
+
+def test_ensure_partitions_skips_covered_periods():
+    cur = FakeCatalogCursor([
+        ("api_logs_default", "DEFAULT"),
+        ("api_logs_p202405", _bound("2024-05-01 00:00:00+00", "2024-06-01 00:00:00+00")),
+    ])
+    now = datetime(2024, 5, 30, tzinfo=timezone.utc)
+    # Daily partitions inside an existing monthly one would overlap, so only June 1st is created
+    assert ensure_partitions(cur, interval="day", ahead=2, now=now) == ["api_logs_p20240601"]
+
+
+def test_rows_in_the_default_partition_are_moved_into_a_new_partition():
+    # A writer that fell behind on maintenance left June's rows in the default partition
+    cur = FakeCatalogCursor([("api_logs_default", "DEFAULT")], default_rows=True)
+    now = datetime(2024, 6, 10, tzinfo=timezone.utc)
+    assert ensure_partitions(cur, interval="month", ahead=0, now=now) == ["api_logs_p202406"]
+    create, move, attach = cur.ddl()
+    assert create == "CREATE TABLE api_logs_p202406 (LIKE api_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    assert "DELETE FROM api_logs_default" in move and "INSERT INTO api_logs_p202406 SELECT * FROM moved" in move
+    assert attach.startswith("ALTER TABLE api_logs ATTACH PARTITION api_logs_p202406 FOR VALUES FROM")
+    assert cur.executed[-1][1] == ("2024-06-01T00:00:00+00:00", "2024-07-01T00:00:00+00:00")
+
+
+def test_unpartitioned_table_is_left_alone():
+    cur = FakeCatalogCursor(partitioned=False)
+    assert ensure_partitions(cur, interval="day", ahead=1) == []
+    assert drop_partitions_before(cur, datetime(2024, 1, 1, tzinfo=timezone.utc)) == []
+    assert cur.ddl() == []
+
+
+def test_retention_drops_whole_expired_partitions():
+    cur = FakeCatalogCursor([
+        ("api_logs_default", "DEFAULT"),
+        ("api_logs_p202403", _bound("2024-03-01 00:00:00+00", "2024-04-01 00:00:00+00")),
+        ("api_logs_p202404", _bound("2024-04-01 00:00:00+00", "2024-05-01 00:00:00+00")),
+        ("api_logs_p202405", _bound("2024-05-01 00:00:00+00", "2024-06-01 00:00:00+00")),
+    ])
+    now = datetime(2024, 5, 20, tzinfo=timezone.utc)
+    result = maintain_partitions(cur, retention_days=30, now=now)
+    # April still holds rows newer than the cutoff (April 20th), so only March goes
+    assert result["dropped"] == ["api_logs_p202403"]
+    assert "DROP TABLE IF EXISTS api_logs_p202403" in cur.ddl()
+    assert not any("DELETE" in sql for sql, _ in cur.executed)
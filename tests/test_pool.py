@@ -0,0 +1,122 @@
+import threading
+import pytest
+from psycopg2 import extensions
+from apilens import pool as pool_module
+from apilens.pool import ConnectionPool, get_pool, close_all_pools
+from apilens.types import PoolTimeoutError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise Exception("server closed the connection unexpectedly")
+        self.conn.executed.append(sql)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    created = []
+
+    def connect(dsn):
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    monkeypatch.setattr(pool_module.psycopg2, "connect", connect)
+    yield created
+    close_all_pools()
+
+
+def test_connections_are_reused(connections):
+    pool = ConnectionPool("postgres://test", max_size=4)
+    for _ in range(10):
+        with pool.connection():
+            pass
+    assert len(connections) == 1
+    stats = pool.stats()
+    assert stats["acquisitions"] == 10
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 1
+
+
+def test_acquire_times_out_when_exhausted(connections):
+    pool = ConnectionPool("postgres://test", max_size=1, acquire_timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_waiter_gets_released_connection(connections):
+    pool = ConnectionPool("postgres://test", max_size=1, acquire_timeout=5)
+    conn = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    pool.release(conn)
+    waiter.join(5)
+    assert got == [conn]
+    assert pool.stats()["waits"] == 1
+
+
+def test_idle_connections_are_evicted(connections):
+    pool = ConnectionPool("postgres://test", min_size=0, max_size=4, max_idle=0)
+    with pool.connection():
+        pass
+    with pool.connection():
+        pass
+    assert connections[0].closed
+    assert pool.stats()["evicted"] >= 1
+
+
+def test_unhealthy_connection_is_replaced(connections):
+    pool = ConnectionPool("postgres://test", health_check_interval=0)
+    with pool.connection():
+        pass
+    connections[0].broken = True
+    with pool.connection() as conn:
+        assert conn is connections[1]
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_statements_are_prepared_once_per_connection(connections):
+    pool = ConnectionPool("postgres://test")
+    for _ in range(3):
+        with pool.connection() as conn:
+            pool.prepare(conn, "apilens_test_insert", "INSERT INTO t VALUES ($1)")
+    prepares = [sql for sql in connections[0].executed if sql.startswith("PREPARE")]
+    assert prepares == ["PREPARE apilens_test_insert AS INSERT INTO t VALUES ($1)"]
+
+
+def test_get_pool_is_process_wide(connections):
+    assert get_pool("postgres://a") is get_pool("postgres://a")
+    assert get_pool("postgres://a") is not get_pool("postgres://b")
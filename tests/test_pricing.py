@@ -0,0 +1,153 @@
+import json
+import logging
+import math
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+
+from apilens import pricing
+from apilens.config import PRICING
+from apilens.pricing import ModelPrice, PricingEngine, calculate_cost, get_engine, set_engine
+
+
+@pytest.fixture
+def engine():
+    return PricingEngine()
+
+
+@pytest.mark.parametrize("model,expected", [
+    ("gpt-4", "gpt-4"),
+    ("gpt-4-0613", "gpt-4"),
+    ("gpt-4-turbo-preview", "gpt-4-turbo"),
+    ("gpt-4-turbo-2024-04-09", "gpt-4-turbo"),
+    ("gpt-4o-2024-08-06", "gpt-4o"),
+    ("gpt-4o-mini-2024-07-18", "gpt-4o-mini"),
+    ("chatgpt-4o-latest", "gpt-4o"),
+    ("claude-3-opus-20240229", "claude-3-opus"),
+    ("claude-3-5-sonnet-latest", "claude-3-5-sonnet"),
+    ("gemini-1.5-pro@002", "gemini-1.5-pro"),
+    ("gemini-pro-vision", "gemini-pro-vision"),
+    ("gpt-4.5-preview", None),
+    ("gpt-4omni", None),
+    ("llama-3", None),
+    (None, None),
+])
+def test_resolves_dated_names_and_aliases_by_longest_prefix(engine, model, expected):
+    assert engine.resolve(model) == expected
+
+
+def test_prices_in_effect_when_the_call_was_made(engine):
+    assert engine.price("gpt-4o", at="2024-06-01").input == 5.0
+    assert engine.price("gpt-4o-2024-08-06", at=datetime(2024, 11, 1)).input == 2.5
+    assert engine.price("gpt-4o") == engine.price("gpt-4o", at=time.time())
+
+
+def test_current_price_switches_when_a_new_price_takes_effect():
+    engine = PricingEngine({"m": [ModelPrice(1.0, 2.0), ModelPrice(3.0, 4.0, effective_from="2030-01-01")]})
+    with patch.object(pricing.time, "time", return_value=pricing.to_epoch("2029-12-31")):
+        assert engine.price("m").input == 1.0
+    with patch.object(pricing.time, "time", return_value=pricing.to_epoch("2030-01-01")):
+        assert engine.price("m").input == 3.0
+    assert engine.price("m", at="1999-01-01").input == 1.0
+
+
+def test_cached_and_cache_write_tiers(engine):
+    # 1000 prompt tokens: 600 read from cache, 100 written to it, 300 uncached
+    cost = engine.cost("claude-3-5-sonnet-20241022", 1000, 200, cached_tokens=600, cache_write_tokens=100)
+    assert cost == pytest.approx((300 * 3.0 + 600 * 0.3 + 100 * 3.75 + 200 * 15.0) / 1e6)
+    # Without a cached rate, cached tokens cost the normal input rate
+    assert engine.cost("gpt-4", 1000, 0, cached_tokens=500) == engine.cost("gpt-4", 1000, 0)
+
+
+def test_unknown_models_cost_nothing_and_warn_once(engine, caplog):
+    with caplog.at_level(logging.WARNING, logger="apilens.pricing"):
+        assert engine.cost("mystery-model", 1000, 1000) == 0.0
+        assert engine.cost("mystery-model", 1000, 1000) == 0.0
+    assert len([r for r in caplog.records if "mystery-model" in r.getMessage()]) == 1
+
+
+def test_set_price_overrides_and_invalidates_resolution(engine):
+    assert engine.resolve("gpt-4-32k-0613") == "gpt-4-32k"
+    engine.set_price("gpt-4-32k-0613", ModelPrice(1.0, 1.0))
+    assert engine.resolve("gpt-4-32k-0613") == "gpt-4-32k-0613"
+    engine.set_price("gpt-4", ModelPrice(40.0, 80.0))
+    assert engine.price("gpt-4").input == 40.0
+
+
+def test_config_pricing_is_a_per_1k_view():
+    assert PRICING["gpt-3.5-turbo"] == {"input": 0.0015, "output": 0.002}
+    assert "claude-3-opus-20240229" in PRICING
+    assert "llama-3" not in PRICING
+    assert PRICING.get("llama-3") is None
+    assert "gpt-4" in list(PRICING.keys())
+    assert calculate_cost("gpt-4", 1000, 1000) == pytest.approx(0.09)
+
+
+def test_prices_file_adds_entries(tmp_path, monkeypatch):
+    path = tmp_path / "prices.json"
+    path.write_text(json.dumps({"in-house-llm": {"input": 1, "output": 2},
+                                "gpt-4": [{"input": 20, "output": 40, "effective_from": "2020-01-01"}]}))
+    monkeypatch.setenv("APILENS_PRICES_FILE", str(path))
+    set_engine(None)
+    try:
+        assert get_engine().cost("in-house-llm-v2", 1_000_000, 0) == 1.0
+        assert get_engine().price("gpt-4").input == 20
+        assert get_engine().price("gpt-4", at="2019-06-01").input == 30.0
+    finally:
+        set_engine(None)
+
+
+def _rows(n):
+    models = ["gpt-4o-2024-08-06", "gpt-4", "claude-3-haiku-20240307", "unknown-model", "gemini-pro"]
+    return (
+        [models[i % len(models)] for i in range(n)],
+        [100 + i % 900 for i in range(n)],
+        [10 + i % 90 for i in range(n)],
+        [i % 50 for i in range(n)],
+        [pricing.to_epoch("2024-09-01") + i * 3600 for i in range(n)],
+    )
+
+
+def _assert_matches_scalar(engine, costs, models, prompt, completion, cached, timestamps):
+    for i in range(len(models)):
+        if engine.resolve(models[i]) is None:
+            assert math.isnan(costs[i])
+        else:
+            expected = engine.cost(models[i], prompt[i], completion[i], cached[i], at=timestamps[i])
+            assert costs[i] == pytest.approx(expected)
+
+
+def test_cost_many_without_numpy_matches_scalar_costs(engine):
+    models, prompt, completion, cached, timestamps = _rows(200)
+    with patch.object(pricing, "_numpy", return_value=None):
+        costs = engine.cost_many(models, prompt, completion, cached, timestamps=timestamps)
+    assert isinstance(costs, list)
+    _assert_matches_scalar(engine, costs, models, prompt, completion, cached, timestamps)
+
+
+def test_cost_many_vectorized_matches_scalar_costs(engine):
+    np = pytest.importorskip("numpy")
+    models, prompt, completion, cached, timestamps = _rows(2000)
+    costs = engine.cost_many(models, prompt, completion, cached, timestamps=timestamps)
+    _assert_matches_scalar(engine, costs, models, prompt, completion, cached, timestamps)
+    # The gpt-4o price cut on 2024-10-02 falls inside the range
+    cutoff = pricing.to_epoch("2024-10-02")
+    assert {t < cutoff for m, t in zip(models, timestamps) if m.startswith("gpt-4o")} == {True, False}
+    as_datetimes = [datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None) for t in timestamps]
+    assert np.array_equal(engine.cost_many(models, prompt, completion, cached, timestamps=as_datetimes), costs,
+                          equal_nan=True)
+    current = engine.cost_many(models, prompt, completion)
+    assert current[1] == pytest.approx(engine.cost(models[1], prompt[1], completion[1]))
+
+
+def test_cost_many_prices_a_million_rows_quickly(engine):
+    pytest.importorskip("numpy")
+    models, prompt, completion, cached, timestamps = _rows(1000)
+    scale = 1000
+    started = time.perf_counter()
+    costs = engine.cost_many(models * scale, prompt * scale, completion * scale, cached * scale,
+                             timestamps=timestamps * scale)
+    assert time.perf_counter() - started < 10
+    assert len(costs) == 1_000_000
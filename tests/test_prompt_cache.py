@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from apilens import AnthropicWrapper
+from apilens.prompt_cache import EPHEMERAL, add_cache_breakpoints, anthropic_usage, openai_cache_usage
+from apilens.schema import API_LOGS_CACHE_TOKEN_COLUMNS, ensure_api_logs_cache_tokens
+from apilens.tokens import usage_from_metadata
+
+LONG = "The quick brown fox jumps over the lazy dog, then checks the invoice total. " * 100
+
+
+def test_breakpoints_on_long_system_prompt_and_conversation():
+    messages = [{"role": "user", "content": LONG}, {"role": "assistant", "content": "Noted."},
+                {"role": "user", "content": "Summarise it."}]
+    system, marked = add_cache_breakpoints(LONG, messages, "claude-3-opus-20240229")
+    assert system == [{"type": "text", "text": LONG, "cache_control": EPHEMERAL}]
+    # The last message and the user turn before it
+    assert marked[2]["content"] == [{"type": "text", "text": "Summarise it.", "cache_control": EPHEMERAL}]
+    assert marked[0]["content"][-1]["cache_control"] == EPHEMERAL
+    assert marked[1]["content"] == "Noted."
+    assert messages[2]["content"] == "Summarise it."
+
+
+def test_short_prompts_and_marked_requests_are_left_alone():
+    messages = [{"role": "user", "content": "Hi"}]
+    assert add_cache_breakpoints("Be nice", messages, "claude-3-opus-20240229") == ("Be nice", messages)
+    marked = [{"role": "user", "content": [{"type": "text", "text": LONG, "cache_control": EPHEMERAL}]},
+              {"role": "assistant", "content": "Noted."}, {"role": "user", "content": LONG}]
+    assert add_cache_breakpoints(None, marked, "claude-3-opus-20240229") == (None, marked)
+    # Haiku needs a longer prefix
+    one_block = [{"role": "user", "content": LONG[:4000]}]
+    assert add_cache_breakpoints(None, one_block, "claude-3-haiku-20240307")[1] == one_block
+    assert add_cache_breakpoints(None, one_block, "claude-3-opus-20240229")[1] != one_block
+
+
+def test_usage_parsing():
+    usage = SimpleNamespace(input_tokens=100, output_tokens=10, cache_read_input_tokens=2000,
+                            cache_creation_input_tokens=0)
+    assert anthropic_usage(usage) == {"prompt_tokens": 2100, "cache_read_tokens": 2000, "cache_write_tokens": 0}
+    assert anthropic_usage(SimpleNamespace(input_tokens=25)) == {"prompt_tokens": 25}
+    details = SimpleNamespace(cached_tokens=1536)
+    assert openai_cache_usage(SimpleNamespace(prompt_tokens_details=details)) == {"cache_read_tokens": 1536}
+    assert openai_cache_usage(Mock()) == {}
+    metadata = SimpleNamespace(prompt_token_count=5000, candidates_token_count=20, cached_content_token_count=4096)
+    assert usage_from_metadata(metadata)["cache_read_tokens"] == 4096
+
+
+def test_anthropic_call_prices_and_logs_cache_tokens():
+    with patch('apilens.anthropic_wrapper.ANTHROPIC_API_KEY', 'fake-key'):
+        wrapper = AnthropicWrapper(model="claude-3-opus-20240229")
+    wrapper._logger = Mock()
+    wrapper.client = Mock()
+    wrapper.client.messages.create.return_value = SimpleNamespace(
+        content=[SimpleNamespace(text="Done")],
+        usage=SimpleNamespace(input_tokens=100, output_tokens=10, cache_read_input_tokens=2000,
+                              cache_creation_input_tokens=0),
+    )
+    result = wrapper.chat_completion([{"role": "system", "content": LONG}, {"role": "user", "content": "Go"}])
+
+    params = wrapper.client.messages.create.call_args.kwargs
+    assert params["system"][0]["cache_control"] == EPHEMERAL
+    # 100 input tokens at $15/M, 2000 cache reads at $1.50/M, 10 output tokens at $75/M
+    assert result["cost"] == pytest.approx(0.00525)
+    log = wrapper._logger.log_call.call_args.kwargs
+    assert (log["prompt_tokens"], log["cache_read_tokens"], log["cache_write_tokens"]) == (2100, 2000, 0)
+
+
+def test_prompt_caching_can_be_disabled():
+    with patch('apilens.anthropic_wrapper.ANTHROPIC_API_KEY', 'fake-key'):
+        wrapper = AnthropicWrapper(model="claude-3-opus-20240229", prompt_caching=False)
+    assert wrapper._build_params([{"role": "system", "content": LONG}, {"role": "user", "content": "Go"}])["system"] == LONG
+
+
+def test_openai_cached_prompt_tokens_are_billed_at_the_cached_rate(make_openai_wrapper):
+    wrapper = make_openai_wrapper(model="gpt-4o-mini")
+    response = Mock()
+    response.choices = [Mock(message=Mock(content="Hi"))]
+    response.usage = SimpleNamespace(prompt_tokens=2000, completion_tokens=10,
+                                     prompt_tokens_details=SimpleNamespace(cached_tokens=1536))
+    with patch.object(wrapper, '_make_api_call', return_value=response):
+        result = wrapper.chat_completion([{"role": "user", "content": "Hello"}])
+    assert result["cost"] == pytest.approx((464 * 0.15 + 1536 * 0.075 + 10 * 0.6) / 1_000_000)
+    log = wrapper._logger.log_call.call_args.kwargs
+    assert log["cache_read_tokens"] == 1536 and "cache_write_tokens" not in log
+
+
+@pytest.fixture
+def gemini():
+    from apilens.gemini_wrapper import GeminiWrapper
+    with patch('apilens.gemini_wrapper.GEMINI_API_KEY', 'fake-key'), patch('apilens.gemini_wrapper.genai') as genai:
+        wrapper = GeminiWrapper(model="gemini-pro", context_cache_ttl=600)
+        wrapper._logger = Mock()
+        yield wrapper, genai
+
+
+def test_gemini_reuses_a_context_cache_for_long_system_instructions(gemini):
+    wrapper, genai = gemini
+    system = LONG * 3
+    assert wrapper._client_for(system) is wrapper._client_for(system)
+    genai.caching.CachedContent.create.assert_called_once()
+    assert genai.caching.CachedContent.create.call_args.kwargs["ttl"].total_seconds() == 600
+    genai.GenerativeModel.from_cached_content.assert_called_once_with(
+        cached_content=genai.caching.CachedContent.create.return_value)
+    # Short instructions are not worth a cache
+    wrapper._client_for("Be brief.")
+    genai.GenerativeModel.assert_called_with(model_name="gemini-pro", system_instruction="Be brief.")
+    assert genai.caching.CachedContent.create.call_count == 1
+
+
+def test_gemini_falls_back_when_context_caching_fails(gemini):
+    wrapper, genai = gemini
+    genai.caching.CachedContent.create.side_effect = ValueError("model does not support caching")
+    client = wrapper._client_for(LONG * 3)
+    assert client is genai.GenerativeModel.return_value
+    assert wrapper.context_cache_ttl is None
+
+
+def test_migration_adds_cache_token_columns():
+    cur = Mock()
+    ensure_api_logs_cache_tokens(cur)
+    for column in API_LOGS_CACHE_TOKEN_COLUMNS:
+        assert f"ADD COLUMN IF NOT EXISTS {column} INTEGER" in cur.execute.call_args.args[0]
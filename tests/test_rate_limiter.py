@@ -0,0 +1,126 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from apilens import rate_limiter
+from apilens.rate_limiter import RateLimiter, TokenBucket, get_limiter, set_rate_limit
+
+MESSAGES = [{"role": "user", "content": "Hello!"}]
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    with patch.dict(rate_limiter._limits, clear=True), patch.dict(rate_limiter._limiters, clear=True):
+        yield
+
+
+def test_bucket_allows_burst_then_paces(clock):
+    bucket = TokenBucket(60, clock=clock)
+    assert [bucket.reserve(1) for _ in range(60)] == [0.0] * 60
+    # One per second once the minute's budget is spent
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(1) == pytest.approx(2.0)
+    clock.now = 2.0
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+
+
+def test_oversized_request_waits_for_a_full_bucket_not_forever(clock):
+    bucket = TokenBucket(1000, clock=clock)
+    bucket.reserve(500)
+    assert bucket.reserve(5000) == pytest.approx(30.0)
+
+
+def test_reconcile_refunds_and_charges_the_estimate(clock):
+    limiter = RateLimiter(tpm=6000, clock=clock)
+    reservation = limiter.reserve(6000)
+    assert limiter.wait_time(100) == pytest.approx(1.0)
+    limiter.reconcile(reservation, 600)
+    assert limiter.wait_time(100) == 0.0
+    limiter.reconcile(limiter.reserve(0), 5500)
+    assert limiter.wait_time(200) == pytest.approx(3.0)
+
+
+def test_reconcile_only_refunds_what_an_oversized_reservation_took(clock):
+    limiter = RateLimiter(tpm=1000, clock=clock)
+    reservation = limiter.reserve(5000)
+    limiter.reserve(500)
+    # 1500 taken in all; refunding the unused part of the first reservation leaves 500 owed
+    limiter.reconcile(reservation, 0)
+    assert limiter.wait_time(0) == 0.0
+    assert limiter.wait_time(1000) == pytest.approx(30.0)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_async_acquire_gives_its_reservation_back(clock):
+    limiter = RateLimiter(rpm=60, tpm=6000, clock=clock)
+    limiter.reserve(6000)
+    waiter = asyncio.ensure_future(limiter.acquire_async(3000))
+    await asyncio.sleep(0)
+    assert limiter.wait_time(0) == pytest.approx(30.0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.wait_time(0) == 0.0
+
+
+def test_stats_report_waits(clock):
+    limiter = RateLimiter(rpm=2, clock=clock)
+    limiter.reserve(0)
+    limiter.reserve(0)
+    limiter.reserve(0)
+    stats = limiter.stats()
+    assert stats["requests"] == 3
+    assert stats["waits"] == 1
+    assert stats["wait_time_total"] == pytest.approx(30.0)
+    assert stats["current_wait"] == pytest.approx(60.0)
+
+
+def test_registry_is_shared_and_model_limits_override_provider():
+    assert get_limiter("openai", "gpt-4") is None
+    set_rate_limit("openai", rpm=100)
+    set_rate_limit("openai", "gpt-4", rpm=10, tpm=1000)
+    assert get_limiter("openai", "gpt-4") is get_limiter("openai", "gpt-4")
+    assert get_limiter("openai", "gpt-4").rpm == 10
+    assert get_limiter("openai", "gpt-3.5-turbo").rpm == 100
+    assert get_limiter("anthropic", "claude-3-opus") is None
+    set_rate_limit("openai", "gpt-4")
+    assert get_limiter("openai", "gpt-4").rpm == 100
+
+
+def test_wrapper_waits_and_reconciles_usage(openai_wrapper, openai_response):
+    set_rate_limit("openai", "gpt-3.5-turbo", rpm=1, tpm=10000)
+    with patch.object(openai_wrapper, '_make_api_call', return_value=openai_response()), \
+            patch.object(rate_limiter.time, 'sleep') as sleep:
+        openai_wrapper.chat_completion(MESSAGES, max_tokens=500)
+        sleep.assert_not_called()
+        openai_wrapper.chat_completion(MESSAGES, max_tokens=500)
+    assert sleep.call_args.args[0] == pytest.approx(60.0, abs=1)
+    limiter = get_limiter("openai", "gpt-3.5-turbo")
+    # Both estimates (500+ tokens each) were replaced by the real 30 tokens
+    assert limiter._tokens._tokens == pytest.approx(10000 - 60, abs=5)
+
+
+def test_failed_call_refunds_tokens(openai_wrapper):
+    set_rate_limit("openai", tpm=10000)
+    with patch.object(openai_wrapper, '_make_api_call', side_effect=ValueError("boom")):
+        with pytest.raises(ValueError):
+            openai_wrapper.chat_completion(MESSAGES, max_tokens=5000)
+    assert get_limiter("openai", "gpt-3.5-turbo").wait_time(10000) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_async_wrapper_waits_on_the_event_loop(openai_wrapper, openai_response):
+    set_rate_limit("openai", rpm=1)
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    async def api_call(messages, **kwargs):
+        return openai_response()
+
+    with patch.object(openai_wrapper, '_make_async_api_call', new=api_call), \
+            patch.object(rate_limiter.asyncio, 'sleep', new=fake_sleep):
+        await asyncio.gather(*(openai_wrapper.async_chat_completion(MESSAGES) for _ in range(3)))
+    assert sleeps == [pytest.approx(60.0, abs=1), pytest.approx(120.0, abs=1)]
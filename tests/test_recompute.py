@@ -0,0 +1,166 @@
+import contextlib
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from apilens.pricing import ModelPrice, PricingEngine
+from apilens.recompute import (RECOMPUTE_STATEMENT, REPRICED_COST, create_job, main, price_table, recompute_costs,
+                                run_job)
+
+START = datetime(2024, 9, 30, 22, tzinfo=timezone.utc)
+
+
+class FakeDatabase:
+    """One cost_recompute_jobs row plus the models logged in api_logs; records each chunk's parameters."""
+
+    def __init__(self, models=("gpt-4o-2024-08-06",), fail_at=None):
+        self.models = list(models)
+        self.job = None
+        self.chunks = []
+        self.statuses = []
+        self.fail_at = fail_at
+
+    def cursor(self):
+        db = self
+
+        class Cursor:
+            def execute(self, sql, params=None):
+                if sql.startswith("INSERT INTO cost_recompute_jobs"):
+                    start, end, models, checkpoint = params
+                    db.job = {"id": 7, "start_time": start, "end_time": end, "models": models,
+                              "checkpoint": checkpoint, "rows_updated": 0, "cost_delta": 0.0, "status": "pending",
+                              "error_message": None, "created_at": start, "updated_at": start}
+                    self._row = (7,)
+                elif sql.startswith("SELECT id, start_time"):
+                    self._row = tuple(db.job.values()) if db.job and params == (db.job["id"],) else None
+                elif sql.startswith("SELECT DISTINCT model"):
+                    self._rows = [(model,) for model in db.models]
+                elif "FOR UPDATE" in sql:
+                    self._row = (db.job["checkpoint"], db.job["end_time"])
+                elif sql is RECOMPUTE_STATEMENT:
+                    if params["start"] == db.fail_at:
+                        raise RuntimeError("connection reset")
+                    db.chunks.append(params)
+                    self._row = (10, 0.5)
+                elif "SET checkpoint" in sql:
+                    checkpoint, rows, delta, _ = params
+                    db.job.update(checkpoint=checkpoint, rows_updated=db.job["rows_updated"] + rows,
+                                  cost_delta=db.job["cost_delta"] + delta)
+                elif "SET status" in sql:
+                    db.job.update(status=params[0], error_message=params[1])
+                    db.statuses.append(params[0])
+
+            def fetchone(self):
+                return self._row
+
+            def fetchall(self):
+                return self._rows
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self
+
+
+def test_price_table_covers_every_dated_price_of_the_selected_models():
+    db = FakeDatabase(models=["claude-3-haiku-20240307", "gpt-4o-2024-08-06", "gpt-4o-mini", "in-house-llm"])
+    prices, unpriced = price_table(db.cursor(), START, START + timedelta(hours=4), ["gpt-4o", "in-house-llm"],
+                                   PricingEngine())
+    # gpt-4o-mini resolves to its own entry, so selecting gpt-4o leaves it alone
+    assert prices["models"] == ["gpt-4o-2024-08-06", "gpt-4o-2024-08-06"]
+    assert prices["valid_from"][0] == float("-inf") and prices["valid_until"][-1] == float("inf")
+    assert prices["valid_until"][0] == prices["valid_from"][1] == datetime(2024, 10, 2, tzinfo=timezone.utc).timestamp()
+    assert (prices["input"], prices["output"]) == ([5.0, 2.5], [15.0, 10.0])
+    # The older price has no cached rate, so cache reads fall back to the input rate
+    assert (prices["cached_input"], prices["cache_write"]) == ([5.0, 1.25], [5.0, 2.5])
+    assert unpriced == ["in-house-llm"]
+
+    all_models, _ = price_table(db.cursor(), START, START + timedelta(hours=4), engine=PricingEngine())
+    assert set(all_models["models"]) == {"claude-3-haiku-20240307", "gpt-4o-2024-08-06", "gpt-4o-mini"}
+
+
+def test_recompute_runs_checkpointed_chunks():
+    db = FakeDatabase()
+    job = recompute_costs(START, START + timedelta(hours=2, minutes=30), ["gpt-4o"], pool=db,
+                          chunk=timedelta(hours=1), engine=PricingEngine())
+    assert [(c["start"], c["end"]) for c in db.chunks] == [
+        (START, START + timedelta(hours=1)),
+        (START + timedelta(hours=1), START + timedelta(hours=2)),
+        (START + timedelta(hours=2), START + timedelta(hours=2, minutes=30)),
+    ]
+    assert db.chunks[0]["unbilled"] == ["cached", "coalesced"]
+    assert job["status"] == "done"
+    assert job["checkpoint"] == job["end_time"]
+    assert (job["rows_updated"], job["cost_delta"]) == (30, 1.5)
+    assert db.statuses == ["running", "done"]
+
+
+def test_failed_job_resumes_from_its_checkpoint():
+    db = FakeDatabase(fail_at=START + timedelta(hours=1))
+    with pytest.raises(RuntimeError):
+        recompute_costs(START, START + timedelta(hours=3), pool=db, chunk=timedelta(hours=1), engine=PricingEngine())
+    assert db.job["status"] == "failed"
+    assert db.job["error_message"] == "connection reset"
+    assert db.job["checkpoint"] == START + timedelta(hours=1)
+
+    db.fail_at = None
+    job = run_job(7, pool=db, chunk=timedelta(hours=1), engine=PricingEngine())
+    assert [c["start"] for c in db.chunks] == [START, START + timedelta(hours=1), START + timedelta(hours=2)]
+    assert (job["status"], job["rows_updated"]) == ("done", 30)
+
+
+def test_chunks_without_priced_models_are_skipped():
+    db = FakeDatabase(models=["in-house-llm"])
+    job = recompute_costs(START, START + timedelta(hours=2), pool=db, engine=PricingEngine())
+    assert db.chunks == []
+    assert job["status"] == "done"
+
+
+def test_statement_reprices_at_call_time_and_updates_every_rollup():
+    assert "a.timestamp >= to_timestamp(p.valid_from)" in RECOMPUTE_STATEMENT
+    assert "a.cost IS DISTINCT FROM r.new_cost" in RECOMPUTE_STATEMENT
+    for table in ("api_logs_rollup_minute", "api_logs_rollup_hour", "api_logs_rollup_day"):
+        assert f"INSERT INTO {table} AS r" in RECOMPUTE_STATEMENT
+
+
+def test_batch_rows_keep_their_discount_in_a_mixed_range():
+    # The repricing expression is plain SQL, so it can be checked against rows without a Postgres server
+    price = PricingEngine().price("gpt-4o-mini")
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE a (status TEXT, prompt_tokens INT, completion_tokens INT, cache_read_tokens INT,"
+               " cache_write_tokens INT)")
+    db.execute("CREATE TABLE p (input REAL, cached_input REAL, cache_write REAL, output REAL)")
+    db.execute("INSERT INTO p VALUES (?, ?, ?, ?)", price.rates())
+    rows = [("success", 1000, 100, None, None), ("batch_success", 1000, 100, None, None),
+            ("batch_failed", 0, 0, None, None), ("success", 1000, 100, 512, None), (None, 1000, 100, None, None)]
+    db.executemany("INSERT INTO a VALUES (?, ?, ?, ?, ?)", rows)
+    costs = [row[0] for row in db.execute(f"SELECT {REPRICED_COST} FROM a, p")]
+
+    full = price.cost(1000, 100)
+    assert costs[0] == pytest.approx(full)
+    assert costs[1] == pytest.approx(full * 0.5)
+    assert costs[2] == 0
+    assert costs[3] == pytest.approx(price.cost(1000, 100, cached_tokens=512))
+    assert costs[4] == pytest.approx(full)
+
+
+def test_job_ranges_must_not_be_empty():
+    with pytest.raises(ValueError):
+        create_job(FakeDatabase().cursor(), START, START)
+
+
+def test_cli_requires_a_range(monkeypatch):
+    monkeypatch.setenv("POSTGRES_DB_URL", "postgres://test")
+    with pytest.raises(SystemExit):
+        main(["--start", "2024-10-01"])
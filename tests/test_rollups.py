@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from apilens.rollups import aggregate, build_stats_query, truncate
+
+
+def test_truncate_to_utc_buckets():
+    ts = datetime(2024, 5, 25, 17, 42, 13, 500, tzinfo=timezone(timedelta(hours=5, minutes=30)))
+    assert truncate(ts, "minute") == datetime(2024, 5, 25, 12, 12, tzinfo=timezone.utc)
+    assert truncate(ts, "hour") == datetime(2024, 5, 25, 12, tzinfo=timezone.utc)
+    assert truncate(ts, "day") == datetime(2024, 5, 25, tzinfo=timezone.utc)
+    with pytest.raises(ValueError):
+        truncate(ts, "week")
+
+
+def test_aggregate_sums_per_bucket_and_key():
+    base = datetime(2024, 5, 25, 12, 0, 30, tzinfo=timezone.utc)
+    records = [
+        (base, "t1", "u1", "openai", "gpt-4", "success", 10, 20, 0.5),
+        (base + timedelta(seconds=10), "t1", "u1", "openai", "gpt-4", "success", 1, 2, 0.25),
+        (base + timedelta(minutes=5), "t1", "u1", "openai", "gpt-4", "success", 1, 1, 0.25),
+        # Spilled rows come back with ISO timestamps; missing values count as empty/zero
+        ((base + timedelta(minutes=5)).isoformat(), None, None, "openai", "gpt-4", "failed", None, None, None),
+    ]
+    totals = aggregate(records)
+    minute = datetime(2024, 5, 25, 12, 0, tzinfo=timezone.utc)
+    assert totals["minute"][(minute, "t1", "u1", "openai", "gpt-4", "success")] == [2, 11, 22, 0.75]
+    assert len(totals["minute"]) == 3
+    hour_key = (datetime(2024, 5, 25, 12, tzinfo=timezone.utc), "t1", "u1", "openai", "gpt-4", "success")
+    assert totals["hour"][hour_key] == [3, 12, 23, 1.0]
+    day_key = (datetime(2024, 5, 25, tzinfo=timezone.utc), "", "", "openai", "gpt-4", "failed")
+    assert totals["day"][day_key] == [1, 0, 0, 0.0]
+
+
+def test_build_stats_query_whitelists_dimensions():
+    query, params = build_stats_query("hour", ["provider"], {"status": "success", "model": None})
+    assert "FROM api_logs_rollup_hour" in query
+    assert "status = %s" in query and "model = %s" not in query
+    assert params == ["success", 1000]
+    with pytest.raises(ValueError):
+        build_stats_query("hour", ["provider; DROP TABLE api_logs"], {})
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from apilens.singleflight import SingleFlight
+
+MESSAGES = [{"role": "user", "content": "Hello!"}]
+
+
+def test_concurrent_threads_share_one_call():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(group.do("k", slow))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    while group.coalesced < 7:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert {result for result, _ in results} == {"result"}
+    assert group.stats() == {"leaders": 1, "coalesced": 7, "in_flight": 0}
+
+
+def test_exception_fans_out_to_waiters():
+    group = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    def run():
+        try:
+            group.do("k", failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=run)
+    leader.start()
+    started.wait(5)
+    waiter = threading.Thread(target=run)
+    waiter.start()
+    while group.coalesced < 1:
+        time.sleep(0.001)
+    release.set()
+    leader.join()
+    waiter.join()
+    assert len(errors) == 2
+    # The next call runs again instead of reusing the failure
+    assert group.do("k", lambda: "ok") == ("ok", False)
+
+
+@pytest.mark.asyncio
+async def test_async_calls_share_one_call():
+    group = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    results = await asyncio.gather(*(group.do_async("k", slow) for _ in range(5)))
+    assert len(calls) == 1
+    assert [shared for _, shared in results].count(False) == 1
+
+
+@pytest.mark.asyncio
+async def test_async_exception_and_cancelled_waiter():
+    group = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    leader = asyncio.create_task(group.do_async("k", failing))
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(group.do_async("k", failing))
+    waiter = asyncio.create_task(group.do_async("k", failing))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    with pytest.raises(RuntimeError):
+        await leader
+    with pytest.raises(RuntimeError):
+        await waiter
+    assert cancelled.cancelled()
+
+
+def test_wrapper_logs_usage_once_for_coalesced_burst(make_openai_wrapper, openai_response):
+    wrapper = make_openai_wrapper(coalesce=True)
+    wrapper._single_flight = SingleFlight()
+    release = threading.Event()
+
+    def api_call(messages, **kwargs):
+        release.wait(5)
+        return openai_response()
+
+    results = []
+    with patch.object(wrapper, '_make_api_call', side_effect=api_call) as mocked:
+        threads = [threading.Thread(target=lambda: results.append(wrapper.chat_completion(MESSAGES))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        while wrapper._single_flight.coalesced < 4:
+            time.sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+    assert mocked.call_count == 1
+    assert len({id(r) for r in results}) == 5
+    logs = [call.kwargs for call in wrapper._logger.log_call.call_args_list]
+    assert [log["status"] for log in logs].count("success") == 1
+    assert [log["status"] for log in logs].count("coalesced") == 4
+    assert sum(log["prompt_tokens"] for log in logs) == 10
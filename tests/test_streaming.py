@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from apilens import AnthropicWrapper
+from apilens.streaming import StreamAccumulator
+from apilens.types import RateLimitError
+
+MESSAGES = [{"role": "user", "content": "Tell me a story"}]
+
+
+def _openai_chunk(content=None, usage=None):
+    choices = [] if content is None else [Mock(delta=Mock(content=content))]
+    return Mock(choices=choices, usage=usage)
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_logs_one_row_with_final_usage(openai_wrapper):
+    chunks = [_openai_chunk(word) for word in ["Once ", "upon ", "a ", "time"]]
+    chunks.append(_openai_chunk(usage=Mock(prompt_tokens=12, completion_tokens=4)))
+    with patch.object(openai_wrapper, '_make_api_call', return_value=FakeStream(chunks)) as call:
+        *deltas, final = openai_wrapper.chat_completion_stream(MESSAGES)
+
+    assert call.call_args.kwargs["stream"] is True
+    assert call.call_args.kwargs["stream_options"] == {"include_usage": True}
+    assert "".join(d["choices"][0]["delta"]["content"] for d in deltas) == "Once upon a time"
+    assert final["choices"][0]["message"]["content"] == "Once upon a time"
+    assert final["usage"] == {"prompt_tokens": 12, "completion_tokens": 4}
+    assert final["cost"] == pytest.approx(12 / 1000 * 0.0015 + 4 / 1000 * 0.002)
+    assert final["stream"]["ttft"] >= 0
+    assert final["stream"]["tokens_per_second"] > 0
+    openai_wrapper._logger.log_call.assert_called_once()
+    log = openai_wrapper._logger.log_call.call_args.kwargs
+    assert (log["status"], log["prompt_tokens"], log["completion_tokens"]) == ("success", 12, 4)
+
+
+def test_cancelled_stream_logs_partial_usage_and_closes(openai_wrapper):
+    stream = FakeStream([_openai_chunk("x" * 40) for _ in range(10)])
+    with patch.object(openai_wrapper, '_make_api_call', return_value=stream):
+        generator = openai_wrapper.chat_completion_stream(MESSAGES)
+        next(generator)
+        next(generator)
+        generator.close()
+
+    assert stream.closed
+    log = openai_wrapper._logger.log_call.call_args.kwargs
+    assert log["status"] == "cancelled"
+    assert log["completion_tokens"] == 20
+    assert log["prompt_tokens"] > 0
+    assert log["cost"] > 0
+
+
+def test_connection_step_is_retried(openai_wrapper):
+    stream = FakeStream([_openai_chunk("ok")])
+    with patch.object(openai_wrapper, '_make_api_call', side_effect=[RateLimitError("slow down"), stream]) as call:
+        chunks = list(openai_wrapper.chat_completion_stream(MESSAGES))
+    assert call.call_count == 2
+    assert chunks[-1]["choices"][0]["message"]["content"] == "ok"
+
+
+def test_failure_before_first_token_logs_no_usage(openai_wrapper):
+    with patch.object(openai_wrapper, '_make_api_call', side_effect=ValueError("boom")):
+        with pytest.raises(ValueError):
+            list(openai_wrapper.chat_completion_stream(MESSAGES))
+    log = openai_wrapper._logger.log_call.call_args.kwargs
+    assert (log["status"], log["prompt_tokens"], log["cost"], log["error_message"]) == ("failed", 0, 0.0, "boom")
+
+
+def test_anthropic_stream_reads_usage_from_events():
+    with patch('apilens.anthropic_wrapper.ANTHROPIC_API_KEY', 'fake-key'):
+        wrapper = AnthropicWrapper(model="claude-3-opus-20240229")
+    wrapper._logger = Mock()
+    events = [
+        SimpleNamespace(type="message_start", message=SimpleNamespace(usage=SimpleNamespace(input_tokens=25, output_tokens=1))),
+        SimpleNamespace(type="content_block_start"),
+        SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(type="text_delta", text="Hi")),
+        SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(type="text_delta", text=" there")),
+        SimpleNamespace(type="message_delta", usage=SimpleNamespace(output_tokens=7)),
+        SimpleNamespace(type="message_stop"),
+    ]
+    wrapper.client = Mock()
+    wrapper.client.messages.create.return_value = FakeStream(events)
+    *deltas, final = wrapper.chat_completion_stream(
+        [{"role": "system", "content": "Be nice"}] + MESSAGES, max_tokens=50
+    )
+    params = wrapper.client.messages.create.call_args.kwargs
+    assert params["stream"] is True and params["system"] == "Be nice"
+    assert [d["choices"][0]["delta"]["content"] for d in deltas] == ["Hi", " there"]
+    assert final["usage"] == {"prompt_tokens": 25, "completion_tokens": 7}
+    assert wrapper._logger.log_call.call_args.kwargs["completion_tokens"] == 7
+
+
+def test_accumulator_timings():
+    now = [100.0]
+    accumulator = StreamAccumulator(clock=lambda: now[0])
+    now[0] = 100.5
+    accumulator.add("Hello")
+    now[0] = 102.5
+    accumulator.add(" world")
+    accumulator.update_usage(completion_tokens=40)
+    accumulator.finish()
+    assert accumulator.text == "Hello world"
+    assert accumulator.metrics() == {"ttft": 0.5, "duration": 2.5, "tokens_per_second": 20.0}
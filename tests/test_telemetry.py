@@ -0,0 +1,102 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from apilens.schema import API_LOGS_TELEMETRY_COLUMNS, ensure_api_logs_telemetry
+from apilens.streaming import open_stream
+from apilens.telemetry import TELEMETRY_FIELDS, CallTelemetry, payload_bytes
+from apilens.types import RateLimitError
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+def test_call_telemetry_splits_backoff_from_provider_time(clock):
+    telemetry = CallTelemetry(clock=clock)
+    clock.now = 0.010
+    telemetry.start_provider()
+    telemetry.record_backoff(0.5)
+    clock.now = 0.810
+    telemetry.end_provider()
+    telemetry.record_request_id(None)
+    clock.now = 0.815
+    telemetry.finish()
+
+    fields = telemetry.as_log_fields()
+    assert tuple(fields) == TELEMETRY_FIELDS
+    assert fields["latency_ms"] == 815.0
+    assert fields["provider_latency_ms"] == 300.0
+    assert fields["retry_count"] == 1
+    assert fields["backoff_ms"] == 500.0
+    assert fields["ttft_ms"] is None
+    assert len(fields["request_id"]) == 32
+
+
+def test_payload_bytes_counts_utf8():
+    assert payload_bytes({"a": "é"}) == len('{"a":"é"}'.encode("utf-8"))
+
+
+def test_chat_completion_logs_telemetry(openai_wrapper, openai_response):
+    with patch.object(openai_wrapper, '_make_api_call', return_value=openai_response(request_id="req_123")):
+        openai_wrapper.chat_completion(MESSAGES)
+
+    record = openai_wrapper._logger.log_call.call_args.kwargs
+    assert record["status"] == "success"
+    assert record["request_id"] == "req_123"
+    assert record["retry_count"] == 0
+    assert record["latency_ms"] >= record["provider_latency_ms"] >= 0
+    assert record["request_bytes"] == payload_bytes({"model": "gpt-3.5-turbo", "messages": MESSAGES})
+    assert record["response_bytes"] > 0
+    assert record["ttft_ms"] is None
+
+
+def test_retries_and_backoff_are_recorded(openai_wrapper, openai_response):
+    calls = [RateLimitError("slow down"), RateLimitError("slow down"), openai_response()]
+    with patch.object(openai_wrapper, '_make_api_call', side_effect=calls), patch('time.sleep') as sleep:
+        openai_wrapper.chat_completion(MESSAGES)
+
+    assert sleep.call_count == 2
+    record = openai_wrapper._logger.log_call.call_args.kwargs
+    assert record["retry_count"] == 2
+    assert record["backoff_ms"] == pytest.approx(sum(c.args[0] for c in sleep.call_args_list) * 1000)
+
+
+def test_failed_call_still_logs_telemetry(openai_wrapper):
+    with patch.object(openai_wrapper, '_make_api_call', side_effect=ValueError("boom")):
+        with pytest.raises(Exception):
+            openai_wrapper.chat_completion(MESSAGES)
+
+    record = openai_wrapper._logger.log_call.call_args.kwargs
+    assert record["status"] == "failed"
+    assert record["latency_ms"] >= 0
+    assert record["response_bytes"] is None
+
+
+def test_stream_records_ttft(openai_wrapper):
+    chunks = [Mock(choices=[Mock(delta=Mock(content="Hi"))], usage=None),
+              Mock(choices=[], usage=Mock(prompt_tokens=3, completion_tokens=1))]
+    with patch.object(openai_wrapper, '_make_api_call', return_value=iter(chunks)):
+        list(openai_wrapper.chat_completion_stream(MESSAGES))
+
+    record = openai_wrapper._logger.log_call.call_args.kwargs
+    assert record["ttft_ms"] is not None
+    assert record["latency_ms"] >= record["ttft_ms"]
+    assert record["response_bytes"] == 2
+
+
+def test_open_stream_records_backoff():
+    telemetry = CallTelemetry()
+    opener = Mock(side_effect=[KeyError("busy"), "stream"])
+    with patch('time.sleep'):
+        assert open_stream(opener, retry_on=(KeyError,), backoff_base=2.0, telemetry=telemetry) == "stream"
+    assert telemetry.retries == 1
+    assert telemetry.backoff_seconds == 1.0
+
+
+def test_migration_adds_telemetry_columns_and_indexes():
+    cur = Mock()
+    ensure_api_logs_telemetry(cur)
+    statements = [c.args[0] for c in cur.execute.call_args_list]
+    for column in API_LOGS_TELEMETRY_COLUMNS:
+        assert f"ADD COLUMN IF NOT EXISTS {column} " in statements[0]
+    assert any("(model, latency_ms DESC NULLS LAST)" in s for s in statements)
+    assert any("(tenant_id, latency_ms DESC NULLS LAST)" in s for s in statements)
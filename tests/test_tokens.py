@@ -0,0 +1,157 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from apilens import tokens
+from apilens.rate_limiter import estimate_tokens
+from apilens.tokens import TokenCounter, benchmark, get_counter, model_family, usage_from_metadata
+
+
+def _conversation(turns):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " * 20} for i in range(turns)]
+
+
+def test_model_families():
+    assert model_family("gpt-4-turbo") == "openai"
+    assert model_family("o3-mini") == "openai"
+    assert model_family("claude-3-haiku-20240307") == "anthropic"
+    assert model_family("gemini-pro") == "gemini"
+    assert model_family("mistral-large") == model_family(None) == "default"
+
+
+def test_estimator_counts_characters_per_token():
+    counter = TokenCounter("gemini-pro")
+    assert not counter.exact
+    assert counter.count_text("x" * 40) == 10
+    assert counter.count_text("") == 0
+    # Non-ASCII text is weighted by its UTF-8 length
+    assert counter.count_text("日本語のテキスト") > counter.count_text("abcdefgh")
+    messages = [{"role": "user", "content": "x" * 40}]
+    assert counter.count_messages(messages) == 10 + 1 + tokens.TOKENS_PER_MESSAGE + tokens.REPLY_PRIMING_TOKENS
+    assert estimate_tokens(messages, 100, "gemini-pro") == counter.count_messages(messages) + 100
+
+
+def test_multimodal_content_counts_text_parts():
+    counter = TokenCounter("gpt-4", tokenizer=len)
+    parts = [{"type": "text", "text": "abcd"}, {"type": "image_url", "image_url": {"url": "data:"}}]
+    assert counter.count_messages([{"role": "user", "content": parts}]) == \
+        counter.count_messages([{"role": "user", "content": "abcd"}])
+
+
+def test_growing_conversation_only_tokenizes_new_messages():
+    tokenizer = Mock(side_effect=len)
+    counter = TokenCounter("gpt-4", tokenizer=tokenizer)
+    conversation = _conversation(50)
+    first = counter.count_messages(conversation[:49])
+    tokenizer.reset_mock()
+
+    total = counter.count_messages(conversation)
+    # Content and role of the one new message
+    assert tokenizer.call_count == 2
+    assert total > first
+    assert counter.count_messages(conversation) == total
+    assert TokenCounter("gpt-4", tokenizer=len, cache_size=0).count_messages(conversation) == total
+    assert counter.stats()["hits"] >= 2
+
+
+def test_edited_history_is_recounted():
+    counter = TokenCounter("gpt-4", tokenizer=len)
+    conversation = _conversation(4)
+    before = counter.count_messages(conversation)
+    edited = [dict(conversation[0], content="short")] + conversation[1:]
+    assert counter.count_messages(edited) < before
+
+
+def test_prefix_cache_is_bounded():
+    counter = TokenCounter("gpt-4", tokenizer=len, cache_size=8)
+    counter.count_messages(_conversation(20))
+    assert counter.stats()["cached_prefixes"] == 8
+
+
+def test_calibration_moves_towards_reported_counts():
+    counter = TokenCounter("claude-3-haiku-20240307")
+    messages = [{"role": "user", "content": "x" * 400}]
+    start = counter.chars_per_token
+    for _ in range(50):
+        # The provider says 404 characters (content and role) came to 101 tokens
+        counter.calibrate(messages, 101 + tokens.TOKENS_PER_MESSAGE + tokens.REPLY_PRIMING_TOKENS)
+    assert start < counter.chars_per_token == pytest.approx(4.0, abs=0.05)
+
+    counter.calibrate(messages, 10 ** 6)
+    assert counter.chars_per_token >= tokens.MIN_CHARS_PER_TOKEN
+
+    exact = TokenCounter("gpt-4", tokenizer=len)
+    exact.calibrate(messages, 1)
+    assert exact.chars_per_token == tokens.CHARS_PER_TOKEN["openai"]
+
+
+def test_concurrent_calibration_keeps_every_update():
+    switch_interval = sys.getswitchinterval()
+    # Switch threads as often as possible so that unlocked updates would interleave
+    sys.setswitchinterval(1e-6)
+    counter = TokenCounter("claude-3-haiku-20240307")
+    messages = [{"role": "user", "content": "x" * 400}]
+    start = counter.chars_per_token
+    reported = 101 + tokens.TOKENS_PER_MESSAGE + tokens.REPLY_PRIMING_TOKENS
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: counter.calibrate(messages, reported), range(40)))
+    finally:
+        sys.setswitchinterval(switch_interval)
+    expected = 4.0 + (start - 4.0) * (1 - tokens.CALIBRATION_RATE) ** 40
+    assert counter.chars_per_token == pytest.approx(expected)
+
+
+def test_openai_family_uses_offline_tokenizer_when_available(monkeypatch):
+    monkeypatch.setitem(tokens.TOKENIZERS, "openai", lambda model: lambda text: len(text.split()))
+    counter = TokenCounter("gpt-4")
+    assert counter.exact
+    assert counter.count_text("three word text") == 3
+
+
+def test_usage_from_metadata():
+    assert usage_from_metadata(None) is None
+    assert usage_from_metadata(SimpleNamespace(prompt_token_count=0, candidates_token_count=0)) is None
+    metadata = SimpleNamespace(prompt_token_count=12, candidates_token_count=None)
+    assert usage_from_metadata(metadata) == {"prompt_tokens": 12, "completion_tokens": None}
+
+
+@pytest.fixture
+def gemini_wrapper():
+    from apilens.gemini_wrapper import GeminiWrapper
+    with patch('apilens.gemini_wrapper.GEMINI_API_KEY', 'fake-key'), patch('apilens.gemini_wrapper.genai'):
+        wrapper = GeminiWrapper(model="gemini-pro")
+    wrapper._logger = Mock()
+    return wrapper
+
+
+def _gemini_response(text, usage_metadata=None):
+    part = SimpleNamespace(text=text)
+    candidate = SimpleNamespace(content=SimpleNamespace(parts=[part]))
+    return SimpleNamespace(candidates=[candidate], usage_metadata=usage_metadata)
+
+
+def test_gemini_reports_usage_metadata(gemini_wrapper):
+    metadata = SimpleNamespace(prompt_token_count=21, candidates_token_count=9)
+    with patch.object(gemini_wrapper, '_make_api_call', return_value=_gemini_response("Hi there", metadata)):
+        response = gemini_wrapper.chat_completion([{"role": "user", "content": "Hello"}])
+    assert response["usage"] == {"prompt_tokens": 21, "completion_tokens": 9}
+    assert response["cost"] == pytest.approx(21 / 1000 * 0.00025 + 9 / 1000 * 0.0005)
+
+
+def test_gemini_counts_tokens_without_usage_metadata(gemini_wrapper):
+    messages = [{"role": "system", "content": "Be brief"}, {"role": "user", "content": "Hello " * 40}]
+    with patch.object(gemini_wrapper, '_make_api_call', return_value=_gemini_response("x" * 80)):
+        response = gemini_wrapper.chat_completion(messages)
+    assert response["usage"] == {"prompt_tokens": get_counter("gemini-pro").count_messages(messages),
+                                 "completion_tokens": 20}
+    assert response["usage"]["prompt_tokens"] > 60
+
+
+def test_benchmark_reports_memoized_speedup():
+    results = benchmark("gemini-pro", turns=60)
+    assert results["exact"] == 0.0
+    assert results["memoized_tokens_per_second"] > results["uncached_tokens_per_second"] > 0
@@ -0,0 +1,151 @@
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from apilens import tracing
+from apilens.tracing import Profiler, TraceHook, add_hook, clear_hooks, span
+from apilens.types import RateLimitError
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+class RecordingHook(TraceHook):
+    def __init__(self):
+        self.started = []
+        self.ended = []
+
+    def on_start(self, span):
+        self.started.append(span.phase)
+
+    def on_end(self, span):
+        self.ended.append(span)
+
+
+@pytest.fixture(autouse=True)
+def no_hooks():
+    clear_hooks()
+    yield
+    clear_hooks()
+
+
+def test_span_is_a_shared_noop_without_hooks():
+    assert span("validation") is span("log_call", None, status="success")
+    with span("validation") as s:
+        s.set(anything=1)
+
+
+def test_phases_and_attributes_of_a_call(openai_wrapper, openai_response):
+    hook = add_hook(RecordingHook())
+    with patch.object(openai_wrapper, '_make_api_call', return_value=openai_response()):
+        openai_wrapper.chat_completion(MESSAGES)
+
+    assert hook.started == ["chat_completion", "validation", "retry", "provider_call", "extract_usage",
+                            "calculate_cost", "format_response", "log_call"]
+    spans = {s.phase: s for s in hook.ended}
+    assert spans["provider_call"].attributes == {"provider": "openai", "model": "gpt-3.5-turbo", "attempt": 1}
+    assert spans["extract_usage"].attributes["prompt_tokens"] == 10
+    assert spans["calculate_cost"].attributes["cost"] > 0
+    assert spans["log_call"].attributes["status"] == "success"
+    assert spans["provider_call"].parent is spans["retry"]
+    assert spans["retry"].parent is spans["chat_completion"]
+    assert spans["chat_completion"].parent is None
+    assert all(s.duration >= 0 for s in hook.ended)
+    assert tracing.current_span() is None
+
+
+def test_retries_open_one_span_per_attempt(openai_wrapper, openai_response):
+    hook = add_hook(RecordingHook())
+    calls = [RateLimitError("slow down"), openai_response()]
+    with patch.object(openai_wrapper, '_make_api_call', side_effect=calls), patch('time.sleep'):
+        openai_wrapper.chat_completion(MESSAGES)
+
+    attempts = [s for s in hook.ended if s.phase == "provider_call"]
+    assert [s.attributes["attempt"] for s in attempts] == [1, 2]
+    assert isinstance(attempts[0].error, RateLimitError)
+    assert attempts[1].error is None
+    assert [s.attributes["seconds"] for s in hook.ended if s.phase == "backoff"] == [1]
+    retry = next(s for s in hook.ended if s.phase == "retry")
+    assert retry.attributes["attempts"] == 2
+
+
+def test_failing_hook_does_not_break_calls(openai_wrapper, openai_response):
+    class Broken(TraceHook):
+        def on_start(self, span):
+            raise RuntimeError("hook bug")
+
+    add_hook(Broken())
+    with patch.object(openai_wrapper, '_make_api_call', return_value=openai_response()):
+        assert openai_wrapper.chat_completion(MESSAGES)["choices"][0]["message"]["content"] == "Hello!"
+
+
+@pytest.mark.asyncio
+async def test_async_calls_are_traced(openai_wrapper, openai_response):
+    hook = add_hook(RecordingHook())
+    openai_wrapper._logger.non_blocking = True
+
+    async def call(*args, **kwargs):
+        return openai_response()
+
+    with patch.object(openai_wrapper, '_make_async_api_call', side_effect=call):
+        await openai_wrapper.async_chat_completion(MESSAGES)
+
+    root = next(s for s in hook.ended if s.phase == "chat_completion")
+    assert root.attributes["mode"] == "async"
+    provider_call = next(s for s in hook.ended if s.phase == "provider_call")
+    assert provider_call.parent.parent is root
+
+
+def test_profiler_splits_provider_time_from_apilens_time(openai_wrapper, openai_response):
+    def slow_call(*args, **kwargs):
+        time.sleep(0.02)
+        return openai_response()
+
+    with Profiler() as profiler:
+        with patch.object(openai_wrapper, '_make_api_call', side_effect=slow_call):
+            for _ in range(3):
+                openai_wrapper.chat_completion(MESSAGES)
+    assert tracing.get_hooks() == ()
+
+    stats = profiler.stats()
+    assert stats["chat_completion"]["count"] == 3
+    assert stats["provider_call"]["total"] >= 0.06
+    breakdown = profiler.breakdown()
+    assert breakdown["calls"] == 3
+    assert breakdown["provider"] + breakdown["apilens"] == pytest.approx(breakdown["total"])
+    assert 0 <= breakdown["apilens_share"] < 0.5
+    report = profiler.report()
+    assert "provider_call" in report and "apilens" in report
+
+
+def test_each_batch_item_gets_a_root_span(openai_wrapper, openai_response):
+    hook = add_hook(RecordingHook())
+    with Profiler() as profiler:
+        with patch.object(openai_wrapper, '_make_api_call', return_value=openai_response()):
+            openai_wrapper.batch_chat_completion([MESSAGES, MESSAGES], concurrency=2)
+
+    roots = [s for s in hook.ended if s.phase == "chat_completion"]
+    assert [root.attributes["mode"] for root in roots] == ["batch", "batch"]
+    assert all(s.parent in roots for s in hook.ended if s.phase == "validation")
+    assert profiler.breakdown()["calls"] == 2
+
+
+def test_stream_reading_counts_as_provider_time(openai_wrapper):
+    def slow_chunks():
+        for word in ["Once ", "upon ", "a ", "time"]:
+            time.sleep(0.01)
+            yield Mock(choices=[Mock(delta=Mock(content=word))], usage=None)
+
+    hook = add_hook(RecordingHook())
+    with Profiler() as profiler:
+        with patch.object(openai_wrapper, '_make_api_call', return_value=slow_chunks()):
+            *_, final = openai_wrapper.chat_completion_stream(MESSAGES)
+    assert final["choices"][0]["message"]["content"] == "Once upon a time"
+
+    root = next(s for s in hook.ended if s.phase == "chat_completion")
+    assert root.attributes["mode"] == "stream"
+    assert next(s for s in hook.ended if s.phase == "stream").parent is root
+    breakdown = profiler.breakdown()
+    assert breakdown["calls"] == 1
+    assert breakdown["provider"] >= 0.04
+    assert 0 <= breakdown["apilens_share"] < 0.5